@@ -123,6 +123,7 @@ class compile_build(cs_compile):
         """
         cs_compile.__init__(self, package)
         self.srcdir = srcdir
+        self.obj_cache = False
 
         top_builddir = os.getcwd()
         while not os.path.isfile(os.path.join(top_builddir, "cs_config.h")):
@@ -216,6 +217,7 @@ class compile_install(cs_compile):
         """
         cs_compile.__init__(self, package)
         self.srcdir = srcdir
+        self.obj_cache = False
 
         self.destdir = destdir
 
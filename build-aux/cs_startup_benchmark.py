@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of code_saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2024 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+import sys
+import argparse
+import subprocess
+import time
+
+#-------------------------------------------------------------------------------
+
+# Measure the startup time of the main code_saturne script for commands
+# which do little work, so that import and launch costs may be tracked
+# and kept under a given budget, for example:
+#
+#   python3 cs_startup_benchmark.py --budget 100 $prefix/bin/code_saturne
+#
+# The Python interpreter startup time is also measured as a reference.
+
+# Default commands measured
+
+default_commands = ['info --help', 'config --help', 'run --help',
+                    'compile --help', 'studymanager --help']
+
+#===============================================================================
+# Utility functions
+#===============================================================================
+
+#-------------------------------------------------------------------------------
+# Process the command line arguments
+#-------------------------------------------------------------------------------
+
+def parse_cmd_line(argv):
+    """
+    Process the passed command line arguments.
+    """
+
+    description = "Measure startup time of the code_saturne main script."
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument("script", type=str, metavar="<script>",
+                        help="path to the code_saturne main script")
+
+    parser.add_argument("-c", "--command", dest="commands", type=str,
+                        action="append", metavar="<command>",
+                        help="command to measure (may be repeated); "
+                        + "default: " + ", ".join(default_commands))
+
+    parser.add_argument("-n", "--repeat", dest="n_repeat", type=int,
+                        default=10, metavar="<n>",
+                        help="number of runs per command (default: 10)")
+
+    parser.add_argument("--budget", dest="budget", type=float, default=None,
+                        metavar="<ms>",
+                        help="maximum median time per command (in ms); "
+                        + "return an error code if exceeded")
+
+    parser.add_argument("--importtime", dest="importtime", type=int,
+                        default=0, metavar="<n>",
+                        help="show the <n> most costly imports per command")
+
+    return parser.parse_args(argv)
+
+#-------------------------------------------------------------------------------
+
+def time_command(cmd, n_repeat):
+    """
+    Return the minimum and median elapsed time (in ms) of a command.
+    """
+
+    times = []
+    for i in range(n_repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - t0) * 1000.)
+    times.sort()
+
+    return times[0], times[len(times)//2]
+
+#-------------------------------------------------------------------------------
+
+def import_times(cmd, n_max):
+    """
+    Return the n_max most costly imports (cumulative time in ms, module)
+    of a Python command.
+    """
+
+    p = subprocess.run([sys.executable, '-X', 'importtime'] + cmd[1:],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       universal_newlines=True)
+
+    imports = []
+    for l in p.stderr.splitlines():
+        w = l.split('|')
+        if len(w) != 3 or not w[0].startswith('import time:'):
+            continue
+        try:
+            imports.append((int(w[1]) / 1000., w[2].strip()))
+        except ValueError:
+            pass
+    imports.sort(reverse=True)
+
+    return imports[:n_max]
+
+#-------------------------------------------------------------------------------
+
+def main(argv):
+    """
+    Main function.
+    """
+
+    options = parse_cmd_line(argv)
+
+    commands = options.commands
+    if not commands:
+        commands = default_commands
+
+    n_repeat = max(1, options.n_repeat)
+
+    t_min, t_med = time_command([sys.executable, '-c', 'pass'], n_repeat)
+    print("%-32s min %8.1f ms, median %8.1f ms"
+          % ("(python interpreter)", t_min, t_med))
+
+    retval = 0
+
+    for c in commands:
+        cmd = [sys.executable, options.script] + c.split()
+        t_min, t_med = time_command(cmd, n_repeat)
+        status = ''
+        if options.budget and t_med > options.budget:
+            status = ' (over budget)'
+            retval = 1
+        print("%-32s min %8.1f ms, median %8.1f ms%s"
+              % (c, t_min, t_med, status))
+
+        if options.importtime > 0:
+            for t, m in import_times(cmd, options.importtime):
+                print("    %8.1f ms  %s" % (t, m))
+
+    return retval
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    retval = main(sys.argv[1:])
+    sys.exit(retval)
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -123,6 +123,11 @@ def define_domain_parameters(domain):
 
     # domain.meshes = None
 
+    # Number of meshes preprocessed concurrently (None for all available
+    # processors, within available memory).
+
+    # domain.preprocess_jobs = None
+
     # Logging arguments
     #------------------
 
@@ -167,6 +172,11 @@ def define_domain_parameters(domain):
     domain.compile_fcflags = None
     domain.compile_libs = None
 
+    # Number of files compiled concurrently (None for all available
+    # processors).
+
+    domain.compile_jobs = None
+
     # print(domain)
 
     return
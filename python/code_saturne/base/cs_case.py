@@ -25,6 +25,7 @@
 
 import configparser
 import datetime, time
+import json
 import os
 import os.path
 import platform
@@ -204,93 +205,63 @@ def get_case_dir(case=None, param=None, coupling=None, id=None):
 
 #-------------------------------------------------------------------------------
 
-def get_case_state(run_dir, coupling=False, run_timeout=3600):
+run_state_file_name = 'run_state.json'
 
-    """
-    Check if a run has completed successfully.
-    Returns a code (of case_state enumeration type)
-    and a dictionary with additional information.
+# Map from run_status.* stamp names to case states
 
-    As the required data is not stored in a single datebase or file, this is
-    based upon checking the existence and partial parsing of various
-    log files (error*, run_status*, preprocesso*.log, performance.log).
-    If the formatting of these files is modified, less precise information
-    might be returned.
+run_status_states = {'preparing': case_state.STAGING,
+                     'prepared': case_state.STAGED,
+                     'preprocessing': case_state.RUNNING,
+                     'ready': case_state.PREPROCESSED,
+                     'running': case_state.RUNNING,
+                     'finished': case_state.COMPUTED,
+                     'saving': case_state.FINALIZING,
+                     'failed': case_state.FAILED,
+                     'exceeded_time_limit': case_state.EXCEEDED_TIME_LIMIT}
 
-    Also, to account for computation which migh be indicated as running but
-    may have been killed by the system or resource manager, a timout
-    value (default 3600 seconds) may be used to compare the run_status.running
-    file's last timestamp and the current timestap.
+#-------------------------------------------------------------------------------
 
-    Caveats: In case of coupled computations, the number of OpenMP threads
-    is not reported, and the number of reported MPI ranks only includes the
-    sum of those assigned to code_saturne-based solvers, not other solvers.
+def read_run_state(run_dir):
+    """
+    Read the run state record of a run directory.
+    Returns a dictionary, or None if not present or not readable.
     """
 
-    # Initialize status
-
-    state = case_state.UNKNOWN
+    try:
+        with open(os.path.join(run_dir, run_state_file_name)) as f:
+            return json.load(f)
+    except Exception:
+        return None
 
-    info = {'message': "",
-            'compute_time': None,
-            'compute_time_usage': None,
-            'compute_mem': None,
-            'preprocess_time': None,
-            'preprocess_mem': None,
-            'mpi_ranks': None,
-            'omp_threads': None}
-
-    # For special case with coupled domains, loop on domains,
-    # and return highest state values
+#-------------------------------------------------------------------------------
 
-    if coupling:
-        run_config_path = os.path.join(run_dir, 'run.cfg')
-        coupled_domains = None
-        if os.path.isfile(run_config_path):
-            run_conf = cs_run_conf.run_conf(run_config_path)
-            coupled_domains = run_conf.get_coupling_parameters()
-        if coupled_domains:
-            for d in coupled_domains:
-                rc, ic = get_case_state(os.path.join(run_dir, d['domain']))
-                if rc != case_state.UNKNOWN:
-                    state = rc
-                if not info['message']:
-                    info['message'] = ic['message']
-                for k in ('compute_time', 'compute_mem', 'preprocess_mem'):
-                    if ic[k] != None:
-                        if info[k] != None:
-                            info[k] = max(info[k], ic[k])
-                        else:
-                            info[k] = ic[k]
-                for k in ('compute_time_usage', 'preprocess_time',
-                          'preprocess_mem', 'mpi_ranks'):
-                    if ic[k] != None:
-                        if info[k] != None:
-                            info[k] += ic[k]
-                        else:
-                            info[k] = ic[k]
+def write_run_state(run_dir, record):
+    """
+    Write the run state record of a run directory.
+    The file is replaced atomically so that concurrent readers never
+    see a partially written record.
+    """
 
-            return state, info
+    path = os.path.join(run_dir, run_state_file_name)
+    tmp_path = path + '.' + str(os.getpid())
 
-    # General case: try to analyze run directory
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, indent=1)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
 
-    states = [('finished', case_state.COMPUTED),
-              ('saving', case_state.FINALIZING),
-              ('running', case_state.RUNNING),
-              ('preparing', case_state.STAGING),
-              ('prepared', case_state.STAGED),
-              ('preprocessing', case_state.RUNNING),
-              ('ready', case_state.PREPROCESSED),
-              ('failed', case_state.FAILED),
-              ('exceeded_time_limit', case_state.EXCEEDED_TIME_LIMIT)]
+#-------------------------------------------------------------------------------
 
-    for s in states:
-        if os.path.isfile(os.path.join(run_dir, 'run_status.' + s[0])):
-            state = s[1]
-            info['message'] = state.name
-            break
+def get_run_log_info(run_dir, info):
+    """
+    Update timing, memory and parallelism information in a case info
+    dictionary based on preprocessor and performance logs of a run
+    directory.
+    """
 
-    # Now try to check preprocessing time and memory use.
+    # Preprocessing time and memory use.
 
     i = 0
     p_time = 0.
@@ -332,12 +303,7 @@ def get_case_state(run_dir, coupling=False, run_timeout=3600):
 
         i += 1
 
-    # Check for presence of error file(s)
-
-    if os.path.isfile(os.path.join(run_dir, 'error')):
-        state = case_state.FAILED
-
-    # Now try to check elapsed time.
+    # Elapsed time, memory, and parallelism.
 
     p_log = os.path.join(run_dir, 'performance.log')
 
@@ -383,6 +349,175 @@ def get_case_state(run_dir, coupling=False, run_timeout=3600):
             pass
         f.close
 
+        return True
+
+    return False
+
+#-------------------------------------------------------------------------------
+
+def merge_coupled_info(info, ic):
+    """
+    Merge case info of a coupled domain into global case info.
+    """
+
+    if not info['message']:
+        info['message'] = ic['message']
+    for k in ('compute_time', 'compute_mem', 'preprocess_mem'):
+        if ic[k] != None:
+            if info[k] != None:
+                info[k] = max(info[k], ic[k])
+            else:
+                info[k] = ic[k]
+    for k in ('compute_time_usage', 'preprocess_time',
+              'preprocess_mem', 'mpi_ranks'):
+        if ic[k] != None:
+            if info[k] != None:
+                info[k] += ic[k]
+            else:
+                info[k] = ic[k]
+
+#-------------------------------------------------------------------------------
+
+def get_empty_case_info():
+    """
+    Return case info dictionary with default values.
+    """
+
+    return {'message': "",
+            'compute_time': None,
+            'compute_time_usage': None,
+            'compute_mem': None,
+            'preprocess_time': None,
+            'preprocess_mem': None,
+            'mpi_ranks': None,
+            'omp_threads': None}
+
+#-------------------------------------------------------------------------------
+
+def get_case_state_from_record(record, run_dir=None, run_timeout=3600):
+    """
+    Return case state and info from a run state record.
+    """
+
+    info = get_empty_case_info()
+    for k in info:
+        if k in record:
+            info[k] = record[k]
+
+    try:
+        state = case_state[record['state']]
+    except Exception:
+        state = case_state.UNKNOWN
+
+    # As with run_status.* stamps, no message for finalized runs
+
+    if not info['message'] and state != case_state.FINALIZED:
+        info['message'] = state.name
+
+    # If computation seems to be running, check that it has been updated
+    # recently enough (the run may have been killed). The record is only
+    # updated at stage transitions, so use the 'run_status.running' file
+    # (updated by the solver in the execution directory) when present.
+
+    if state == case_state.RUNNING:
+        try:
+            try:
+                exec_dir = check_exec_dir_stamp(run_dir)
+                m_time = os.path.getmtime(os.path.join(exec_dir,
+                                                       'run_status.running'))
+            except Exception:
+                m_time = record['update_time']
+            if time.time() - m_time > run_timeout:
+                state = case_state.FAILED
+                info['message'] = 'Seems to have been killed or not progressing anymore'
+        except Exception:
+            pass
+
+    return state, info
+
+#-------------------------------------------------------------------------------
+
+def get_case_state(run_dir, coupling=False, run_timeout=3600):
+
+    """
+    Check if a run has completed successfully.
+    Returns a code (of case_state enumeration type)
+    and a dictionary with additional information.
+
+    This information is read from the run state record maintained by the
+    run driver (run_state.json) when present. For runs not providing such a
+    record, this is based upon checking the existence and partial parsing
+    of various log files (error*, run_status*, preprocesso*.log,
+    performance.log). If the formatting of these files is modified, less
+    precise information might be returned.
+
+    Also, to account for computation which migh be indicated as running but
+    may have been killed by the system or resource manager, a timout
+    value (default 3600 seconds) may be used to compare the last update
+    time of the running state and the current timestap.
+
+    Caveats: In case of coupled computations, the number of OpenMP threads
+    is not reported, and the number of reported MPI ranks only includes the
+    sum of those assigned to code_saturne-based solvers, not other solvers.
+    """
+
+    record = read_run_state(run_dir)
+    if record:
+        return get_case_state_from_record(record, run_dir, run_timeout)
+
+    # Initialize status
+
+    state = case_state.UNKNOWN
+
+    info = get_empty_case_info()
+
+    # For special case with coupled domains, loop on domains,
+    # and return highest state values
+
+    if coupling:
+        run_config_path = os.path.join(run_dir, 'run.cfg')
+        coupled_domains = None
+        if os.path.isfile(run_config_path):
+            run_conf = cs_run_conf.run_conf(run_config_path)
+            coupled_domains = run_conf.get_coupling_parameters()
+        if coupled_domains:
+            for d in coupled_domains:
+                rc, ic = get_case_state(os.path.join(run_dir, d['domain']))
+                if rc != case_state.UNKNOWN:
+                    state = rc
+                merge_coupled_info(info, ic)
+
+            return state, info
+
+    # General case: try to analyze run directory
+
+    states = [('finished', case_state.COMPUTED),
+              ('saving', case_state.FINALIZING),
+              ('running', case_state.RUNNING),
+              ('preparing', case_state.STAGING),
+              ('prepared', case_state.STAGED),
+              ('preprocessing', case_state.RUNNING),
+              ('ready', case_state.PREPROCESSED),
+              ('failed', case_state.FAILED),
+              ('exceeded_time_limit', case_state.EXCEEDED_TIME_LIMIT)]
+
+    for s in states:
+        if os.path.isfile(os.path.join(run_dir, 'run_status.' + s[0])):
+            state = s[1]
+            info['message'] = state.name
+            break
+
+    # Now try to check preprocessing and elapsed time.
+
+    has_performance_log = get_run_log_info(run_dir, info)
+
+    # Check for presence of error file(s)
+
+    if os.path.isfile(os.path.join(run_dir, 'error')):
+        state = case_state.FAILED
+
+    if has_performance_log:
+
         if state == case_state.UNKNOWN:
             if os.path.isfile(os.path.join(run_dir, 'run_status.exceeded_time_limit')):
                 state = case_state.EXCEEDED_TIME_LIMIT
@@ -415,7 +550,6 @@ def get_case_state(run_dir, coupling=False, run_timeout=3600):
         try:
             m_time = os.path.getmtime(os.path.join(run_dir, 'run_status.running'))
             c_time = time.time()
-            print(c_time - m_time)
             if c_time - m_time > run_timeout:
                 state = case_state.FAILED
                 info['message'] = 'Seems to have been killed or not progressing anymore'
@@ -424,6 +558,126 @@ def get_case_state(run_dir, coupling=False, run_timeout=3600):
 
     return state, info
 
+#===============================================================================
+# Run state index for a set of cases
+#===============================================================================
+
+class run_state_index:
+    """
+    Index of run state records for a set of run directories (usually those
+    of a study), so that state queries only require reading a single file
+    and checking the record timestamp of each run directory.
+    """
+
+    #---------------------------------------------------------------------------
+
+    def __init__(self, path):
+        """
+        Initialize index, loading it from the given path if present.
+        """
+
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.records = {}
+        self.modified = False
+
+        try:
+            with open(path) as f:
+                self.records = json.load(f)
+        except Exception:
+            pass
+
+    #---------------------------------------------------------------------------
+
+    def get_record(self, run_dir):
+        """
+        Return the up-to-date run state record of a run directory,
+        or None if no record is available.
+        """
+
+        key = os.path.relpath(os.path.abspath(run_dir), self.base_dir)
+
+        try:
+            st = os.stat(os.path.join(run_dir, run_state_file_name))
+        except Exception:
+            if key in self.records:
+                del self.records[key]
+                self.modified = True
+            return None
+
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = self.records.get(key)
+        if entry and entry['stamp'] == stamp:
+            return entry['record']
+
+        record = read_run_state(run_dir)
+        if record:
+            self.records[key] = {'stamp': stamp, 'record': record}
+            self.modified = True
+
+        return record
+
+    #---------------------------------------------------------------------------
+
+    def get_case_state(self, run_dir, coupling=False, run_timeout=3600):
+        """
+        Return case state and info (see get_case_state function).
+        """
+
+        record = self.get_record(run_dir)
+        if record:
+            return get_case_state_from_record(record, run_dir, run_timeout)
+
+        return get_case_state(run_dir, coupling, run_timeout)
+
+    #---------------------------------------------------------------------------
+
+    def get_entry(self, run_dir):
+        """
+        Return the index entry of a run directory (or None), so that it
+        may be transferred to another copy of the index.
+        """
+
+        key = os.path.relpath(os.path.abspath(run_dir), self.base_dir)
+        return self.records.get(key)
+
+    #---------------------------------------------------------------------------
+
+    def set_entry(self, run_dir, entry):
+        """
+        Set the index entry of a run directory (as returned by get_entry
+        on another copy of the index).
+        """
+
+        key = os.path.relpath(os.path.abspath(run_dir), self.base_dir)
+        if entry == self.records.get(key):
+            return
+
+        if entry is None:
+            del self.records[key]
+        else:
+            self.records[key] = entry
+        self.modified = True
+
+    #---------------------------------------------------------------------------
+
+    def save(self):
+        """
+        Save index (atomically) if modified.
+        """
+
+        if not self.modified:
+            return
+
+        tmp_path = self.path + '.' + str(os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.records, f)
+            os.replace(tmp_path, self.path)
+            self.modified = False
+        except Exception:
+            pass
+
 #===============================================================================
 # Main class
 #===============================================================================
@@ -581,6 +835,10 @@ class case:
 
         self.run_id = None
 
+        # Run state record
+
+        self.run_state = None
+
         # Time limit
 
         self.time_limit = None
@@ -821,8 +1079,8 @@ class case:
         if len(self.domains) > 1:
             r += '_COUPLING'
 
-        if not os.path.isdir(r):
-            os.makedirs(r)
+        # Several runs of a case may be prepared concurrently
+        os.makedirs(r, exist_ok=True)
 
         self.result_dir = os.path.join(r, self.run_id)
 
@@ -923,6 +1181,10 @@ class case:
 
         s.close()
 
+        self.update_run_state(case_state.RUNNING,
+                              n_procs=n_procs,
+                              omp_threads=r.n_threads)
+
     #---------------------------------------------------------------------------
 
     def summary_finalize(self):
@@ -948,6 +1210,54 @@ class case:
 
         s.close()
 
+        # Record timings, memory and parallelism from logs
+
+        info = {}
+        if len(self.domains) == 1:
+            get_run_log_info(self.exec_dir, info)
+        else:
+            info = get_empty_case_info()
+            for d in self.domains:
+                ic = get_empty_case_info()
+                if hasattr(d, 'exec_dir') and d.exec_dir:
+                    get_run_log_info(d.exec_dir, ic)
+                merge_coupled_info(info, ic)
+            del info['message']
+
+        self.update_run_state(case_state.FINALIZING, **info)
+
+    #---------------------------------------------------------------------------
+
+    def update_run_state(self, state, error=None, **kwargs):
+
+        """
+        Update the run state record in the results directory.
+        """
+
+        if self.run_id is None or not self.result_dir:
+            return
+
+        t = time.time()
+
+        if state == case_state.STAGING or self.run_state is None:
+            self.run_state = None
+            if state != case_state.STAGING:
+                self.run_state = read_run_state(self.result_dir)
+            if not self.run_state:
+                self.run_state = {'run_id': self.run_id,
+                                  'start_time': t}
+
+        self.run_state['state'] = state.name
+        self.run_state['update_time'] = t
+        if error:
+            self.run_state['error'] = error
+        if state in (case_state.FINALIZED, case_state.FAILED,
+                     case_state.EXCEEDED_TIME_LIMIT):
+            self.run_state['end_time'] = t
+        self.run_state.update(kwargs)
+
+        write_run_state(self.result_dir, self.run_state)
+
     #---------------------------------------------------------------------------
 
     def copy_log(self, name):
@@ -1598,6 +1908,8 @@ class case:
 
         # Create a temporary file to determine status
 
+        error = caption
+
         src_tmp_name = None
         dest_tmp_name = None
 
@@ -1635,6 +1947,11 @@ class case:
         except Exception:
             pass
 
+        if dest in run_status_states:
+            if dest != 'failed':
+                error = None
+            self.update_run_state(run_status_states[dest], error)
+
     #---------------------------------------------------------------------------
 
     def add_exec_dir_stamp(self):
@@ -2037,6 +2354,8 @@ class case:
 
         os.chdir(self.exec_dir)
 
+        exceeded_time_limit = self.exceeded_time_limit()
+
         self.update_scripts_tmp(('ready', 'finished'), 'saving')
 
         # Now save results
@@ -2080,6 +2399,13 @@ class case:
 
         self.update_scripts_tmp('saving', None)
 
+        if e_caption or self.error:
+            self.update_run_state(case_state.FAILED)
+        elif exceeded_time_limit:
+            self.update_run_state(case_state.EXCEEDED_TIME_LIMIT)
+        else:
+            self.update_run_state(case_state.FINALIZED)
+
     #---------------------------------------------------------------------------
 
     def run(self,
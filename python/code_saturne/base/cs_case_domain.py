@@ -26,6 +26,7 @@
 import configparser
 import datetime
 import fnmatch
+import hashlib
 import os
 import os.path
 import sys
@@ -41,8 +42,6 @@ from code_saturne.base.cs_exec_environment import get_ld_library_path_additions
 from code_saturne.base.cs_exec_environment import source_syrthes_env
 from code_saturne.base.cs_exec_environment import write_shell_shebang
 
-from code_saturne.base.cs_meg_to_c import meg_to_c_interpreter
-
 #===============================================================================
 # Utility functions
 #===============================================================================
@@ -76,6 +75,261 @@ def make_clean_dir(path):
 
 #-------------------------------------------------------------------------------
 
+def get_mesh_cache_dir():
+    """
+    Return the directory in which preprocessed meshes are cached,
+    or None if the cache is disabled (CS_MESH_CACHE_DIR set to "none").
+    """
+    cache_dir = os.getenv('CS_MESH_CACHE_DIR')
+    if cache_dir:
+        if cache_dir.lower() in ('none', 'no', 'off'):
+            return None
+        return cache_dir
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'mesh_input')
+
+#-------------------------------------------------------------------------------
+
+def mesh_cache_key(preprocessor, mesh_path, options):
+    """
+    Return a key identifying the result of preprocessing a given mesh,
+    based on its contents, the preprocessor options, and the preprocessor
+    executable, or None if the mesh can not be read.
+    """
+    h = hashlib.sha256()
+
+    def _add(s):
+        h.update(str(s).encode('utf-8'))
+        h.update(b'\0')
+
+    try:
+        st = os.stat(preprocessor)
+        _add('%s %d %d' % (preprocessor, st.st_size, st.st_mtime_ns))
+    except Exception:
+        _add(preprocessor)
+
+    for o in options:
+        _add(o)
+
+    # The file extension may be used to determine the mesh format.
+    _add(os.path.basename(mesh_path))
+
+    try:
+        with open(mesh_path, 'rb') as f:
+            while True:
+                b = f.read(1 << 20)
+                if not b:
+                    break
+                h.update(b)
+    except Exception:
+        return None
+
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+
+def get_available_memory():
+    """
+    Return the available memory (in bytes), or None if unknown.
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for l in f:
+                if l.startswith('MemAvailable:'):
+                    return int(l.split()[1]) * 1024
+    except Exception:
+        pass
+
+    return None
+
+#-------------------------------------------------------------------------------
+
+# Filesystem types for which concurrent copies are most useful
+
+_parallel_fs_types = ('lustre', 'gpfs', 'beegfs', 'ceph', 'cephfs',
+                      'nfs', 'nfs4', 'cifs', 'smb3', 'panfs', 'wekafs')
+
+#-------------------------------------------------------------------------------
+
+def get_copy_n_threads(path):
+    """
+    Return the number of threads used to copy results to a given path,
+    based on the type of filesystem it resides on (or CS_COPY_THREADS).
+    """
+    n_threads = os.getenv('CS_COPY_THREADS')
+    if n_threads:
+        try:
+            return max(1, int(n_threads))
+        except ValueError:
+            pass
+
+    # Determine the filesystem type from the longest matching mount point
+
+    fs_type = None
+    try:
+        path = os.path.realpath(path)
+        mount_len = -1
+        with open('/proc/mounts', 'r') as f:
+            for l in f:
+                w = l.split()
+                if len(w) < 3:
+                    continue
+                m = w[1]
+                if path == m or path.startswith(m.rstrip('/') + '/'):
+                    if len(m) > mount_len:
+                        mount_len = len(m)
+                        fs_type = w[2]
+    except Exception:
+        pass
+
+    n_procs = cs_compile.get_n_build_procs()
+
+    if fs_type in _parallel_fs_types or (fs_type or '').startswith('fuse'):
+        return min(16, max(4, n_procs))
+    else:
+        return min(4, max(2, n_procs))
+
+#-------------------------------------------------------------------------------
+
+# Files smaller than this are always copied (rather than hard-linked),
+# so that small files such as logs or setup files which might be edited
+# in the execution directory are not shared with the results directory.
+
+_copy_link_min_size = 1 << 20
+
+#-------------------------------------------------------------------------------
+
+def copy_file(src, dest, purge=False):
+    """
+    Copy a single file (or symbolic link), optionally removing the source,
+    using the fastest available method: rename if the source is purged,
+    hard link for large files, then server-side copy or reflink through
+    os.copy_file_range where supported, and regular copy otherwise.
+    """
+
+    if os.path.islink(src):
+        if os.path.lexists(dest):
+            os.remove(dest)
+        shutil.copy2(src, dest, follow_symlinks=False)
+        if purge:
+            os.remove(src)
+        return
+
+    if purge:
+        try:
+            os.rename(src, dest)
+            return
+        except OSError:
+            pass
+
+    if os.path.lexists(dest):
+        if os.path.samefile(src, dest):
+            if purge:
+                os.remove(src)
+            return
+        os.remove(dest)
+
+    if os.path.getsize(src) >= _copy_link_min_size:
+        try:
+            os.link(src, dest)
+            if purge:
+                os.remove(src)
+            return
+        except OSError:
+            pass
+
+    copied = False
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as f_src, open(dest, 'wb') as f_dest:
+                n = os.fstat(f_src.fileno()).st_size
+                offset = 0
+                while offset < n:
+                    c = os.copy_file_range(f_src.fileno(), f_dest.fileno(),
+                                           min(n - offset, 1 << 30))
+                    if c == 0:
+                        break
+                    offset += c
+            copied = (offset == n)
+        except OSError:
+            pass
+
+    if not copied:
+        shutil.copyfile(src, dest)
+
+    shutil.copystat(src, dest)
+
+    if purge:
+        os.remove(src)
+
+#-------------------------------------------------------------------------------
+
+def copy_file_list(jobs, purge=False, n_threads=1, progress_interval=10):
+    """
+    Copy a list of files, given as (source, destination, size) tuples,
+    using up to n_threads concurrent threads, and reporting progress
+    (with throughput) for large copies.
+    """
+
+    total_size = 0
+    for j in jobs:
+        total_size += j[2]
+
+    report = (total_size >= (1 << 26))
+
+    def _report(copied_size, t_start):
+        dt = max((datetime.datetime.now() - t_start).total_seconds(), 1e-6)
+        msg = '   copied {0:.1f} of {1:.1f} MiB ({2:.1f} MiB/s)\n'
+        sys.stdout.write(msg.format(copied_size / (1 << 20),
+                                    total_size / (1 << 20),
+                                    copied_size / (1 << 20) / dt))
+        sys.stdout.flush()
+
+    t_start = datetime.datetime.now()
+    t_report = t_start
+    copied_size = 0
+
+    n_threads = max(1, min(n_threads, len(jobs)))
+
+    if n_threads == 1:
+        for src, dest, size in jobs:
+            copy_file(src, dest, purge)
+            copied_size += size
+            if report:
+                t = datetime.datetime.now()
+                if (t - t_report).total_seconds() >= progress_interval:
+                    _report(copied_size, t_start)
+                    t_report = t
+
+    else:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            futures = {}
+            for src, dest, size in jobs:
+                f = executor.submit(copy_file, src, dest, purge)
+                futures[f] = size
+            try:
+                for f in as_completed(futures):
+                    f.result()
+                    copied_size += futures[f]
+                    if report:
+                        t = datetime.datetime.now()
+                        if (t - t_report).total_seconds() >= progress_interval:
+                            _report(copied_size, t_start)
+                            t_report = t
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+
+    if report:
+        _report(copied_size, t_start)
+
+#-------------------------------------------------------------------------------
+
 class RunCaseError(Exception):
     """Base class for exception handling."""
 
@@ -293,8 +547,7 @@ class base_domain:
 
         self.dest_root_dir = dest_root_dir
 
-        if not os.path.isdir(self.result_dir):
-            os.makedirs(self.result_dir)
+        os.makedirs(self.result_dir, exist_ok=True)
 
     #---------------------------------------------------------------------------
 
@@ -331,48 +584,72 @@ class base_domain:
         optionally removing it from the source.
         """
 
-        # Determine absolute source and destination names
+        self.copy_result_list([name], purge)
 
-        if os.path.isabs(name):
-            src = name
-            dest = os.path.join(self.result_dir, os.path.basename(name))
-        else:
-            src = os.path.join(self.exec_dir, name)
-            dest = os.path.join(self.result_dir, name)
+    #---------------------------------------------------------------------------
 
-        # If source and destination are identical, return
-        if src == dest:
-            return
+    def copy_result_list(self, names, purge=False):
+        """
+        Copy a list of files or directories to the results directory,
+        optionally removing them from the source.
 
-        # Copy single file
+        Individual files are copied concurrently, and all copies are
+        complete when this function returns.
+        """
 
-        if os.path.isfile(src) or os.path.islink(src):
-            shutil.copy2(src, dest, follow_symlinks=False)
-            if purge:
-                os.remove(src)
+        # Build list of files to copy, creating destination directories
 
-        # Copy single directory (possibly recursive)
-        # Unlike os.path.copytree, the destination directory
-        # may already exist.
+        jobs = []
+        purge_dirs = []
 
-        elif os.path.isdir(src):
+        def _add_jobs(src, dest):
 
-            if not os.path.isdir(dest):
-                os.mkdir(dest)
-            l = os.listdir(src)
-            for f in l:
-                f_src = os.path.join(src, f)
-                f_dest = os.path.join(dest, f)
-                if os.path.isfile(f_src) or os.path.islink(src):
-                    shutil.copy2(f_src, f_dest, follow_symlinks=False)
-                elif os.path.isdir(f_src):
-                    self.copy_result(f_src, f_dest)
+            # If source and destination are identical, skip
+            if src == dest:
+                return
 
-            if purge:
-                if os.path.islink(src):
-                    os.remove(f)
-                else:
-                    shutil.rmtree(src)
+            # Copy single file
+
+            if os.path.isfile(src) or os.path.islink(src):
+                jobs.append((src, dest, os.lstat(src).st_size))
+
+            # Copy single directory (possibly recursive)
+            # Unlike os.path.copytree, the destination directory
+            # may already exist.
+
+            elif os.path.isdir(src):
+                if not os.path.isdir(dest):
+                    os.mkdir(dest)
+                for f in os.listdir(src):
+                    _add_jobs(os.path.join(src, f), os.path.join(dest, f))
+
+        for name in names:
+
+            # Determine absolute source and destination names
+
+            if os.path.isabs(name):
+                src = name
+                dest = os.path.join(self.result_dir, os.path.basename(name))
+            else:
+                src = os.path.join(self.exec_dir, name)
+                dest = os.path.join(self.result_dir, name)
+
+            _add_jobs(src, dest)
+
+            if purge and src != dest \
+               and os.path.isdir(src) and not os.path.islink(src):
+                purge_dirs.append(src)
+
+        # Copy files
+
+        if jobs:
+            n_threads = get_copy_n_threads(self.result_dir)
+            copy_file_list(jobs, purge, n_threads)
+
+        # Remove remaining (empty) directory structure
+
+        for d in purge_dirs:
+            shutil.rmtree(d)
 
     #---------------------------------------------------------------------------
 
@@ -536,6 +813,9 @@ class domain(base_domain):
         self.compile_fcflags = None
         self.compile_nvccflags = None
         self.compile_libs = None
+        self.compile_jobs = None
+
+        self.preprocess_jobs = None
 
         # Adaptation using HOMARD
 
@@ -664,10 +944,10 @@ class domain(base_domain):
         module_name = case.module_name()
         if module_name == 'code_saturne':
             from code_saturne.model.XMLinitialize import XMLinit
-            XMLinit(case).initialize(preprocess_only)
+            XMLinit(case, use_cache=True).initialize(preprocess_only)
         elif module_name == 'neptune_cfd':
             from code_saturne.model.XMLinitializeNeptune import XMLinitNeptune
-            XMLinitNeptune(case).initialize(preprocess_only)
+            XMLinitNeptune(case, use_cache=True).initialize(preprocess_only)
 
         if not apply_filters:
             return case
@@ -914,6 +1194,8 @@ class domain(base_domain):
             # directory; is not required as meg_to_c_interpreter works from
             # case in memory
 
+            from code_saturne.base.cs_meg_to_c import meg_to_c_interpreter
+
             module_name = case.module_name()
             self.mci = meg_to_c_interpreter(case,
                                             module_name=module_name,
@@ -972,6 +1254,25 @@ class domain(base_domain):
 
             solver_name = os.path.basename(self.solver_path)
 
+            # Reuse a previous build with identical sources, flags and
+            # package if available
+
+            cache_key = None
+            if cs_compile.get_build_cache_dir():
+                opt_flags = [self.compile_cflags, self.compile_cxxflags,
+                             self.compile_fcflags, self.compile_nvccflags,
+                             self.compile_libs]
+                cache_key = cs_compile.build_cache_key(self.package_compute,
+                                                       solver_name,
+                                                       exec_src,
+                                                       opt_flags)
+                exec_name = os.path.join(self.exec_dir, solver_name)
+                if cs_compile.fetch_cached_build(cache_key, exec_name):
+                    log.write('Reusing cached build ' + cache_key + '\n')
+                    log.close()
+                    self.solver_path = os.path.join('.', solver_name)
+                    return
+
             retval = cs_compile.compile_and_link(self.package_compute,
                                                  solver_name,
                                                  exec_src,
@@ -983,11 +1284,16 @@ class domain(base_domain):
                                                  self.compile_libs,
                                                  keep_going=True,
                                                  stdout=log,
-                                                 stderr=log)
+                                                 stderr=log,
+                                                 n_jobs=self.compile_jobs)
 
             log.close()
 
             if retval == 0:
+                if cache_key:
+                    cs_compile.store_cached_build(cache_key,
+                                                  os.path.join(self.exec_dir,
+                                                               solver_name))
                 solver_dir = '.'
                 self.solver_path = os.path.join(solver_dir, solver_name)
             else:
@@ -1260,7 +1566,9 @@ class domain(base_domain):
             ld_library_path += ld_library_path_save
             os.environ['LD_LIBRARY_PATH'] = ld_library_path
 
-        # Run once per mesh
+        # Build list of preprocessing jobs (one per mesh)
+
+        jobs = []
 
         for m in self.meshes:
 
@@ -1272,8 +1580,10 @@ class domain(base_domain):
 
             if (type(m) == tuple):
                 m0 = m[0]
+                opts = list(m[1:])
             else:
                 m0 = m
+                opts = []
 
             m0 = os.path.expanduser(m0)
 
@@ -1290,57 +1600,31 @@ class domain(base_domain):
                     err_str += '(no mesh directory given)'
                 raise RunCaseError(err_str)
 
-            # Build command
-
             # Generate output mesh name
             if (mesh_id != None):
                 mesh_id += 1
                 _outputmesh = os.path.join('mesh_input',
                                            'mesh_%02d.csm' % (mesh_id))
+                _log = 'preprocessor_%02d.log' % (mesh_id)
             else:
                 _outputmesh = 'mesh_input.csm'
+                _log = 'preprocessor.log'
 
-            # Check if preprocessor is needed or not
-            if mesh_path[-4:] == ".csm":
-                # code_saturne mesh, no need to run preprocessor
-
-                if os.path.islink(_outputmesh):
-                    os.remove(_outputmesh)
-                self.symlink(mesh_path, _outputmesh)
-
-                retcode = 0
-            else:
-                # run preprocessor if needed
-
-                cmd = [self.package.get_preprocessor()]
+            jobs.append((mesh_path, opts, _outputmesh, _log, mesh_id))
 
-                if (type(m) == tuple):
-                    for opt in m[1:]:
-                        cmd.append(opt)
+        # Run jobs
 
-                cmd = cmd + ['--out', _outputmesh]
-                if (mesh_id != None):
-                    cmd = cmd + ['--log', 'preprocessor_%02d.log' % (mesh_id)]
-                    cmd = cmd + ['--case', 'preprocessor_%02d' % (mesh_id)]
-                else:
-                    cmd = cmd + ['--log']
-
-                cmd.append(mesh_path)
-
-                # Run command
-                retcode = run_command(cmd, pkg=self.package)
+        retcode = self.__run_preprocess_jobs(jobs)
 
-            if retcode != 0:
-                err_str = \
-                    'Error running the preprocessor.\n' \
-                    'Check the preprocessor.log file for details.\n\n'
-                sys.stderr.write(err_str)
+        if retcode != 0:
+            err_str = \
+                'Error running the preprocessor.\n' \
+                'Check the preprocessor.log file for details.\n\n'
+            sys.stderr.write(err_str)
 
-                self.exec_solver = False
+            self.exec_solver = False
 
-                self.error = 'preprocess'
-
-                break
+            self.error = 'preprocess'
 
         # Restore environment
 
@@ -1356,6 +1640,131 @@ class domain(base_domain):
 
     #---------------------------------------------------------------------------
 
+    def __run_preprocess_jobs(self, jobs):
+        """
+        Run preprocessing jobs, concurrently if possible.
+
+        Each job is a (mesh_path, options, output, log, mesh_id) tuple.
+        Meshes which are already in code_saturne format are simply linked,
+        and meshes whose contents and options match a previous conversion
+        are linked from the mesh cache.
+        """
+
+        if len(jobs) == 0:
+            return 0
+
+        cache_dir = get_mesh_cache_dir()
+        preprocessor = self.package.get_preprocessor()
+
+        def _run_job(job):
+            mesh_path, opts, out, log, mesh_id = job
+
+            # code_saturne mesh, no need to run preprocessor
+            if mesh_path[-4:] == ".csm":
+                if os.path.islink(out):
+                    os.remove(out)
+                self.symlink(mesh_path, out)
+                return 0
+
+            # Meshes for which postprocessing output is requested
+            # are always converted, as that output is not cached.
+            key = None
+            if cache_dir:
+                if not set(opts).intersection(('--post-volume', '--dump',
+                                                '--no-write')):
+                    key = mesh_cache_key(preprocessor, mesh_path, opts)
+            if key:
+                cached = os.path.join(cache_dir, key)
+                if os.path.isfile(cached + '.log') \
+                   and cs_compile.fetch_cached_file(cached + '.csm', out):
+                    try:
+                        shutil.copyfile(cached + '.log', log)
+                        with open(log, 'a') as f:
+                            f.write('\nMesh ' + mesh_path
+                                    + ' unchanged; reusing cached output '
+                                    + key + '.csm\n')
+                    except Exception:
+                        pass
+                    return 0
+
+            # A previous output may be linked to a cache entry, so
+            # remove it rather than let the preprocessor overwrite it.
+            if os.path.lexists(out):
+                os.remove(out)
+
+            cmd = [preprocessor] + opts + ['--out', out]
+            if (mesh_id != None):
+                cmd = cmd + ['--log', log]
+                cmd = cmd + ['--case', 'preprocessor_%02d' % (mesh_id)]
+            else:
+                cmd = cmd + ['--log']
+            cmd.append(mesh_path)
+
+            retcode = run_command(cmd)
+
+            if retcode == 0 and key:
+                cached = os.path.join(cache_dir, key)
+                cs_compile.store_cached_file(out, cached + '.csm',
+                                             max_entries=128, link=True)
+                cs_compile.store_cached_file(log, cached + '.log',
+                                             max_entries=128)
+
+            return retcode
+
+        # Number of concurrent jobs, bounded by available processors
+        # and memory (using a rough estimate of the preprocessor's
+        # memory footprint relative to the input mesh size).
+
+        n_jobs = self.preprocess_jobs
+        if n_jobs is None:
+            n_jobs = cs_compile.get_n_build_procs()
+            mem = get_available_memory()
+            if mem:
+                mesh_size = max([os.path.getsize(j[0]) for j in jobs])
+                n_jobs = min(n_jobs, mem // max(1, 10*mesh_size))
+        n_jobs = max(1, min(n_jobs, len(jobs)))
+
+        # Modify the PATH for relocatable installation once for all jobs
+        # (run_command would otherwise modify it concurrently).
+
+        saved_path = None
+        if self.package.config.features['relocatable'] == "yes":
+            if sys.platform.startswith("win"):
+                sep = ";"
+            else:
+                sep = ":"
+            saved_path = os.environ['PATH']
+            os.environ['PATH'] = self.package.get_dir('bindir') \
+                                 + sep + saved_path
+
+        retcode = 0
+
+        try:
+            if n_jobs == 1:
+                for job in jobs:
+                    retcode = _run_job(job)
+                    if retcode != 0:
+                        break
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    futures = [executor.submit(_run_job, job) for job in jobs]
+                    for future in futures:
+                        if future.cancelled():
+                            continue
+                        ret = future.result()
+                        if ret != 0 and retcode == 0:
+                            retcode = ret
+                            for fut in futures:
+                                fut.cancel()
+        finally:
+            if saved_path != None:
+                os.environ['PATH'] = saved_path
+
+        return retcode
+
+    #---------------------------------------------------------------------------
+
     def solver_command(self, need_abs_path=False):
         """
         Returns a tuple indicating the solver's working directory,
@@ -1454,8 +1863,8 @@ class domain(base_domain):
         log_files.extend(fnmatch.filter(dir_files, '*.log'))
         log_files.extend(fnmatch.filter(dir_files, 'error*'))
 
+        self.copy_result_list(log_files, purge)
         for f in log_files:
-            self.copy_result(f, purge)
             dir_files.remove(f)
 
         if (len(log_files) > 0):
@@ -1476,8 +1885,7 @@ class domain(base_domain):
         if not valid_dir:
             return
 
-        for f in dir_files:
-            self.copy_result(f, purge)
+        self.copy_result_list(dir_files, purge)
 
     #---------------------------------------------------------------------------
 
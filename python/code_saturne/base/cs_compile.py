@@ -24,9 +24,12 @@
 #-------------------------------------------------------------------------------
 
 import fnmatch
+import hashlib
 import os
+import shutil
 import sys
 import tempfile
+import threading
 
 from optparse import OptionParser
 
@@ -69,6 +72,11 @@ def process_cmd_line(argv, pkg):
                       action="store_true",
                       help="continue even if errors are encountered")
 
+    parser.add_option("-j", "--jobs", dest="n_jobs", type="int",
+                      metavar="<n>",
+                      help="number of files to compile concurrently "
+                      + "(default: all available processors)")
+
     parser.add_option("-s", "--source", dest="src_dir", type="string",
                       metavar="<src_dir>",
                       help="choose source file directory")
@@ -108,6 +116,7 @@ def process_cmd_line(argv, pkg):
     parser.set_defaults(test_mode=False)
     parser.set_defaults(force_link=False)
     parser.set_defaults(keep_going=False)
+    parser.set_defaults(n_jobs=None)
     parser.set_defaults(src_dir=os.getcwd())
     parser.set_defaults(dest_dir=os.getcwd())
     parser.set_defaults(version="")
@@ -143,7 +152,8 @@ def process_cmd_line(argv, pkg):
 
     return options.test_mode, options.force_link, options.keep_going, \
            src_dir, dest_dir, options.version, options.cflags, \
-           options.cxxflags, options.fcflags, nvccflags, options.libs
+           options.cxxflags, options.fcflags, nvccflags, options.libs, \
+           options.n_jobs
 
 #-------------------------------------------------------------------------------
 
@@ -162,6 +172,205 @@ def files_to_compile(src_dir):
 
     return src_files
 
+#-------------------------------------------------------------------------------
+
+def get_build_cache_dir():
+    """
+    Return the directory in which compiled objects and executables are
+    cached, or None if the cache is disabled (CS_COMPILE_CACHE_DIR set
+    to "none").
+    """
+    cache_dir = os.getenv('CS_COMPILE_CACHE_DIR')
+    if cache_dir:
+        if cache_dir.lower() in ('none', 'no', 'off'):
+            return None
+        return cache_dir
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'build')
+
+#-------------------------------------------------------------------------------
+
+def get_n_build_procs():
+    """
+    Return the number of processors available for compilation.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except Exception:
+        return os.cpu_count() or 1
+
+#-------------------------------------------------------------------------------
+
+def _defines_fortran_module(path):
+    """
+    Check if a Fortran source file defines a module.
+    """
+    try:
+        with open(path, 'r', errors='ignore') as f:
+            for l in f:
+                w = l.split()
+                if len(w) > 1 and w[0].lower() == 'module' \
+                   and w[1].lower() != 'procedure':
+                    return True
+    except Exception:
+        pass
+
+    return False
+
+#-------------------------------------------------------------------------------
+
+def package_stamp(pkg):
+    """
+    Return a string identifying the installed package.
+    """
+    # The installed solver changes with each (re)installation of the
+    # package, so its stamp also covers installed headers and libraries.
+    try:
+        st = os.stat(pkg.get_solver())
+        stamp = '%d %d' % (st.st_size, st.st_mtime_ns)
+    except Exception:
+        stamp = ''
+
+    return pkg.name + ' ' + pkg.version_full + ' ' + stamp
+
+#-------------------------------------------------------------------------------
+
+def fetch_cached_file(cached, dest):
+    """
+    Copy (or link) a cached file to a given destination.
+    Returns True if found, False otherwise.
+    """
+    if not os.path.isfile(cached):
+        return False
+
+    try:
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(cached, dest)
+        except OSError:
+            shutil.copy2(cached, dest)
+        # Update timestamp so that pruning removes least recently used entries
+        os.utime(cached)
+    except Exception:
+        return False
+
+    return True
+
+#-------------------------------------------------------------------------------
+
+def store_cached_file(src, cached, max_entries, link=False):
+    """
+    Store a file in a cache directory, keeping at most max_entries
+    (silently ignoring failures, as the cache is only an optimization).
+    If link is True, the file is hard-linked rather than copied when
+    possible, which is preferable for large files not modified later.
+    """
+    try:
+        cache_dir = os.path.dirname(cached)
+        os.makedirs(cache_dir, exist_ok=True)
+        # copy to temporary file first so that concurrent runs
+        # never see a partially written file
+        tmp_path = cached + '.%d.%d.tmp' % (os.getpid(),
+                                            threading.get_ident())
+        if link:
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                link = False
+        if not link:
+            shutil.copy2(src, tmp_path)
+        os.utime(tmp_path)
+        os.replace(tmp_path, cached)
+
+        # Prune least recently used entries
+        entries = []
+        for e in os.listdir(cache_dir):
+            if e[-4:] == '.tmp':
+                continue
+            p = os.path.join(cache_dir, e)
+            entries.append((os.path.getmtime(p), p))
+        entries.sort()
+        for t, p in entries[:max(0, len(entries) - max_entries)]:
+            os.remove(p)
+    except Exception:
+        pass
+
+#-------------------------------------------------------------------------------
+
+def build_cache_key(pkg, base_name, srcdir, opt_flags=None):
+    """
+    Return a key identifying the result of compiling and linking the
+    sources of a given directory (including MEG-generated sources),
+    based on their contents, the compilers and flags used, and the
+    installed package.
+    """
+    h = hashlib.sha256()
+
+    def _add(s):
+        h.update(str(s).encode('utf-8'))
+        h.update(b'\0')
+
+    _add(package_stamp(pkg))
+    _add(base_name)
+
+    for k in sorted(pkg.config.compilers):
+        _add(k)
+        _add(pkg.config.compilers[k])
+    for k in sorted(pkg.config.flags):
+        _add(k)
+        _add(pkg.config.flags[k])
+    if opt_flags:
+        for f in opt_flags:
+            _add(f)
+
+    for f in sorted(os.listdir(srcdir)):
+        if f[0] == '#':   # Filter temporary files left by some editors.
+            continue
+        p = os.path.join(srcdir, f)
+        if not os.path.isfile(p):
+            continue
+        _add(f)
+        with open(p, 'rb') as fp:
+            h.update(fp.read())
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+
+def fetch_cached_build(key, exec_name):
+    """
+    Copy (or link) a cached executable matching a given key to exec_name.
+    Returns True if found, False otherwise.
+    """
+    cache_dir = get_build_cache_dir()
+    if not cache_dir:
+        return False
+
+    cached = os.path.join(cache_dir, 'exec',
+                          key + '_' + os.path.basename(exec_name))
+
+    return fetch_cached_file(cached, exec_name)
+
+#-------------------------------------------------------------------------------
+
+def store_cached_build(key, exec_name, max_entries=16):
+    """
+    Store a compiled executable in the build cache.
+    """
+    cache_dir = get_build_cache_dir()
+    if not cache_dir or not os.path.isfile(exec_name):
+        return
+
+    cached = os.path.join(cache_dir, 'exec',
+                          key + '_' + os.path.basename(exec_name))
+
+    store_cached_file(exec_name, cached, max_entries)
+
 #---------------------------------------------------------------------------
 
 def separate_compiler_args(s):
@@ -200,6 +409,7 @@ class cs_compile(object):
         Initialize compiler object.
         """
         self.pkg = package
+        self.obj_cache = True
 
     #---------------------------------------------------------------------------
 
@@ -380,9 +590,19 @@ class cs_compile(object):
                     opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                     opt_nvccflags=None,
                     keep_going=False,
-                    stdout=sys.stdout, stderr=sys.stderr):
+                    stdout=sys.stdout, stderr=sys.stderr,
+                    n_jobs=1, work_dir=None):
         """
         Compilation function.
+
+        Independent files are compiled concurrently using up to n_jobs
+        processes (all available processors if n_jobs is None), Fortran
+        files defining modules being compiled first. Objects compiled from
+        C, C++ and CUDA sources are reused from the build cache when
+        sources, local headers and flags are unchanged.
+
+        Objects are built in work_dir if given (without changing the
+        working directory), in the current directory otherwise.
         """
         retval = 0
 
@@ -417,11 +637,18 @@ class cs_compile(object):
             f_include_dirs.append(os.path.dirname(f))
         f_include_dirs = sorted(set(cxx_include_dirs))
 
-        # Compile files
+        # Local headers are part of the object cache key
+
+        local_dirs = sorted(set(c_include_dirs + cxx_include_dirs
+                                + [os.path.dirname(f) for f in src_list]))
+        h_key = self.__headers_key(h_files + hxx_files)
+
+        # Build compilation commands
+
+        mod_jobs = []
+        jobs = []
 
         for f in c_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = separate_compiler_args(self.get_compiler('cc'))
             if opt_cflags != None:
                 cmd += separate_args(opt_cflags)
@@ -434,14 +661,10 @@ class cs_compile(object):
             cmd += self.get_flags('cppflags', base_name=base_name)
             cmd += separate_args(pkg.config.flags['cflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(self.obj_name(f))
+            key = self.__object_key(cmd, f, local_dirs, h_key)
+            jobs.append((f, cmd, self.obj_name(f), key))
 
         for f in cxx_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = separate_compiler_args(self.get_compiler('cxx'))
             if opt_cxxflags != None:
                 cmd += separate_args(opt_cxxflags)
@@ -453,14 +676,10 @@ class cs_compile(object):
             cmd += self.get_flags('cppflags', base_name=base_name)
             cmd += separate_args(pkg.config.flags['cxxflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(self.obj_name(f))
+            key = self.__object_key(cmd, f, local_dirs, h_key)
+            jobs.append((f, cmd, self.obj_name(f), key))
 
         for f in cu_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = separate_compiler_args(self.get_compiler('nvcc'))
             if opt_nvccflags != None:
                 cmd += separate_args(opt_nvccflags)
@@ -472,14 +691,10 @@ class cs_compile(object):
             cmd += self.get_flags('cppflags', base_name=base_name)
             cmd += separate_args(pkg.config.flags['nvccflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(self.obj_name(f))
+            key = self.__object_key(cmd, f, local_dirs, h_key)
+            jobs.append((f, cmd, self.obj_name(f), key))
 
         for f in f_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = separate_compiler_args(self.get_compiler('fc'))
             f_base = os.path.basename(f)
             o_name = self.obj_name(f)
@@ -509,25 +724,200 @@ class cs_compile(object):
             for d in f_include_dirs:
                 cmd += ["-I", d]
             if pkg.config.fcmodinclude != "-I":
-                cmd += [pkg.config.fcmodinclude, srcdir]
+                cmd += [pkg.config.fcmodinclude, os.path.dirname(f)]
             cmd += ["-I", pkg.get_dir('pkgincludedir')]
             if pkg.config.fcmodinclude != "-I":
                 cmd += [pkg.config.fcmodinclude, pkg.get_dir('pkgincludedir')]
             cmd += separate_args(pkg.config.flags['fcflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(o_name)
+            # Fortran objects depend on module files generated in the
+            # build directory, so they are not cached.
+            if _defines_fortran_module(f):
+                mod_jobs.append((f, cmd, o_name, None))
+            else:
+                jobs.append((f, cmd, o_name, None))
+
+        # Compile files (modules first, serially, in the given order)
+
+        retval, mod_o_files = self.__run_compile_jobs(mod_jobs, 1,
+                                                      keep_going,
+                                                      stdout, stderr,
+                                                      work_dir)
+        o_files += mod_o_files
+
+        if retval == 0 or keep_going:
+            ret, job_o_files = self.__run_compile_jobs(jobs, n_jobs,
+                                                       keep_going,
+                                                       stdout, stderr,
+                                                       work_dir)
+            if ret != 0:
+                retval = ret
+            o_files += job_o_files
+
+        return retval, o_files
+
+    #---------------------------------------------------------------------------
+
+    def __headers_key(self, h_files):
+        """
+        Return a hash of local header files contents.
+        """
+        h = hashlib.sha256()
+        for f in sorted(h_files, key=os.path.basename):
+            h.update(os.path.basename(f).encode('utf-8'))
+            h.update(b'\0')
+            try:
+                with open(f, 'rb') as fp:
+                    h.update(fp.read())
+            except Exception:
+                pass
+            h.update(b'\0')
+
+        return h.hexdigest()
+
+    #---------------------------------------------------------------------------
+
+    def __object_key(self, cmd, src, local_dirs, h_key):
+        """
+        Return the object cache key for a compilation command, or None
+        if the object cache is disabled.
+
+        Local directories are replaced by placeholders, so that identical
+        sources compiled in different execution directories match.
+        """
+        if not self.obj_cache or not get_build_cache_dir():
+            return None
+
+        h = hashlib.sha256()
+        h.update(package_stamp(self.pkg).encode('utf-8'))
+        h.update(h_key.encode('utf-8'))
+        for a in cmd:
+            if a == src:
+                a = os.path.basename(src)
+            elif a in local_dirs:
+                a = '<src>'
+            h.update(a.encode('utf-8'))
+            h.update(b'\0')
+        try:
+            with open(src, 'rb') as fp:
+                h.update(fp.read())
+        except Exception:
+            return None
+
+        return h.hexdigest()
+
+    #---------------------------------------------------------------------------
+
+    def __run_compile_jobs(self, jobs, n_jobs, keep_going, stdout, stderr,
+                           work_dir=None):
+        """
+        Run compilation jobs, using up to n_jobs concurrent processes,
+        in work_dir if given.
+
+        The output of each job is buffered and written in job order,
+        so that logs remain readable.
+        """
+        retval = 0
+        o_files = []
+
+        if len(jobs) == 0:
+            return retval, o_files
+
+        if n_jobs is None:
+            n_jobs = get_n_build_procs()
+        n_jobs = max(1, min(n_jobs, len(jobs)))
+
+        cache_dir = get_build_cache_dir()
+        if cache_dir:
+            obj_cache_dir = os.path.join(cache_dir, 'obj')
+
+        def _run_job(job):
+            f, cmd, o_name, key = job
+            if work_dir:
+                o_name = os.path.join(work_dir, o_name)
+            out = tempfile.TemporaryFile(mode='w+')
+            err = tempfile.TemporaryFile(mode='w+')
+            if key and fetch_cached_file(os.path.join(obj_cache_dir,
+                                                      key + '.o'),
+                                         o_name):
+                out.write('Reusing cached object for ' + f + '\n')
+                ret = 0
+            else:
+                # The previous object may be linked to a cache entry, so
+                # remove it rather than let the compiler overwrite it.
+                if os.path.lexists(o_name):
+                    os.remove(o_name)
+                ret = run_command(cmd, echo=True, stdout=out, stderr=err,
+                                  cwd=work_dir)
+                if ret == 0 and key:
+                    store_cached_file(o_name,
+                                      os.path.join(obj_cache_dir,
+                                                   key + '.o'),
+                                      max_entries=512)
+            out.seek(0)
+            err.seek(0)
+            r = (ret, out.read(), err.read())
+            out.close()
+            err.close()
+            return r
+
+        # Modify the PATH for relocatable installation once for all jobs
+        # (run_command would otherwise modify it concurrently).
+
+        saved_path = None
+        if self.pkg.config.features['relocatable'] == "yes":
+            if sys.platform.startswith("win"):
+                sep = ";"
+            else:
+                sep = ":"
+            saved_path = os.environ['PATH']
+            os.environ['PATH'] = self.pkg.get_dir('bindir') + sep + saved_path
+
+        def _report(job, r):
+            ret, out, err = r
+            if out:
+                stdout.write(out)
+            if err:
+                stderr.write(err)
+            o_files.append(job[2])
+            return ret
+
+        try:
+            if n_jobs == 1:
+                for job in jobs:
+                    if _report(job, _run_job(job)) != 0:
+                        retval = 1
+                        if not keep_going:
+                            break
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    futures = [executor.submit(_run_job, job) for job in jobs]
+                    for job, future in zip(jobs, futures):
+                        if future.cancelled():
+                            continue
+                        if _report(job, future.result()) != 0:
+                            retval = 1
+                            if not keep_going:
+                                for fut in futures:
+                                    fut.cancel()
+            stdout.flush()
+            stderr.flush()
+        finally:
+            if saved_path != None:
+                os.environ['PATH'] = saved_path
 
         return retval, o_files
 
     #---------------------------------------------------------------------------
 
     def link_obj(self, exec_name, obj_files=None, opt_libs=None,
-                 stdout=sys.stdout, stderr=sys.stderr):
+                 stdout=sys.stdout, stderr=sys.stderr, work_dir=None):
         """
         Link function.
+
+        Relative paths are based on work_dir if given (without changing
+        the working directory), on the current directory otherwise.
         """
         retval = 0
 
@@ -537,7 +927,10 @@ class cs_compile(object):
 
         # Directories
 
-        call_dir = None
+        call_dir = work_dir
+        if call_dir is None:
+            call_dir = os.getcwd()
+        link_dir = work_dir
         temp_dir = None
 
         o_files = obj_files
@@ -550,16 +943,15 @@ class cs_compile(object):
 
         if pkg.config.special_user_link == 'ar_x':
 
-            call_dir = os.getcwd()
             temp_dir = tempfile.mkdtemp(suffix=".cs_link")
-            os.chdir(temp_dir)
+            link_dir = temp_dir
 
             lib0 = os.path.join(self.get_ar_lib_dir(),
                                 'lib' + p_libs[0][2:] + '.a')
             p_libs = p_libs[1:]
             cmd = ['ar', 'x', lib0]
             if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
+                           stdout=stdout, stderr=stderr, cwd=temp_dir) != 0:
                 retval = 1
 
             if obj_files:
@@ -571,7 +963,7 @@ class cs_compile(object):
                         f_src = os.path.join(call_dir, f)
                     shutil.copy2(f_src, temp_dir)
 
-            dir_files = os.listdir(os.getcwd())
+            dir_files = os.listdir(temp_dir)
             o_files = fnmatch.filter(dir_files, '*.o')
 
         # Prepare link command
@@ -607,7 +999,7 @@ class cs_compile(object):
 
         if retval == 0:
             if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
+                           stdout=stdout, stderr=stderr, cwd=link_dir) != 0:
                 retval = 1
 
         # Cleanup for special cases
@@ -615,10 +1007,10 @@ class cs_compile(object):
         if temp_dir:
             if not os.path.isabs(exec_name):
                 import shutil
-                shutil.copy2(exec_name, os.path.join(call_dir, exec_name))
+                shutil.copy2(os.path.join(temp_dir, exec_name),
+                             os.path.join(call_dir, exec_name))
             for f in os.listdir(temp_dir):
                 os.remove(os.path.join(temp_dir, f))
-            os.chdir(call_dir)
             os.rmdir(temp_dir)
 
         return retval
@@ -629,23 +1021,25 @@ class cs_compile(object):
                          opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                          opt_nvccflags=None, opt_libs=None, force_link=False,
                          keep_going=False,
-                         stdout=sys.stdout, stderr=sys.stderr):
+                         stdout=sys.stdout, stderr=sys.stderr,
+                         n_jobs=None):
         """
         Compilation and link function.
         """
         retval = 0
 
+        srcdir = os.path.abspath(srcdir)
+
         # Determine executable name
 
         exec_name = base_name
         if destdir != None:
-            exec_name = os.path.join(destdir, exec_name)
+            exec_name = os.path.join(os.path.abspath(destdir), exec_name)
 
-        # Change to temporary directory
+        # Build in a temporary directory (without changing the working
+        # directory, as this may be called from a worker thread)
 
-        call_dir = os.getcwd()
         temp_dir = tempfile.mkdtemp(suffix=".cs_compile")
-        os.chdir(temp_dir)
 
         # Find files to compile in source path (special case
         # for user modules which must be compiled first)
@@ -665,21 +1059,20 @@ class cs_compile(object):
         retval, obj_list = self.compile_src(base_name, src_list,
                                             opt_cflags, opt_cxxflags,
                                             opt_fcflags, opt_nvccflags,
-                                            keep_going, stdout, stderr)
+                                            keep_going, stdout, stderr,
+                                            n_jobs=n_jobs, work_dir=temp_dir)
 
         if retval == 0 and (force_link or len(obj_list)) > 0:
             retval = self.link_obj(exec_name, obj_files=obj_list,
                                    opt_libs=opt_libs,
-                                   stdout=stdout, stderr=stderr)
+                                   stdout=stdout, stderr=stderr,
+                                   work_dir=temp_dir)
 
         # Cleanup
 
         for f in os.listdir(temp_dir):
             os.remove(os.path.join(temp_dir, f))
 
-        # Return to original directory
-
-        os.chdir(call_dir)
         os.rmdir(temp_dir)
 
         return retval
@@ -690,7 +1083,7 @@ def compile_and_link(pkg, base_name, srcdir, destdir=None,
                      opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                      opt_nvccflags=None,
                      opt_libs=None, force_link=False, keep_going=False,
-                     stdout=sys.stdout, stderr=sys.stderr):
+                     stdout=sys.stdout, stderr=sys.stderr, n_jobs=None):
     """
     Compilation and link function.
     """
@@ -707,7 +1100,8 @@ def compile_and_link(pkg, base_name, srcdir, destdir=None,
                                  force_link=force_link,
                                  keep_going=keep_going,
                                  stdout=stdout,
-                                 stderr=stderr)
+                                 stderr=stderr,
+                                 n_jobs=n_jobs)
 
     return retcode
 
@@ -726,7 +1120,8 @@ def main(argv, pkg):
         from cs_exec_environment import set_modules, source_rcfile
 
     test_mode, force_link, keep_going, src_dir, dest_dir, version, \
-        cflags, cxxflags, fcflags, nvccflags, libs = process_cmd_line(argv, pkg)
+        cflags, cxxflags, fcflags, nvccflags, libs, n_jobs \
+        = process_cmd_line(argv, pkg)
 
     if (version):
         pkg = pkg.get_alternate_version(version)
@@ -747,7 +1142,8 @@ def main(argv, pkg):
                                opt_nvccflags=nvccflags,
                                opt_libs=libs,
                                force_link=force_link,
-                               keep_going=keep_going)
+                               keep_going=keep_going,
+                               n_jobs=n_jobs)
 
     sys.exit(retcode)
 
@@ -24,7 +24,6 @@
 
 import os
 import sys
-from optparse import OptionParser
 
 #-------------------------------------------------------------------------------
 
@@ -156,11 +155,6 @@ class config:
         self.special_user_link = d.get('cs_special_user_link', '')
         self.ld_default_search_path = d.get('ld_default_search_path', '')
 
-        system_flags = {'cppflags': d.get('cppflags', ''),
-                        'ldflags': d.get('ldflags', ''),
-                        'ldflags_shared': d.get('ldflags_shared', ''),
-                        'libs': d.get('libs', '')}
-
         # Constants for system-dependant file extensions
         if sys.platform.startswith("win"):
             self.cfgext = ".ini"
@@ -224,14 +218,42 @@ class config:
         self.features['long-gnum'] = d.get('cs_have_long_gnum', 'yes')
         self.features['build_os'] = d.get('build_os', '')
 
-        # Now, one can setup the prerequisites information
+        # Prerequisites information is only set up when first needed,
+        # as most commands do not require it.
+
+        self.__config_dict = config_dict
+        self.__libs = None
 
-        self.libs = {}
+    @property
+    def libs(self):
+        """
+        Prerequisite libraries information (built on first access).
+        """
+
+        if self.__libs is None:
+            self.__libs = self.__setup_libs__(self.__config_dict)
+            self.__config_dict = None
+
+        return self.__libs
+
+    def __setup_libs__(self, config_dict):
+        """
+        Setup prerequisite libraries information.
+        """
+
+        d = config_dict.get('compilers', {})
+
+        system_flags = {'cppflags': d.get('cppflags', ''),
+                        'ldflags': d.get('ldflags', ''),
+                        'ldflags_shared': d.get('ldflags_shared', ''),
+                        'libs': d.get('libs', '')}
+
+        libs = {}
 
         # Setup code_saturne libraries
         # Here, CPPFLAGS and LDFLAGS will be provided by a get_dir method
 
-        self.libs['saturne'] = \
+        libs['saturne'] = \
             prerequisite('Code_Saturne', None, None,
                          have = True,
                          flags = {'cppflags': "",
@@ -242,12 +264,12 @@ class config:
         # Here, the variant (internal or external) will be used to add
         # paths to the command line
 
-        self.libs['ple'] = \
+        libs['ple'] = \
             prerequisite('PLE', 'ple', config_dict, have=True)
 
         # Setup user and system libraries
 
-        self.libs['system'] = \
+        libs['system'] = \
             prerequisite('System', None, None,
                          have = True,
                          flags = system_flags,
@@ -255,32 +277,34 @@ class config:
 
         # Setup the optionnal libraries
 
-        self.libs['blas'] = prerequisite('BLAS', 'blas', config_dict)
+        libs['blas'] = prerequisite('BLAS', 'blas', config_dict)
 
-        self.libs['ccm']  = prerequisite('CCM', 'ccm', config_dict)
-        self.libs['cgns'] = prerequisite('CGNS', 'cgns', config_dict)
-        self.libs['hdf5'] = prerequisite('HDF5', 'hdf5', config_dict)
-        self.libs['med']  = prerequisite('MED', 'med', config_dict)
+        libs['ccm']  = prerequisite('CCM', 'ccm', config_dict)
+        libs['cgns'] = prerequisite('CGNS', 'cgns', config_dict)
+        libs['hdf5'] = prerequisite('HDF5', 'hdf5', config_dict)
+        libs['med']  = prerequisite('MED', 'med', config_dict)
 
-        self.libs['catalyst'] = prerequisite('CATALYST', 'catalyst', config_dict)
-        self.libs['melissa']  = prerequisite('MELISSA', 'melissa', config_dict)
-        self.libs['medcoupling'] = prerequisite('MEDCOUPLING',
-                                                'medcoupling', config_dict)
+        libs['catalyst'] = prerequisite('CATALYST', 'catalyst', config_dict)
+        libs['melissa']  = prerequisite('MELISSA', 'melissa', config_dict)
+        libs['medcoupling'] = prerequisite('MEDCOUPLING',
+                                           'medcoupling', config_dict)
 
-        self.libs['eos']       = prerequisite('EOS', 'eos', config_dict)
-        self.libs['coolprop']  = prerequisite('COOLPROP', 'coolprop', config_dict)
+        libs['eos']       = prerequisite('EOS', 'eos', config_dict)
+        libs['coolprop']  = prerequisite('COOLPROP', 'coolprop', config_dict)
 
-        self.libs['mpi'] = prerequisite('MPI', 'mpi', config_dict, add_rpath=False)
+        libs['mpi'] = prerequisite('MPI', 'mpi', config_dict, add_rpath=False)
 
-        self.libs['scotch'] = prerequisite('SCOTCH', 'scotch', config_dict)
-        self.libs['metis']  = prerequisite('METIS', 'metis', config_dict)
+        libs['scotch'] = prerequisite('SCOTCH', 'scotch', config_dict)
+        libs['metis']  = prerequisite('METIS', 'metis', config_dict)
 
-        self.libs['cuda'] =  prerequisite('CUDA', 'cuda', config_dict)
+        libs['cuda'] =  prerequisite('CUDA', 'cuda', config_dict)
 
-        self.libs['petsc'] = prerequisite('PETSc', 'petsc', config_dict)
-        self.libs['amgx']  = prerequisite('Amgx', 'amgx', config_dict)
-        self.libs['hypre'] = prerequisite('HYPRE', 'hypre', config_dict)
-        self.libs['mumps'] = prerequisite('MUMPS', 'mumps', config_dict)
+        libs['petsc'] = prerequisite('PETSc', 'petsc', config_dict)
+        libs['amgx']  = prerequisite('Amgx', 'amgx', config_dict)
+        libs['hypre'] = prerequisite('HYPRE', 'hypre', config_dict)
+        libs['mumps'] = prerequisite('MUMPS', 'mumps', config_dict)
+
+        return libs
 
     def __get_search_paths_catalyst__(self):
         """
@@ -416,6 +440,8 @@ def process_cmd_line(argv):
              it is split to create a list of arguments.
     """
 
+    from optparse import OptionParser
+
     parser = OptionParser(usage="usage: %prog [options]")
 
     parser.add_option("--cc", dest="print_cc",
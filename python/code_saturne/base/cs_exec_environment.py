@@ -23,19 +23,12 @@
 
 #-------------------------------------------------------------------------------
 
-import configparser
-import datetime
-import fnmatch
 import os
 import subprocess
 import sys
-import platform
-import tempfile
 
-try:
-    from code_saturne.base import cs_batch
-except Exception:
-    import cs_batch
+# Other modules are imported locally where needed, to reduce startup time
+# of commands which only use a small part of this module.
 
 saved_os_env_vars = {}
 
@@ -667,10 +660,32 @@ def full_os_environ_for_shell(env=None):
 
 #-------------------------------------------------------------------------------
 
+# Commands currently run by run_command, so that they may be terminated
+# (for example when cancelling a GUI task).
+
+_running_commands = set()
+
+#-------------------------------------------------------------------------------
+
+def terminate_commands():
+    """
+    Terminate commands currently run by run_command.
+    """
+    for p in list(_running_commands):
+        try:
+            p.terminate()
+        except OSError:
+            pass
+
+#-------------------------------------------------------------------------------
+
 def run_command(args, pkg = None, echo = False,
-                stdout = sys.stdout, stderr = sys.stderr, env = None):
+                stdout = sys.stdout, stderr = sys.stderr, env = None,
+                cwd = None):
     """
     Run a command.
+    If cwd is given, the command is run in that directory, without
+    changing the working directory of the calling process.
     """
     if echo == True:
         if type(args) == str:
@@ -704,6 +719,8 @@ def run_command(args, pkg = None, echo = False,
         kwargs['stdout'] = stdout
     if (stderr != sys.stderr):
         kwargs['stderr'] = stderr
+    if cwd != None:
+        kwargs['cwd'] = cwd
 
     returncode = 1
     try:
@@ -719,7 +736,11 @@ def run_command(args, pkg = None, echo = False,
                                  universal_newlines=True,
                                  env=env,
                                  **kwargs)
-        p.communicate()
+        _running_commands.add(p)
+        try:
+            p.communicate()
+        finally:
+            _running_commands.discard(p)
         returncode = p.returncode
     except Exception as e:
         import traceback
@@ -776,9 +797,157 @@ def get_command_outputs(cmd):
 
 #-------------------------------------------------------------------------------
 
+def get_env_cache_dir():
+    """
+    Return the directory in which environment changes resulting from
+    environment modules or sourced scripts are cached, or None if the
+    cache is disabled (CS_ENV_CACHE_DIR set to "none").
+    """
+    cache_dir = os.getenv('CS_ENV_CACHE_DIR')
+    if cache_dir:
+        if cache_dir.lower() in ('none', 'no', 'off'):
+            return None
+        return cache_dir
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'env')
+
+#-------------------------------------------------------------------------------
+
+# Environment variables which vary between invocations but do not
+# influence the result of loading modules or sourcing scripts.
+
+_env_cache_ignore = ('PWD', 'OLDPWD', 'SHLVL', '_')
+
+# Maximum age of cached environment changes (in seconds), as files
+# indirectly used (such as module files) are not checked.
+
+_env_cache_max_age = 86400
+
+#-------------------------------------------------------------------------------
+
+def _env_cache_key(kind, inputs):
+    """
+    Return a key identifying environment changes for a given kind of
+    operation, its inputs, and the current environment.
+    """
+    import hashlib
+
+    h = hashlib.sha256()
+
+    def _add(s):
+        h.update(str(s).encode('utf-8', errors='surrogateescape'))
+        h.update(b'\0')
+
+    _add(kind)
+    for i in inputs:
+        _add(i)
+
+    for k in sorted(os.environ.keys()):
+        if k in _env_cache_ignore:
+            continue
+        _add(k)
+        _add(os.environ[k])
+
+    return h.hexdigest()
+
+#-------------------------------------------------------------------------------
+
+def _file_stamp(path):
+    """
+    Return a string identifying a file's path and modification time.
+    """
+    try:
+        st = os.stat(path)
+        return '%s %d %d' % (path, st.st_size, st.st_mtime_ns)
+    except Exception:
+        return path
+
+#-------------------------------------------------------------------------------
+
+def _read_env_delta(key):
+    """
+    Return cached environment changes for a given key, or None.
+    """
+    import json
+    import time
+
+    cache_dir = get_env_cache_dir()
+    if not cache_dir or not key:
+        return None
+
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        st = os.stat(path)
+        if time.time() - st.st_mtime > _env_cache_max_age:
+            return None
+        with open(path, 'r') as f:
+            delta = json.load(f)
+        return delta['set'], delta['unset']
+    except Exception:
+        return None
+
+#-------------------------------------------------------------------------------
+
+def _write_env_delta(key, env_set, env_unset):
+    """
+    Cache environment changes for a given key
+    (silently ignoring failures, as the cache is only an optimization).
+    """
+    import json
+
+    cache_dir = get_env_cache_dir()
+    if not cache_dir or not key:
+        return
+
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'set': env_set, 'unset': env_unset}, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+#-------------------------------------------------------------------------------
+
+def _update_python_path(value):
+    """
+    Prepend PYTHONPATH entries to the Python search path.
+    """
+    vals = value.split(':')
+    vals.reverse()
+    for v in vals:
+        if v:
+            sys.path.insert(0, v)
+    sys.path = clean_path(sys.path)
+
+#-------------------------------------------------------------------------------
+
+def _apply_env_delta(env_set, env_unset):
+    """
+    Apply environment changes.
+    """
+    for key in env_unset:
+        if key in os.environ:
+            del os.environ[key]
+
+    for key, value in env_set.items():
+        os.environ[key] = value
+        if key == 'PYTHONPATH':
+            _update_python_path(value)
+
+#-------------------------------------------------------------------------------
+
 def set_modules(pkg):
     """
     Set environment modules if present.
+
+    The resulting environment changes are cached, so that modules are
+    loaded only once for a given environment and list of modules.
     """
 
     if pkg.config.env_modules == "no":
@@ -789,17 +958,39 @@ def set_modules(pkg):
     cmds = ['purge']
     for m in pkg.config.env_modules.strip().split():
         cmds.append('load ' + m)
+
+    key = None
+    if get_env_cache_dir():
+        key = _env_cache_key('modules', [_file_stamp(cmd_prefix)] + cmds)
+        delta = _read_env_delta(key)
+        if delta:
+            _apply_env_delta(*delta)
+            return
+
+    env_save = dict(os.environ)
+
     for cmd in cmds:
         (output, error) = subprocess.Popen([cmd_prefix, 'python'] + cmd.split(),
                                            universal_newlines=True,
                                            stdout=subprocess.PIPE).communicate()
         exec(output)
 
+    if key:
+        env_set = {}
+        for k, v in os.environ.items():
+            if env_save.get(k) != v:
+                env_set[k] = v
+        env_unset = [k for k in env_save.keys() if k not in os.environ]
+        _write_env_delta(key, env_set, env_unset)
+
 #-------------------------------------------------------------------------------
 
 def source_shell_script(path):
     """
     Source shell script.
+
+    The resulting environment changes are cached, so that the script is
+    sourced only once for a given environment and script version.
     """
 
     if not os.path.isfile(path):
@@ -830,6 +1021,16 @@ def source_shell_script(path):
     if not user_shell:
         user_shell = '/bin/sh'
 
+    key = None
+    if get_env_cache_dir():
+        key = _env_cache_key('source',
+                             [_file_stamp(os.path.expanduser(path)),
+                              user_shell])
+        delta = _read_env_delta(key)
+        if delta:
+            _apply_env_delta(*delta)
+            return
+
     cmd = ['source ' + path + ' && env']
 
     p = subprocess.Popen(cmd,
@@ -842,25 +1043,25 @@ def source_shell_script(path):
 
     output = p.communicate()[0]
 
+    env_set = {}
+
     for line in output.splitlines():
 
-        (key, _, value) = line.partition("=")
+        (key_s, _, value) = line.partition("=")
 
         # For paths, cleanup (remove multiple values) first
-        if key[-4:] == 'PATH':
+        if key_s[-4:] == 'PATH':
             value = clean_path(value)
 
-        # Add key, value
-        os.environ[key] = value
+        if os.environ.get(key_s) != value or key_s == 'PYTHONPATH':
+            env_set[key_s] = value
 
-        # additional handling for Python path
-        if key == 'PYTHONPATH':
-            vals = value.split(':')
-            vals.reverse()
-            for v in vals:
-                if v:
-                    sys.path.insert(0, v)
-            sys.path = clean_path(sys.path)
+    # Add keys, values (with additional handling for Python path)
+
+    _apply_env_delta(env_set, [])
+
+    if key:
+        _write_env_delta(key, env_set, [])
 
 #-------------------------------------------------------------------------------
 
@@ -869,6 +1070,7 @@ def get_rcfile(pkg):
     Get path to file rcfile in preferences file if present.
     """
 
+    import configparser
 
     config = configparser.ConfigParser()
     config.read(pkg.get_configfiles())
@@ -936,6 +1138,8 @@ def source_syrthes_env(pkg, verbose=True, force=False):
     Source SYRTHES environment
     """
 
+    import configparser
+
     # Determine SYRTHES home
 
     syrthes_home = None
@@ -1122,6 +1326,10 @@ class batch_info:
             # In case of job array, check on first line
             rs = get_command_output(cmd)
             if rs:
+                try:
+                    from code_saturne.base import cs_batch
+                except Exception:
+                    import cs_batch
                 rtime = cs_batch.parse_wall_time_slurm(rs.splitlines()[0])
             else:
                 msg = "Error: command\n  " + cmd + "\n\n"
@@ -1495,6 +1703,8 @@ class mpi_environment:
 
         # Initialize options based on system-wide or user configuration
 
+        import configparser
+
         config = configparser.ConfigParser()
         config.read(pkg.get_configfiles())
 
@@ -1953,6 +2163,8 @@ class mpi_environment:
         # but these are cases on systems we have used in the past
         # but do not currently have access to).
 
+        import platform
+
         if platform.uname()[0] == 'AIX':
             if abs_exec_path('poe') != None:
                 self.mpiexec = 'poe'
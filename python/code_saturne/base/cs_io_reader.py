@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+
+#-------------------------------------------------------------------------------
+
+# This file is part of code_saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2024 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module defines a reader for code_saturne kernel I/O files
+("Code_Saturne I/O, BE, R0" format, used for checkpoint/restart,
+mesh_input and partition files), and a comparison of such files
+similar to that of "cs_io_dump --diff".
+
+Section bodies are accessed through a memory map of the file, so
+only the parts of the file actually used are read.
+
+The index of sections of a given file (name, location, type, number of
+values and offset of each section) is built by scanning section headers
+once, and cached so that files may be reopened without scanning them
+again. As directories such as mesh_input may be read in their entirety
+by the solver, the index is not stored beside the file, but in a user
+cache directory ($XDG_CACHE_HOME/code_saturne/cs_io_index, or
+~/.cache/code_saturne/cs_io_index), using a name based on the file's
+absolute path. A cached index is used only if the file's size and
+modification time match those recorded in the index.
+
+This module defines the following classes and functions:
+- cs_io_error
+- get_index_dir
+- get_index_path
+- section_info
+- cs_io_file
+- section_diff
+- compare_files
+"""
+
+#-------------------------------------------------------------------------------
+# Library modules import
+#-------------------------------------------------------------------------------
+
+import os
+import hashlib
+import json
+import mmap
+import struct
+
+import numpy
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+_base_header = b"Code_Saturne I/O, BE, R0"
+
+# Data types (data is always stored in big-endian form)
+
+_dtypes = {'c': numpy.dtype('S1'),
+           'i4': numpy.dtype('>i4'),
+           'i8': numpy.dtype('>i8'),
+           'u4': numpy.dtype('>u4'),
+           'u8': numpy.dtype('>u8'),
+           'r4': numpy.dtype('>f4'),
+           'r8': numpy.dtype('>f8')}
+
+# Number of values compared at once when comparing sections
+
+_block_size = 2 << 19
+
+# Version of cached index files (to increment if their format changes)
+
+_index_version = 1
+
+#-------------------------------------------------------------------------------
+# Utility class
+#-------------------------------------------------------------------------------
+
+class cs_io_error(Exception):
+    """Exception raised when a file is not a valid code_saturne I/O file."""
+    pass
+
+#-------------------------------------------------------------------------------
+
+def _align(offset, alignment):
+    """
+    Return offset aligned to given alignment.
+    """
+    if alignment > 0:
+        offset += (alignment - (offset % alignment)) % alignment
+    return offset
+
+#-------------------------------------------------------------------------------
+
+def _type_key(type_name):
+    """
+    Return the data type key matching a section's type name.
+    """
+    if type_name[0] == 'c':
+        return 'c'
+    elif type_name == 'i ':   # legacy type name
+        return 'i4'
+    elif type_name in _dtypes:
+        return type_name
+
+    raise cs_io_error('Type "' + type_name + '" is not known\n'
+                      + 'Known types: "c ", "i4", "i8", "u4", "u8", '
+                      + '"r4", "r8".')
+
+#-------------------------------------------------------------------------------
+
+def get_index_dir():
+    """
+    Return the directory in which section indexes are cached.
+    """
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'cs_io_index')
+
+#-------------------------------------------------------------------------------
+
+def get_index_path(path, index_dir=None):
+    """
+    Return the path of the cached section index for a given file.
+    """
+    if index_dir is None:
+        index_dir = get_index_dir()
+    abs_path = os.path.realpath(path)
+    key = hashlib.sha1(abs_path.encode('utf-8')).hexdigest()
+    return os.path.join(index_dir, key + '.json')
+
+#===============================================================================
+# Section header information
+#===============================================================================
+
+class section_info(object):
+    """
+    Description of a section of a code_saturne I/O file.
+    """
+
+    def __init__(self, name, n_vals, location_id, index_id,
+                 n_location_vals, type_name, offset, embedded):
+
+        self.name = name
+        self.n_vals = n_vals
+        self.location_id = location_id
+        self.index_id = index_id
+        self.n_location_vals = n_location_vals
+        self.type_name = type_name   # 2 character type name ("r8", ...)
+        self.offset = offset         # offset of data in file
+        self.embedded = embedded     # True if data is embedded in header
+
+    #---------------------------------------------------------------------------
+
+    def __repr__(self):
+        return '"%s"; Type: %s; Location: %d; Size: %d' \
+            % (self.name, self.type_name, self.location_id, self.n_vals)
+
+    #---------------------------------------------------------------------------
+
+    def to_list(self):
+        return [self.name, self.n_vals, self.location_id, self.index_id,
+                self.n_location_vals, self.type_name, self.offset,
+                self.embedded]
+
+#===============================================================================
+# Reader class
+#===============================================================================
+
+class cs_io_file(object):
+    """
+    Read-only access to a code_saturne kernel I/O file.
+    """
+
+    #---------------------------------------------------------------------------
+
+    def __init__(self, path, use_index_cache=True, index_dir=None):
+        """
+        Open file and build its sections index (or load it from
+        the cache if use_index_cache is True and it is up to date).
+        """
+
+        self.path = path
+        self.contents = None
+        self.header_size = 0
+        self.header_align = 0
+        self.body_align = 0
+        self.sections = []
+
+        self.__f = open(path, 'rb')
+        self.__map = None
+
+        try:
+            st = os.fstat(self.__f.fileno())
+            self.__file_stamp = [st.st_size, st.st_mtime_ns]
+
+            index_path = None
+            if use_index_cache:
+                index_path = get_index_path(path, index_dir)
+                if self.__load_index(index_path):
+                    return
+
+            self.__read_base_header()
+            self.__scan_sections()
+
+            if index_path:
+                self.__save_index(index_path)
+
+        except Exception:
+            self.close()
+            raise
+
+    #---------------------------------------------------------------------------
+
+    def __enter__(self):
+        return self
+
+    #---------------------------------------------------------------------------
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #---------------------------------------------------------------------------
+
+    def close(self):
+        """
+        Close file.
+        Arrays previously obtained through values() keep the file mapping
+        alive as long as they exist.
+        """
+        self.__map = None
+        if self.__f:
+            self.__f.close()
+            self.__f = None
+
+    #---------------------------------------------------------------------------
+
+    def __read_base_header(self):
+        """
+        Read file header ("magic string", contents and alignments).
+        """
+
+        buf = self.__f.read(128 + 24)
+
+        if len(buf) < 128 + 24 or buf[:64].rstrip(b'\0') != _base_header:
+            raise cs_io_error('File format of "' + self.path
+                              + '" is not recognized.')
+
+        self.contents = buf[64:128].split(b'\0')[0].decode('utf-8', 'replace')
+
+        self.header_size, self.header_align, self.body_align \
+            = struct.unpack('>3Q', buf[128:152])
+
+    #---------------------------------------------------------------------------
+
+    def __scan_sections(self):
+        """
+        Read all section headers (but not non-embedded section bodies).
+        """
+
+        f = self.__f
+        offset = 128 + 24
+        file_size = os.fstat(f.fileno()).st_size
+
+        while True:
+
+            offset = _align(offset, self.header_align)
+            if offset + self.header_size > file_size:
+                break
+
+            f.seek(offset)
+            buf = f.read(self.header_size)
+
+            h_vals = struct.unpack('>6Q', buf[:48])
+            if h_vals[0] > self.header_size:
+                buf += f.read(h_vals[0] - self.header_size)
+
+            n_vals = h_vals[1]
+            type_name = buf[48:56].decode('ascii', 'replace')
+            name = buf[56:56+h_vals[5]].split(b'\0')[0].decode('utf-8')
+
+            if n_vals == 0 and name == "EOF":
+                break
+
+            embedded = (n_vals > 0 and type_name[7] == 'e')
+            type_name = type_name[:2]
+
+            header_start = offset
+            offset += max(self.header_size, h_vals[0])
+
+            if embedded:
+                type_key = _type_key(type_name)
+                data_offset = header_start + 56 + h_vals[5]
+            elif n_vals > 0:
+                type_key = _type_key(type_name)
+                data_offset = _align(offset, self.body_align)
+                offset = data_offset + n_vals*_dtypes[type_key].itemsize
+            else:
+                data_offset = offset
+
+            self.sections.append(section_info(name,
+                                              n_vals,
+                                              h_vals[2],
+                                              h_vals[3],
+                                              h_vals[4],
+                                              type_name,
+                                              data_offset,
+                                              embedded))
+
+    #---------------------------------------------------------------------------
+
+    def __load_index(self, index_path):
+        """
+        Load sections index from cache. Return True if successful.
+        """
+        try:
+            with open(index_path, 'r') as f:
+                d = json.load(f)
+            if d['version'] != _index_version \
+               or d['path'] != os.path.realpath(self.path) \
+               or d['stamp'] != self.__file_stamp:
+                return False
+            self.contents = d['contents']
+            self.header_size, self.header_align, self.body_align \
+                = d['alignments']
+            self.sections = [section_info(*l) for l in d['sections']]
+        except Exception:
+            self.sections = []
+            return False
+
+        return True
+
+    #---------------------------------------------------------------------------
+
+    def __save_index(self, index_path):
+        """
+        Save sections index to cache (silently ignoring failures, as
+        the cache is only an optimization).
+        """
+        d = {'version': _index_version,
+             'path': os.path.realpath(self.path),
+             'stamp': self.__file_stamp,
+             'contents': self.contents,
+             'alignments': [self.header_size, self.header_align,
+                            self.body_align],
+             'sections': [s.to_list() for s in self.sections]}
+
+        try:
+            index_dir = os.path.dirname(index_path)
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+            # write to temporary file first so that concurrent readers
+            # never see a partially written index
+            tmp_path = index_path + '.' + str(os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(d, f)
+            os.replace(tmp_path, index_path)
+        except Exception:
+            pass
+
+    #---------------------------------------------------------------------------
+
+    def find(self, name, location_id=None):
+        """
+        Return first section matching a given name (and location if
+        given), or None.
+        """
+        for s in self.sections:
+            if s.name == name:
+                if location_id is None or location_id == s.location_id:
+                    return s
+        return None
+
+    #---------------------------------------------------------------------------
+
+    def get(self, name, location_id=None):
+        """
+        Return values of the first section matching a given name
+        (and location if given), or None if not present.
+        """
+        s = self.find(name, location_id)
+        if s is None:
+            return None
+        return self.values(s)
+
+    #---------------------------------------------------------------------------
+
+    def values(self, section):
+        """
+        Return a section's values as a read-only (big-endian) numpy array
+        view mapped on the file (data is not read until accessed, and
+        is never copied).
+        For character sections, a bytes object is returned.
+        """
+
+        if section.n_vals == 0:
+            if section.type_name[0] == 'c':
+                return b''
+            return numpy.zeros(0, dtype=_dtypes.get(section.type_name,
+                                                    _dtypes['i4']))
+
+        if self.__map is None:
+            self.__map = mmap.mmap(self.__f.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+        dtype = _dtypes[_type_key(section.type_name)]
+        a = numpy.frombuffer(self.__map, dtype=dtype, count=section.n_vals,
+                             offset=section.offset)
+
+        if section.type_name[0] == 'c':
+            return a.tobytes()
+
+        return a
+
+#===============================================================================
+# Comparison of files
+#===============================================================================
+
+class section_diff(object):
+    """
+    Differences between matching sections of two files.
+    """
+
+    def __init__(self, s1, s2):
+
+        self.name = s1.name
+        self.location_id = s1.location_id
+        self.type_name = (s1.type_name, s2.type_name)
+        self.n_vals = (s1.n_vals, s2.n_vals)
+
+        self.n_diffs = 0
+        self.max = 0.
+        self.mean = 0.
+        self.rel_max = 0.
+        self.rel_mean = 0.
+
+    #---------------------------------------------------------------------------
+
+    def size_differs(self):
+        return self.n_vals[0] != self.n_vals[1]
+
+    #---------------------------------------------------------------------------
+
+    def differs(self):
+        return self.n_diffs > 0 or not self.comparable()
+
+    #---------------------------------------------------------------------------
+
+    def comparable(self):
+        """
+        Check if sections have the same size and compatible types.
+        """
+        def compare_type(t):
+            if t[0] == 'u':
+                return 'i'
+            return t[0]
+
+        return (self.n_vals[0] == self.n_vals[1]) and \
+            compare_type(self.type_name[0]) == compare_type(self.type_name[1])
+
+#-------------------------------------------------------------------------------
+
+def _compare_sections(f1, f2, s1, s2, threshold):
+    """
+    Compare data from 2 sections with identical names and locations.
+    """
+
+    d = section_diff(s1, s2)
+
+    if (s1.n_vals == 0 and s2.n_vals == 0) or not d.comparable():
+        return d
+
+    v1 = f1.values(s1)
+    v2 = f2.values(s2)
+
+    if s1.type_name[0] == 'c':
+        if v1 != v2:
+            a1 = numpy.frombuffer(v1, dtype=numpy.uint8)
+            a2 = numpy.frombuffer(v2, dtype=numpy.uint8)
+            d.n_diffs = int(numpy.count_nonzero(a1 != a2))
+        return d
+
+    n_vals = s1.n_vals
+    is_real = (s1.type_name[0] == 'r')
+    sum_delta = 0.
+    sum_delta_r = 0.
+
+    for start in range(0, n_vals, _block_size):
+
+        end = min(start + _block_size, n_vals)
+
+        if is_real:
+            b1 = v1[start:end].astype(numpy.float64)
+            b2 = v2[start:end].astype(numpy.float64)
+            delta = numpy.abs(b1 - b2)
+            mask = delta > threshold
+            n = int(numpy.count_nonzero(mask))
+            if n > 0:
+                delta = delta[mask]
+                delta_r = delta / numpy.maximum(numpy.abs(b1[mask]),
+                                                numpy.abs(b2[mask]))
+                d.n_diffs += n
+                d.max = max(d.max, float(delta.max()))
+                d.rel_max = max(d.rel_max, float(delta_r.max()))
+                sum_delta += float(delta.sum())
+                sum_delta_r += float(delta_r.sum())
+
+        else:
+            b1 = v1[start:end].astype(numpy.int64)
+            b2 = v2[start:end].astype(numpy.int64)
+            d.n_diffs += int(numpy.count_nonzero(b1 != b2))
+
+    if d.n_diffs > 0 and is_real:
+        d.mean = sum_delta / d.n_diffs
+        d.rel_mean = sum_delta_r / d.n_diffs
+
+    return d
+
+#-------------------------------------------------------------------------------
+
+def compare_files(path1, path2, threshold=1.e-30, location_id=None,
+                  sec_name=None, use_index_cache=False):
+    """
+    Compare two code_saturne I/O files.
+
+    Sections are matched based on their name and location, and only
+    sections matching the optional location_id and sec_name filters
+    are considered. Two floating-point values are considered different
+    if their absolute difference is above threshold.
+
+    Section indexes are not cached by default, as compared files
+    (usually checkpoints from new runs) are rarely reopened.
+
+    Returns a tuple containing the list of section_diff objects for
+    sections which differ, and the lists of sections (section_info
+    objects) found only in the first and only in the second file.
+    """
+
+    diffs = []
+    unmatched1 = []
+    unmatched2 = []
+
+    def match_filter(s):
+        if sec_name != None and s.name != sec_name:
+            return False
+        if location_id != None and s.location_id != location_id:
+            return False
+        return True
+
+    with cs_io_file(path1, use_index_cache) as f1, \
+         cs_io_file(path2, use_index_cache) as f2:
+
+        sections2 = {}
+        for s2 in f2.sections:
+            if match_filter(s2):
+                key = (s2.name, s2.location_id)
+                if key in sections2:
+                    sections2[key].append(s2)
+                else:
+                    sections2[key] = [s2]
+
+        compared2 = set()
+
+        for s1 in f1.sections:
+            if not match_filter(s1):
+                continue
+            key = (s1.name, s1.location_id)
+            if not key in sections2:
+                unmatched1.append(s1)
+                continue
+            for s2 in sections2[key]:
+                d = _compare_sections(f1, f2, s1, s2, threshold)
+                if d.differs():
+                    diffs.append(d)
+                compared2.add(id(s2))
+
+        for s2 in f2.sections:
+            if match_filter(s2) and not id(s2) in compared2:
+                unmatched2.append(s2)
+
+    return diffs, unmatched1, unmatched2
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -704,12 +704,68 @@ class cs_math_parser:
 
     #---------------------------------------------------------------------------
 
+    def get_loop_locals(self, expression, known_symbols):
+        """
+        Determine local variables of an expression evaluated for each
+        element of a loop.
+
+        Returns the list of local variables (assigned in the expression
+        and not in known_symbols), and a boolean indicating whether each
+        of them is unconditionally assigned before being used, in which
+        case they may be declared inside the loop, and iterations are
+        independent.
+        """
+
+        segments = self.separate_segments(expression.split("\n"))
+        tokens, comments = self.tokenize(segments)
+        names = [t[0] for t in tokens]
+
+        local_vars = []
+        for t_i, tk in enumerate(names):
+            if tk == "=" and t_i > 0:
+                tk0 = names[t_i-1]
+                if tk0 not in known_symbols and tk0 not in local_vars:
+                    local_vars.append(tk0)
+
+        # A local variable does not carry state from one iteration to the
+        # next if its first occurrence is the target of an assignment
+        # starting an unconditional statement (at depth 0), and it does
+        # not appear in the assigned expression.
+
+        independent = True
+        for v in local_vars:
+            depth = 0
+            t_i = 0
+            while names[t_i] != v:
+                if names[t_i] in ('(', '{'):
+                    depth += 1
+                elif names[t_i] in (')', '}'):
+                    depth -= 1
+                t_i += 1
+            if depth != 0 or names[t_i+1] != '=':
+                independent = False
+            elif t_i > 0 and names[t_i-1] not in (';', '}'):
+                independent = False
+            else:
+                for tk in names[t_i+2:]:
+                    if tk == ';':
+                        break
+                    elif tk == v:
+                        independent = False
+            if not independent:
+                break
+
+        return local_vars, independent
+
+    #---------------------------------------------------------------------------
+
     def parse_expression(self, expression, req, known_symbols,
                          func_type, glob_tokens, loop_tokens,
-                         need_for_loop):
+                         need_for_loop, loop_locals=()):
         """
         Parse an expression and return the corresponding C code, as well as
         the initialization block which needs to be used.
+        Local variables in loop_locals are declared inside the loop.
         """
 
         usr_defs = []
@@ -758,15 +814,22 @@ class cs_math_parser:
         if len(usr_code) > 0:
             usr_code.append('\n')
 
+        loop_defs = []
         for t_i, t in enumerate(tokens):
             tk = t[0]
             # Check for assignments:
             if tk == "=" and t_i > 0:
                 tk0 = tokens[t_i-1][0]
                 if tk0 not in known_symbols:
-                    usr_defs.append('cs_real_t %s = -1.;\n' % tk0)
+                    if tk0 in loop_locals:
+                        loop_defs.append('cs_real_t %s = -1.;\n' % tk0)
+                    else:
+                        usr_defs.append('cs_real_t %s = -1.;\n' % tk0)
                     known_symbols.append(tk0)
 
+        if len(loop_defs) > 0:
+            usr_code += loop_defs + ['\n']
+
 
         req_to_replace = [elt for elt in req]
         for t_i, t in enumerate(tokens):
@@ -53,6 +53,8 @@ _file_header = \
 
 #include <assert.h>
 #include <math.h>
+#include <stdlib.h>
+#include <string.h>
 
 #if defined(HAVE_MPI)
 #include <mpi.h>
@@ -192,6 +194,13 @@ _func_short_to_long = {'vol': 'volume zone',
                        'pwa': 'Writer activation',
                        'pca': 'Postprocessing calculator'}
 
+# Function types for which formulas are dispatched through a sorted
+# table of static functions, and matching key arguments.
+
+_dispatch_keys = {'vol': ('fields_names', 'zone_name'),
+                  'bnd': ('field_name', 'zone_name', 'condition'),
+                  'src': ('name', 'zone_name', 'source_type')}
+
 #-------------------------------------------------------------------------------
 
 _pkg_fluid_prop_dict = {}
@@ -245,7 +254,8 @@ def parse_gui_expression(expression,
                          loop_tokens,
                          need_for_loop = False,
                          indent_decl = 2,
-                         indent_main = 3):
+                         indent_main = 3,
+                         loop_locals = ()):
 
     usr_code = ''
     usr_defs = ''
@@ -267,7 +277,8 @@ def parse_gui_expression(expression,
                                                    func_type,
                                                    glob_tokens,
                                                    loop_tokens,
-                                                   need_for_loop)
+                                                   need_for_loop,
+                                                   loop_locals)
 
     for exp in expr_user:
         usr_defs += indent_decl*tab + exp
@@ -295,6 +306,72 @@ def break_expression(exp):
 
     return expression_lines
 
+#-------------------------------------------------------------------------------
+
+def analyze_loop_expression(expression, known_symbols,
+                            glob_tokens, loop_tokens):
+    """
+    Check whether an expression evaluated for each element of a loop
+    may be evaluated for all elements independently.
+
+    Returns the local variables which may be declared inside the loop
+    (empty if iterations are not independent), and the OpenMP directive
+    to use for the loop, or None.
+    """
+    symbols = list(known_symbols) + list(glob_tokens.keys()) \
+        + list(loop_tokens.keys())
+
+    parser = cs_math_parser()
+    loop_locals, independent = parser.get_loop_locals(expression, symbols)
+
+    if not independent:
+        return [], None
+
+    pragma = 'pragma omp parallel for'
+    # Branches prevent most vectorization, so only request it otherwise
+    if not re.search(r'\b(if|else|while|for|do)\b|\?', expression):
+        pragma += ' simd'
+    pragma += ' if (n_elts > CS_THR_MIN)'
+
+    return loop_locals, pragma
+
+#-------------------------------------------------------------------------------
+
+def _function_arg_names(header):
+    """
+    Return argument names of a function header template.
+    """
+    args = header[header.index('(')+1:header.rindex(')')]
+
+    names = []
+    for a in args.split(','):
+        m = re.search(r'(\w+)\s*(\[.*\])?\s*$', a.strip())
+        names.append(m.group(1))
+
+    return names
+
+#-------------------------------------------------------------------------------
+
+def _rename_function_header(header, qualifier, name):
+    """
+    Rename the function of a function header template, keeping arguments
+    aligned.
+    """
+    lines = header.split('\n')
+
+    i = lines[1].index('(')
+    lines[0] = qualifier
+    lines[1] = name + lines[1][i:]
+    shift = len(name) - i
+    for j in range(2, len(lines)):
+        if lines[j][:i+1].strip() == '':
+            if shift > 0:
+                lines[j] = ' '*shift + lines[j]
+            else:
+                lines[j] = lines[j][-shift:]
+
+    return '\n'.join(lines)
+
 #===============================================================================
 # Main class
 #===============================================================================
@@ -531,6 +608,11 @@ class meg_to_c_interpreter:
 
         ntabs += 1
 
+        loop_locals, omp_pragma = analyze_loop_expression(expression,
+                                                          known_symbols,
+                                                          glob_tokens,
+                                                          loop_tokens)
+
         # Parse the user expression
         parsed_exp = parse_gui_expression(expression,
                                           required,
@@ -538,24 +620,24 @@ class meg_to_c_interpreter:
                                           'vol',
                                           glob_tokens,
                                           loop_tokens,
-                                          need_for_loop=True)
+                                          need_for_loop=True,
+                                          indent_decl=1,
+                                          indent_main=2,
+                                          loop_locals=loop_locals)
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
             usr_defs += parsed_exp[1]
 
-        # Write the block
-        nsplit = name.split('+')
-        usr_blck = tab + 'if (strcmp(fields_names, "%s") == 0 &&\n' % (name)
-        usr_blck += tab + '    strcmp(zone_name, "%s") == 0) {\n' % (zone)
-
-        usr_blck += usr_defs
+        # Write the block (body of the dispatched function)
+        usr_blck = usr_defs
 
-        usr_blck += 2*tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
-        usr_blck += 3*tab + 'cs_lnum_t c_id = elt_ids[e_id];\n'
+        if omp_pragma:
+            usr_blck += '#' + (len(tab)-1)*' ' + omp_pragma + '\n'
+        usr_blck += tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
+        usr_blck += 2*tab + 'cs_lnum_t c_id = elt_ids[e_id];\n'
 
         usr_blck += usr_code
 
-        usr_blck += 2*tab + '}\n'
         usr_blck += tab + '}\n'
 
         return usr_blck
@@ -647,30 +729,25 @@ class meg_to_c_interpreter:
                                           'bnd',
                                           glob_tokens,
                                           loop_tokens,
-                                          need_for_loop)
+                                          need_for_loop,
+                                          indent_decl=1,
+                                          indent_main=2)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
             usr_defs += parsed_exp[1]
 
-        # Write the block
-        block_cond  = tab + 'if (strcmp(field_name, "%s") == 0 &&\n' % (field_name)
-        block_cond += tab + '    strcmp(condition, "%s") == 0 &&\n' % (cname)
-        block_cond += tab + '    strcmp(zone_name, "%s") == 0) {\n' % (zone)
-        usr_blck = block_cond + '\n'
-
-        usr_blck += usr_defs
+        # Write the block (body of the dispatched function)
+        usr_blck = usr_defs
 
         if need_for_loop:
-            usr_blck += 2*tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
-            usr_blck += 3*tab + 'cs_lnum_t b_e_id = elt_ids[e_id];\n'
+            usr_blck += tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
+            usr_blck += 2*tab + 'cs_lnum_t b_e_id = elt_ids[e_id];\n'
 
         usr_blck += usr_code
 
         if need_for_loop:
-            usr_blck += 2*tab + '}\n'
-
-        usr_blck += tab + '}\n'
+            usr_blck += tab + '}\n'
 
         # Replace time table calls
         for _tt in self.time_tables.keys():
@@ -759,6 +836,11 @@ class meg_to_c_interpreter:
         for r in required:
             known_symbols.append(r)
 
+        loop_locals, omp_pragma = analyze_loop_expression(expression,
+                                                          known_symbols,
+                                                          glob_tokens,
+                                                          loop_tokens)
+
         # Parse the user expression
         parsed_exp = parse_gui_expression(expression,
                                           required,
@@ -766,26 +848,25 @@ class meg_to_c_interpreter:
                                           'src',
                                           glob_tokens,
                                           loop_tokens,
-                                          need_for_loop=True)
+                                          need_for_loop=True,
+                                          indent_decl=1,
+                                          indent_main=2,
+                                          loop_locals=loop_locals)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
             usr_defs += parsed_exp[1]
 
-        # Write the block
-        block_cond  = tab + 'if (strcmp(zone_name, "%s") == 0 &&\n' % (zone)
-        block_cond += tab + '    strcmp(name, "%s") == 0 && \n' % (name)
-        block_cond += tab + '    strcmp(source_type, "%s") == 0) {\n' % (source_type)
-        usr_blck = block_cond + '\n'
+        # Write the block (body of the dispatched function)
+        usr_blck = usr_defs
 
-        usr_blck += usr_defs
-
-        usr_blck += 2*tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
-        usr_blck += 3*tab + 'cs_lnum_t c_id = elt_ids[e_id];\n'
+        if omp_pragma:
+            usr_blck += '#' + (len(tab)-1)*' ' + omp_pragma + '\n'
+        usr_blck += tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
+        usr_blck += 2*tab + 'cs_lnum_t c_id = elt_ids[e_id];\n'
 
         usr_blck += usr_code
 
-        usr_blck += 2*tab + '}\n'
         usr_blck += tab + '}\n'
 
         # Replace time table calls
@@ -871,6 +952,11 @@ class meg_to_c_interpreter:
         for r in required:
             known_symbols.append(r)
 
+        loop_locals, omp_pragma = analyze_loop_expression(expression,
+                                                          known_symbols,
+                                                          glob_tokens,
+                                                          loop_tokens)
+
         # Parse the user expresion
         parsed_exp = parse_gui_expression(expression,
                                           required,
@@ -878,7 +964,8 @@ class meg_to_c_interpreter:
                                           'ini',
                                           glob_tokens,
                                           loop_tokens,
-                                          need_for_loop=True)
+                                          need_for_loop=True,
+                                          loop_locals=loop_locals)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -891,6 +978,8 @@ class meg_to_c_interpreter:
 
         usr_blck += usr_defs
 
+        if omp_pragma:
+            usr_blck += '#' + (2*len(tab)-1)*' ' + omp_pragma + '\n'
         usr_blck += 2*tab + 'for (cs_lnum_t e_id = 0; e_id < n_elts; e_id++) {\n'
         usr_blck += 3*tab + 'cs_lnum_t c_id = elt_ids[e_id];\n'
 
@@ -1352,6 +1441,108 @@ class meg_to_c_interpreter:
 
     #---------------------------------------------------------------------------
 
+    def dispatch_key(self, func_type, func_key):
+        """
+        Return the values of the key arguments (see _dispatch_keys) for
+        which a given formula applies.
+        """
+        zone, name = func_key.split('::')
+        func_params = self.funcs[func_type][func_key]
+
+        if func_type == 'vol':
+            return (name, zone)
+        elif func_type == 'bnd':
+            return (name, zone, func_params['cnd'])
+        elif func_type == 'src':
+            return (name, zone, func_params['tpe'])
+
+    #---------------------------------------------------------------------------
+
+    def write_dispatch_function(self, func_type):
+        """
+        Write one static function per formula, and a main function
+        calling the matching static function using a binary search
+        in a table sorted by key arguments.
+        """
+        header = _function_header[func_type]
+        arg_names = _function_arg_names(header)
+        keys = _dispatch_keys[func_type]
+
+        code = ''
+        entries = []
+
+        for key in self.funcs[func_type].keys():
+            w_block = self.write_block(func_type, key)
+            if w_block is None:
+                continue
+
+            f_name = '_meg_%s_%d' % (func_type, len(entries))
+
+            zone_name, var_name = key.split('::')
+            m1 = _block_comments[func_type] % (var_name.replace("+", ", "),
+                                               zone_name)
+            code += '/*' + '-'*76 + '\n'
+            code += ' * ' + m1 + '\n'
+            code += ' *' + '-'*76 + '*/\n\n'
+            code += _rename_function_header(header, 'static void', f_name)
+            code += w_block
+            code += '}\n\n'
+
+            entries.append((self.dispatch_key(func_type, key), f_name))
+
+        if len(entries) == 0:
+            return code + header
+
+        # C strcmp ordering is that of UTF-8 encoded bytes
+        entries.sort(key=lambda e: tuple(k.encode('utf-8') for k in e[0]))
+
+        code += '/*' + '-'*76 + '\n'
+        code += ' * Formulas table, sorted by (%s)\n' % ', '.join(keys)
+        code += ' *' + '-'*76 + '*/\n\n'
+
+        f_type = _rename_function_header(header, 'typedef void', '(_meg_func_t)')
+        code += f_type[:f_type.rindex(')')+1] + ';\n\n'
+
+        code += 'typedef struct {\n'
+        code += '  const char    *keys[%d];\n' % len(keys)
+        code += '  _meg_func_t   *func;\n'
+        code += '} _meg_entry_t;\n\n'
+
+        code += 'static const _meg_entry_t _meg_table[] = {\n'
+        for i, (k, f_name) in enumerate(entries):
+            sep = ',' if i < len(entries) - 1 else ''
+            code += '  {{%s}, %s}%s\n' \
+                    % (', '.join('"%s"' % v for v in k), f_name, sep)
+        code += '};\n\n'
+
+        code += 'static int\n'
+        code += '_meg_compare(const void  *a,\n'
+        code += '             const void  *b)\n'
+        code += '{\n'
+        code += '  const _meg_entry_t *ea = a, *eb = b;\n'
+        code += '  for (int i = 0; i < %d; i++) {\n' % len(keys)
+        code += '    int c = strcmp(ea->keys[i], eb->keys[i]);\n'
+        code += '    if (c != 0)\n'
+        code += '      return c;\n'
+        code += '  }\n'
+        code += '  return 0;\n'
+        code += '}\n\n'
+
+        code += '/*' + '-'*76 + '*/\n\n'
+
+        code += header
+        code += '  const _meg_entry_t key = {{%s}, NULL};\n' % ', '.join(keys)
+        code += '  const _meg_entry_t *e\n'
+        code += '    = bsearch(&key, _meg_table, %d, sizeof(_meg_entry_t),\n' \
+                % len(entries)
+        code += '              _meg_compare);\n\n'
+        code += '  if (e != NULL)\n'
+        code += '    e->func(%s);\n' % ', '.join(arg_names)
+
+        return code
+
+    #---------------------------------------------------------------------------
+
     def write_block(self, func_type, key):
 
         # Check if function exists
@@ -2353,7 +2544,7 @@ class meg_to_c_interpreter:
 
     #---------------------------------------------------------------------------
 
-    def check_meg_code_syntax(self, function_name):
+    def check_meg_code_syntax(self, function_name, n_jobs=None):
 
         if not os.path.exists(self.tmp_path):
             os.makedirs(self.tmp_path)
@@ -2368,11 +2559,11 @@ class meg_to_c_interpreter:
 
         from code_saturne.base import cs_compile
 
-        cwd = os.getcwd()
-        os.chdir(self.tmp_path)
+        # Do not change the working directory, as this may be called
+        # from a worker thread.
 
-        out = open('comp.out', 'w')
-        err = open('comp.err', 'w')
+        out = open(os.path.join(self.tmp_path, 'comp.out'), 'w')
+        err = open(os.path.join(self.tmp_path, 'comp.err'), 'w')
 
         solver = "cs_solver" + self.case['package'].config.exeext
         if self.case.module_name() == 'neptune_cfd':
@@ -2383,14 +2574,16 @@ class meg_to_c_interpreter:
                                                        self.tmp_path,
                                                        opt_cflags='-w',
                                                        stdout=out,
-                                                       stderr=err)
+                                                       stderr=err,
+                                                       n_jobs=n_jobs)
         out.close()
         err.close()
 
         n_errors = 0
         msg = ''
         if compilation_test != 0:
-            errors = open('comp.err', 'r').readlines()
+            errors = open(os.path.join(self.tmp_path, 'comp.err'),
+                          'r').readlines()
             for i in range(len(errors)):
                 if ': ' in errors[i]:
                     msg += errors[i].split(': ')[-1].strip()+'\n'
@@ -2400,8 +2593,6 @@ class meg_to_c_interpreter:
                 for i in range(len(errors)):
                     msg += errors[i].strip()+'\n'
 
-        os.chdir(cwd)
-
         return compilation_test, msg, n_errors
 
     #---------------------------------------------------------------------------
@@ -2488,6 +2679,37 @@ class meg_to_c_interpreter:
 
     #---------------------------------------------------------------------------
 
+    def write_blocks(self, func_type):
+        """
+        Write all formula blocks of a given function type, in sequence.
+        """
+        code = ''
+        k_count = 0
+        for key in self.funcs[func_type].keys():
+            w_block = self.write_block(func_type, key)
+            if w_block is None:
+                continue
+            zone_name, var_name = key.split('::')
+            var_name = var_name.replace("+", ", ")
+            if zone_name != 'None':
+                m1 = _block_comments[func_type] % (var_name, zone_name)
+            else:
+                m1 = _block_comments[func_type] % (var_name)
+            m2 = '  -' + '-'*len(m1) + ' */\n\n'
+            m1 = '/* ' + m1 + '\n'
+
+            if k_count > 0:
+                code += '\n'
+            code += '  ' + m1
+            code += '  ' + m2
+            code += w_block
+
+            k_count += 1
+
+        return code
+
+    #---------------------------------------------------------------------------
+
     def save_function(self, func_type, hard_path = None):
 
         # Delete previous existing file
@@ -2505,28 +2727,11 @@ class meg_to_c_interpreter:
 #            if self.module_name != "code_saturne":
 #                code_to_write += _file_header2
             code_to_write += _file_header3
-            code_to_write += _function_header[func_type]
-            k_count = 0
-            for key in self.funcs[func_type].keys():
-                w_block = self.write_block(func_type, key)
-                if w_block is None:
-                    continue
-                zone_name, var_name = key.split('::')
-                var_name = var_name.replace("+", ", ")
-                if zone_name != 'None':
-                    m1 = _block_comments[func_type] % (var_name, zone_name)
-                else:
-                    m1 = _block_comments[func_type] % (var_name)
-                m2 = '  -' + '-'*len(m1) + ' */\n\n'
-                m1 = '/* ' + m1 + '\n'
-
-                if k_count > 0:
-                    code_to_write += '\n'
-                code_to_write += '  ' + m1
-                code_to_write += '  ' + m2
-                code_to_write += w_block
-
-                k_count += 1
+            if func_type in _dispatch_keys:
+                code_to_write += self.write_dispatch_function(func_type)
+            else:
+                code_to_write += _function_header[func_type]
+                code_to_write += self.write_blocks(func_type)
 
             code_to_write += _file_footer
 
@@ -23,7 +23,6 @@
 
 #-------------------------------------------------------------------------------
 
-import configparser
 import os
 import sys
 
@@ -35,6 +34,80 @@ except Exception:
 r_config_file_path = None
 r_config_dict = {}
 
+#-------------------------------------------------------------------------------
+
+def get_config_snapshot_path(config_file):
+    """
+    Return the path of the snapshot of a given build configuration file.
+    """
+    import zlib
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+
+    path = os.path.abspath(config_file)
+    name = '%08x-py%d%d.marshal' % (zlib.crc32(path.encode('utf-8')),
+                                    sys.version_info.major,
+                                    sys.version_info.minor)
+
+    return os.path.join(cache_dir, 'code_saturne', 'config', name)
+
+#-------------------------------------------------------------------------------
+
+def read_config_file(config_file):
+    """
+    Read a build configuration file, returning a dictionnary of sections.
+
+    As parsing the file is a significant part of the startup time of
+    most commands, the resulting dictionnary is saved in a snapshot
+    which is used as long as the file is not modified.
+    """
+    import marshal
+
+    path = os.path.abspath(config_file)
+    try:
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+    except Exception:
+        stamp = None
+
+    snapshot_path = get_config_snapshot_path(path)
+
+    if stamp:
+        try:
+            with open(snapshot_path, 'rb') as f:
+                snapshot = marshal.load(f)
+            if snapshot['path'] == path and snapshot['stamp'] == stamp:
+                return snapshot['config']
+        except Exception:
+            pass
+
+    import configparser
+
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    config_dict = {}
+    for s in config_parser:
+        config_dict[s] = dict(config_parser[s])
+
+    # Save snapshot (silently ignoring failures, as it is only
+    # an optimization)
+
+    if stamp:
+        try:
+            os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+            tmp_path = snapshot_path + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                marshal.dump({'path': path,
+                              'stamp': stamp,
+                              'config': config_dict}, f)
+            os.replace(tmp_path, snapshot_path)
+        except Exception:
+            pass
+
+    return config_dict
+
 # Package information
 #--------------------
 
@@ -58,9 +131,7 @@ class package:
         config_dict = r_config_dict
 
         if config_file and config_file != r_config_file_path:
-            config_parser = configparser.ConfigParser()
-            config_parser.read(config_file)
-            config_dict = dict(config_parser)
+            config_dict = read_config_file(config_file)
             if alternate_config == False:  # Cache result in case of new call
                 r_config_file_path = config_file
                 r_config_dict = config_dict
@@ -106,7 +106,7 @@ def load_case_setup_from_xml(xml_file, pkg=None):
     # internal functions of code_saturne to properly initialize the
     # xml structure
     case_setup.xmlCleanAllBlank(case_setup.xmlRootNode())
-    XMLinit(case_setup).initialize()
+    XMLinit(case_setup, use_cache=True).initialize()
 
     return case_setup
 
@@ -35,14 +35,6 @@ import platform
 from optparse import OptionParser
 from datetime import datetime, date
 
-import smtplib
-
-from email.utils import COMMASPACE, formatdate
-from email import encoders
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-
 #-------------------------------------------------------------------------------
 # Application modules import
 #-------------------------------------------------------------------------------
@@ -94,6 +86,12 @@ def process_cmd_line(argv, pkg):
     parser.add_option("--n-procs",  dest="n_procs", default=None, type="int",
                       help="Optional number of processes requested for the computations")
 
+    parser.add_option("-j", "--jobs", dest="n_jobs", default=1, type="int",
+                      help="maximum number of concurrent jobs on the local resource (cases staged, run, compared or checked, figures rendered) (default 1)")
+
+    parser.add_option("--max-procs", dest="max_procs", default=None, type="int",
+                      help="maximum total number of processes used by concurrent cases (default: available processes)")
+
     parser.add_option("-n", "--n-iterations", dest="n_iterations",
                       type="int", help="maximum number of iterations for cases of the study")
 
@@ -128,6 +126,10 @@ def process_cmd_line(argv, pkg):
                       action="store_true", dest="remove_existing", default=False,
                       help="remove existing run directories")
 
+    parser.add_option("--no-reuse",
+                      action="store_false", dest="reuse_results", default=True,
+                      help="run cases even if a previous run with identical inputs (case and mesh files, arguments, installed solver) is available")
+
     parser.add_option("--dow",
                       action="store_true", dest="disable_overwrite", default=False,
                       help="disable overwriting files in DATA, SRC, MESH and POST directories")
@@ -234,6 +236,14 @@ def send_mail(send_from, send_to, subject, text, files=[], server="localhost"):
     """
     Send the report by mail.
     """
+    import smtplib
+
+    from email.utils import COMMASPACE, formatdate
+    from email import encoders
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.base import MIMEBase
+    from email.mime.text import MIMEText
+
     assert type(send_to) == list
     assert type(files)   == list
 
@@ -247,7 +257,7 @@ def send_mail(send_from, send_to, subject, text, files=[], server="localhost"):
     for f in files:
         part = MIMEBase('application', "octet-stream")
         part.set_payload( open(f,"rb").read())
-        Encoders.encode_base64(part)
+        encoders.encode_base64(part)
         part.add_header('Content-Disposition',
                         'attachment; filename="%s"' % os.path.basename(f))
         msg.attach(part)
@@ -69,11 +69,13 @@ except:
     from code_saturne.gui.base.NewCaseDialogForm import Ui_NewCaseDialogForm
 
 from code_saturne.gui.base import QtCase
+from code_saturne.gui.base.QtTask import runTask, TaskCancelled
 from code_saturne.gui.base.QtPage import getexistingdirectory
 from code_saturne.gui.base.QtPage import from_qvariant, to_text_string, getopenfilename, getsavefilename
 
 from code_saturne.gui.base.BrowserView import BrowserView
-from code_saturne.gui.base.Toolbox import displaySelectedPage
+from code_saturne.gui.base.Toolbox import displaySelectedPage, releasePage
+from code_saturne.gui.base.Toolbox import prewarmPages
 from code_saturne.model import XMLengine
 from code_saturne.model.XMLinitialize import *
 from code_saturne.model.XMLinitializeNeptune import *
@@ -451,6 +453,9 @@ class MainView(object):
         self.updateRecentFileMenu()
         QTimer.singleShot(0, self.loadInitialFile)
 
+        # Import page modules in the background once the window is shown
+        QTimer.singleShot(1000, prewarmPages)
+
         self.statusbar.setSizeGripEnabled(False)
         self.statusbar.showMessage(self.tr("Ready"), 5000)
         self.actionRedo.setEnabled(False)
@@ -624,13 +629,13 @@ class MainView(object):
         if not hasattr(self, 'case'):
             self.case = QtCase.QtCase(package=self.package)
             self.case.root()['version'] = self.XML_DOC_VERSION
-            self.initCase()
+            msg, self.package = self.initCase(use_cache=True)
 
             self.Browser.configureTree(self.case)
             self.dockWidgetBrowserDisplay(True)
 
             self.case['salome'] = self.salome
-            self.scrollArea.setWidget(self.displayFirstPage())
+            self.setPage(self.displayFirstPage())
             self.case['saved'] = "yes"
 
             self.case.undo_signal.connect(self.slotUndoRedoView)
@@ -733,20 +738,22 @@ class MainView(object):
         fn = os.path.basename(file_name)
         log.debug("loadFile -> %s" % file_name)
 
-        # XML syntax checker
+        # XML syntax check and case instantiation, in a worker thread
 
-        msg =  XMLengine.xmlChecker(file_name)
+        try:
+            msg, case = runTask(self, self.tr("Loading %s..." % fn),
+                                self.readCase, file_name)
+        except TaskCancelled:
+            self.statusbar.showMessage(self.tr("Loading aborted"), 2000)
+            return
         if msg:
             self.loadingAborted(msg, fn)
             return
-
-        # Instantiate a new case
-        try:
-            self.case = QtCase.QtCase(package=self.package, file_name=file_name)
-        except:
+        if case is None:
             msg = self.tr("This file is not in accordance with XML specifications.")
             self.loadingAborted(msg, fn)
             return
+        self.case = case
 
         # Check if legacy conjugate heat transfer node is present. If so, display warning.
         node_cht = self.case.xmlGetNode("conjugate_heat_transfer")
@@ -790,10 +797,17 @@ class MainView(object):
         mdl = ScriptRunningModel(self.case)
         self.case['run_type'] = getRunType(self.case)
 
-        msg = self.initCase()
+        try:
+            msg, package = runTask(self, self.tr("Initializing %s..." % fn),
+                                   self.initCase, use_cache=True)
+        except TaskCancelled:
+            delattr(self, 'case')
+            self.statusbar.showMessage(self.tr("Loading aborted"), 2000)
+            return
 
         # All checks are fine, wan can continue...
 
+        self.package = package
         self.addRecentFile(fn)
         self.Browser.configureTree(self.case)
         self.dockWidgetBrowserDisplay(True)
@@ -806,7 +820,7 @@ class MainView(object):
         msg = self.tr("Loaded: %s" % fn)
         self.statusbar.showMessage(msg, 2000)
 
-        self.scrollArea.setWidget(self.displayFirstPage())
+        self.setPage(self.displayFirstPage())
 
         self.case['saved'] = "yes"
 
@@ -822,6 +836,27 @@ class MainView(object):
         self.updateTitleBar()
 
 
+    def readCase(self, file_name):
+        """
+        Check the syntax of a file of parameters and read it
+        (may be called in a worker thread).
+        Return an error message and the case (None if not readable).
+        """
+        msg = XMLengine.xmlChecker(file_name)
+        if msg:
+            return msg, None
+
+        try:
+            case = QtCase.QtCase(package=self.package, file_name=file_name)
+        except Exception:
+            return "", None
+
+        # The case must belong to the GUI thread to receive signals
+        case.moveToThread(QCoreApplication.instance().thread())
+
+        return "", case
+
+
     def updateTitleBar(self):
         """
         Update Icon, Window Title Name and package name.
@@ -1068,12 +1103,22 @@ class MainView(object):
             if self.case.module_name() == 'neptune_cfd':
                 solver = "nc_solver" + self.package.config.exeext
 
-            state = cs_compile.compile_and_link(self.case['package'],
-                                                solver,
-                                                src_dir,
-                                                destdir=None,
-                                                stdout=out,
-                                                stderr=err)
+            try:
+                state = runTask(self, self.tr("Compiling user functions..."),
+                                cs_compile.compile_and_link,
+                                self.case['package'],
+                                solver,
+                                src_dir,
+                                destdir=None,
+                                stdout=out,
+                                stderr=err)
+            except TaskCancelled:
+                out.close()
+                err.close()
+                os.chdir(ori_dir)
+                msg = self.tr("Compilation aborted")
+                self.statusbar.showMessage(msg, 2000)
+                return
 
             out.close()
             err.close()
@@ -1184,7 +1229,8 @@ class MainView(object):
             return
 
         self.updateTitleBar()
-        self.case.xmlSaveDocument()
+        runTask(self, self.tr("Saving %s..." % file_name),
+                self.case.xmlSaveDocument, cancellable=False)
         self.jobFileSave()
 
         # force to blank after save
@@ -1221,7 +1267,8 @@ class MainView(object):
                 self.addRecentFile(f)
                 self.fileSave()
                 self.updateTitleBar()
-                self.case.xmlSaveDocument()
+                runTask(self, self.tr("Saving %s..." % f),
+                        self.case.xmlSaveDocument, cancellable=False)
                 self.jobFileSave()
                 self.updateTitleBar()
 
@@ -1476,7 +1523,7 @@ class MainView(object):
                                          self.Browser)
 
         if self.page is not None:
-            self.scrollArea.setWidget(self.page)
+            self.setPage(self.page)
 
         else:
             log.debug("displayNewPage() self.page is None")
@@ -1486,6 +1533,18 @@ class MainView(object):
         self.Browser.treeView.setExpanded(index, True)
 
 
+    def setPage(self, page):
+        """
+        Display a page in the main area. The previous page is deleted,
+        unless it is kept in the cache of pages.
+        """
+        old_page = self.scrollArea.takeWidget()
+        self.scrollArea.setWidget(page)
+        if old_page is not None and old_page is not page:
+            if not hasattr(self, 'case') or not releasePage(old_page, self.case):
+                old_page.deleteLater()
+
+
     def saveUserFormulaInC(self):
         """
         Save user defined laws with MEI to C functions
@@ -1728,20 +1787,29 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
         self.updateTitleBar()
 
 
-    def initCase(self):
+    def initCase(self, use_cache=False):
         """
         Initializes the new case with default xml nodes.
-        If previous case, just check if all mandatory nodes exist.
+        If previous case, just check if all mandatory nodes exist
+        (may be called in a worker thread).
+        Cached initialization results may be used only if the case
+        has just been created or read (see XMLinit).
+        Return an error message and the package matching the case.
         """
 
         prepro_only = self.case['run_type'] != 'standard'
         from code_saturne.base.cs_package import package as cs_package
         if self.case.xmlRootNode().tagName == "NEPTUNE_CFD_GUI" :
-            self.package = cs_package(name = "neptune_cfd")
-            return XMLinitNeptune(self.case).initialize(prepro_only)
+            package = cs_package(name = "neptune_cfd")
+            msg = XMLinitNeptune(self.case, use_cache).initialize(prepro_only)
         elif self.case.xmlRootNode().tagName == "Code_Saturne_GUI" :
-            self.package = cs_package()
-            return XMLinit(self.case).initialize(prepro_only)
+            package = cs_package()
+            msg = XMLinit(self.case, use_cache).initialize(prepro_only)
+        else:
+            package = self.package
+            msg = None
+
+        return msg, package
 
 
     def displayFirstPage(self):
@@ -1891,15 +1959,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                              python_record[1],
                                              python_record[2]])
 
-            last_record = self.case['undo'].pop()
-            self.case.record_func_prev = None
-            self.case.xml_prev = ""
-            self.case['redo'].append([last_record[0],
-                                      self.case.toString(),
-                                      last_record[2],
-                                      last_record[3]])
-
-            self.case.parseString(last_record[1])
+            last_record = self.case.undoLastRecord()
             self.Browser.activeSelectedPage(last_record[2])
             self.Browser.configureTree(self.case)
             self.case['current_index'] = last_record[2]
@@ -1912,7 +1972,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                     self.case,
                                     stbar=self.statusbar,
                                     tree=self.Browser)
-            self.scrollArea.setWidget(p)
+            self.setPage(p)
 
 
     def slotRedo(self):
@@ -1925,15 +1985,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                              python_record[1],
                                              python_record[2]])
 
-            last_record = self.case['redo'].pop()
-            self.case.record_func_prev = None
-            self.case.xml_prev = ""
-            self.case['undo'].append([last_record[0],
-                                      self.case.toString(),
-                                      last_record[2],
-                                      last_record[3]])
-
-            self.case.parseString(last_record[1])
+            last_record = self.case.redoLastRecord()
             self.Browser.activeSelectedPage(last_record[2])
             self.Browser.configureTree(self.case)
             self.case['current_index'] = last_record[2]
@@ -1946,7 +1998,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                     self.case,
                                     stbar=self.statusbar,
                                     tree=self.Browser)
-            self.scrollArea.setWidget(p)
+            self.setPage(p)
 
 
     def slotUndoRedoView(self):
@@ -61,6 +61,11 @@ class QtCase(Case, QObject):
         Case.__init__(self, package, file_name, studymanager)
         QObject.__init__(self)
 
+        # Changes are recorded in the journal of the last undo record
+        # (None when no record is open, in which case a new record is
+        # forced by the next change made through the models).
+        self.journal = None
+
 
     def undoStop(self):
         self.record_local = True
@@ -78,10 +83,69 @@ class QtCase(Case, QObject):
         self.record_global = True
 
 
+    def undoNewRecord(self):
+        """
+        Open a new undo record. Its journal holds the changes made from
+        now on, so that undoing it only reverts those changes.
+        """
+        self.journal = []
+        self['undo'].append([self['current_page'], self.journal,
+                             self['current_index'], self['current_tab']])
+
+        # New changes invalidate the redo records
+        self['redo'] = []
+        self['python_redo'] = []
+
+
+    def undoLastRecord(self):
+        """
+        Revert the changes of the last undo record, move it to the
+        redo records, and return it.
+        """
+        record = self['undo'].pop()
+        self.journalRevert(record[1])
+        self['redo'].append(record)
+        self.record_func_prev = None
+        self.record_argument_prev = None
+        self.journal = None
+        return record
+
+
+    def redoLastRecord(self):
+        """
+        Replay the changes of the last redo record, move it back to the
+        undo records, and return it.
+        """
+        record = self['redo'].pop()
+        self.journalReplay(record[1])
+        self['undo'].append(record)
+        self.record_func_prev = None
+        self.record_argument_prev = None
+        self.journal = None
+        return record
+
+
+    def journalChange(self, change):
+        """
+        Record an elementary change in the journal of the open undo record.
+
+        Changes made when no record is open (such as default values created
+        when a page is displayed again after an undo operation) cannot be
+        undone, and redo records could not be replayed consistently with
+        them, so the redo records are discarded.
+        """
+        if self.journal is not None:
+            self.journal.append(change)
+        elif self['redo']:
+            self['redo'] = []
+            self['python_redo'] = []
+            self.undo_signal.emit()
+
+
     def undoGlobal(self, f, c):
         if self['current_page'] != '' and self.record_local == False and self.record_global == True:
             self['dump_python'].append([f.__module__, f.__name__, c])
-            if self.xml_prev != self.toString() or self.xml_prev == "":
+            if self.journal is None or self.journal:
                 # control if function have same arguments
                 # last argument is value
                 same = True
@@ -95,8 +159,7 @@ class QtCase(Case, QObject):
                 if same:
                     pass
                 else:
-                    self['undo'].append([self['current_page'], self.toString(), self['current_index'], self['current_tab']])
-                    self.xml_prev = self.toString()
+                    self.undoNewRecord()
                     self.record_func_prev = None
                     self.record_argument_prev = c
                     self.undo_signal.emit()
@@ -105,7 +168,7 @@ class QtCase(Case, QObject):
     def undo(self, f, c):
         if self['current_page'] != '' and self.record_local == False and self.record_global == True:
             self['dump_python'].append([f.__module__, f.__name__, c])
-            if self.xml_prev != self.toString():
+            if self.journal is None or self.journal:
                 # control if function have same arguments
                 # last argument is value
                 same = True
@@ -121,8 +184,7 @@ class QtCase(Case, QObject):
                 else:
                     self.record_func_prev = f
                     self.record_argument_prev = c
-                    self['undo'].append([self['current_page'], self.toString(), self['current_index'], self['current_tab']])
-                    self.xml_prev = self.toString()
+                    self.undoNewRecord()
                     self.undo_signal.emit()
 
 
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of code_saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2024 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module runs long operations (file loading and saving, compilation)
+in a worker thread, so that the GUI remains responsive.
+
+This module defines the following classes and functions:
+- TaskCancelled
+- TaskSignals
+- Task
+- runTask
+"""
+
+#-------------------------------------------------------------------------------
+# Library modules import
+#-------------------------------------------------------------------------------
+
+import sys, logging
+
+#-------------------------------------------------------------------------------
+# Third-party modules
+#-------------------------------------------------------------------------------
+
+from code_saturne.gui.base.QtCore    import *
+from code_saturne.gui.base.QtWidgets import *
+
+#-------------------------------------------------------------------------------
+# Application modules import
+#-------------------------------------------------------------------------------
+
+from code_saturne.model.Common import GuiParam
+
+#-------------------------------------------------------------------------------
+# log config
+#-------------------------------------------------------------------------------
+
+logging.basicConfig()
+log = logging.getLogger("QtTask")
+log.setLevel(GuiParam.DEBUG)
+
+#-------------------------------------------------------------------------------
+# Exception raised when a task is cancelled by the user
+#-------------------------------------------------------------------------------
+
+class TaskCancelled(Exception):
+    """
+    Exception raised by runTask when the task is cancelled.
+    """
+    pass
+
+#-------------------------------------------------------------------------------
+# Task signals (QRunnable is not a QObject)
+#-------------------------------------------------------------------------------
+
+class TaskSignals(QObject):
+    """
+    Signals emitted by a task from its worker thread.
+    """
+    finished = pyqtSignal()
+    progress = pyqtSignal(str)
+
+#-------------------------------------------------------------------------------
+# Task run in a worker thread
+#-------------------------------------------------------------------------------
+
+class Task(QRunnable):
+    """
+    Call a function in a worker thread of the global QThreadPool.
+    The function may report progress using the setProgress method
+    of the task, which is passed as the "task" keyword argument
+    if pass_task is True.
+    """
+    def __init__(self, function, args=(), kwargs={}, pass_task=False):
+        """
+        Constructor.
+        """
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)
+
+        self.function = function
+        self.args = args
+        self.kwargs = dict(kwargs)
+        if pass_task:
+            self.kwargs['task'] = self
+
+        self.signals = TaskSignals()
+        self.result = None
+        self.exc_info = None
+        self.cancelled = False
+
+
+    def run(self):
+        """
+        Run the function (called in the worker thread).
+        """
+        try:
+            self.result = self.function(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        self.signals.finished.emit()
+
+
+    def setProgress(self, text):
+        """
+        Report progress (may be called from the worker thread).
+        """
+        self.signals.progress.emit(text)
+
+
+    def isCancelled(self):
+        """
+        Return True if the task was cancelled, so that functions
+        may stop early.
+        """
+        return self.cancelled
+
+
+    def cancel(self):
+        """
+        Cancel the task: commands run by the task (such as compilers)
+        are terminated, and its result is discarded.
+        """
+        log.debug("cancel()")
+        self.cancelled = True
+        self.terminateCommands()
+
+
+    def terminateCommands(self):
+        """
+        Terminate commands run by the task, if it was cancelled
+        (commands may still be started until the function returns).
+        """
+        if self.cancelled:
+            from code_saturne.base.cs_exec_environment import terminate_commands
+            terminate_commands()
+
+#-------------------------------------------------------------------------------
+# Run a task, showing its progress
+#-------------------------------------------------------------------------------
+
+def runTask(parent, label, function, *args, **kwargs):
+    """
+    Run a function in a worker thread, processing GUI events and showing
+    a progress dialog (allowing cancellation unless the "cancellable"
+    keyword argument is False) while it runs.
+    Return the function's result, re-raise its exceptions,
+    or raise TaskCancelled if cancelled by the user.
+
+    When cancelled, this function still waits for the worker thread
+    to return (terminating commands it runs), so that the caller may
+    safely clean up or start another task.
+    """
+    pass_task = kwargs.pop('pass_task', False)
+    cancellable = kwargs.pop('cancellable', True)
+    task = Task(function, args, kwargs, pass_task=pass_task)
+
+    dialog = QProgressDialog(label, parent.tr("Cancel"), 0, 0, parent)
+    if not cancellable:
+        dialog.setCancelButton(None)
+    dialog.setWindowModality(Qt.WindowModal)
+    dialog.setMinimumDuration(500)
+    dialog.setAutoClose(False)
+    dialog.setAutoReset(False)
+
+    # After cancellation, commands started later by the task
+    # are also terminated, until it returns.
+
+    timer = QTimer()
+    timer.setInterval(100)
+    timer.timeout.connect(task.terminateCommands)
+
+    def _cancel():
+        if not task.cancelled:
+            task.signals.progress.disconnect(dialog.setLabelText)
+        dialog.setLabelText(parent.tr("Cancelling..."))
+        task.cancel()
+        timer.start()
+
+    loop = QEventLoop()
+    task.signals.finished.connect(loop.quit)
+    task.signals.progress.connect(dialog.setLabelText)
+    dialog.canceled.connect(_cancel)
+
+    QThreadPool.globalInstance().start(task)
+    loop.exec_()
+
+    # Closing a progress dialog also emits its "canceled" signal
+    timer.stop()
+    dialog.canceled.disconnect(_cancel)
+    dialog.close()
+    dialog.deleteLater()
+
+    if task.cancelled:
+        raise TaskCancelled()
+    if task.exc_info:
+        raise task.exc_info[1].with_traceback(task.exc_info[2])
+
+    return task.result
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -23,10 +23,19 @@
 #-------------------------------------------------------------------------------
 
 """
-This module defines the following function:
+This module defines the following functions:
 - displaySelectedPage
+- releasePage
+- prewarmPages
 """
 
+#-------------------------------------------------------------------------------
+# Library modules import
+#-------------------------------------------------------------------------------
+
+import threading
+from collections import OrderedDict
+
 #-------------------------------------------------------------------------------
 # Application modules import
 #-------------------------------------------------------------------------------
@@ -35,6 +44,117 @@ from code_saturne.gui.base.QtCore import QCoreApplication
 from code_saturne.model.Common import *
 
 
+#-------------------------------------------------------------------------------
+# Cache of zone pages
+#-------------------------------------------------------------------------------
+
+# Zone pages (boundary and volume conditions) are kept in a LRU cache,
+# as they may be numerous and their models costly to build. A cached page
+# is reused only if the case was not modified since it was last hidden
+# (its generation is None while it is displayed).
+
+_page_cache = OrderedDict()
+_page_cache_size = 16
+
+class _CachedPage:
+    """
+    Cache entry.
+    """
+    def __init__(self, page, case):
+        self.page = page
+        self.case = case
+        self.generation = None
+
+
+def _cachedPage(key, case):
+    """
+    Return an up-to-date cached page, or None.
+    """
+    c = _page_cache.get(key)
+    if c is not None and c.case is case and c.generation == case.generation:
+        _page_cache.move_to_end(key)
+        c.generation = None
+        return c.page
+    return None
+
+
+def _cachePage(key, page, case):
+    """
+    Add a page to the cache, removing the least recently used ones.
+    """
+    _page_cache[key] = _CachedPage(page, case)
+    _page_cache.move_to_end(key)
+    while len(_page_cache) > _page_cache_size:
+        k, c = _page_cache.popitem(last=False)
+        if c.generation is not None:  # not displayed
+            c.page.deleteLater()
+
+
+def releasePage(page, case):
+    """
+    Mark a page as hidden. Return True if it is cached (and should be
+    kept), False if it may be deleted.
+    """
+    for c in _page_cache.values():
+        if c.page is page:
+            c.generation = case.generation
+            return True
+    return False
+
+#-------------------------------------------------------------------------------
+# Import page modules in the background
+#-------------------------------------------------------------------------------
+
+# Modules of all pages (in code_saturne.gui.case), in the order in which
+# they are imported by displaySelectedPage; should be updated with it.
+
+_page_modules = (
+    'BoundaryConditionsViewNeptune', 'BoundaryConditionsView',
+    'VolumicConditionsView', 'LocalizationView', 'WelcomeView',
+    'IdentityAndPathesView', 'SolutionDomainView', 'PreprocessingView',
+    'NotebookView', 'TimeTablesView', 'VolumicNatureView',
+    'AnalysisFeaturesView', 'MobileMeshView', 'GasCombustionView',
+    'CoalCombustionView', 'ElectricalView', 'GroundwaterView',
+    'ThermalView', 'TurbulenceNeptuneView', 'TurbulenceView',
+    'BodyForcesView', 'SpeciesView', 'DefineUserScalarsView',
+    'TurboMachineryView', 'FansView', 'LagrangianView',
+    'LagrangianStatisticsView', 'ImmersedBoundariesViewNeptune',
+    'BoundaryNatureView', 'CouplingParametersView', 'TimeAveragesView',
+    'TimeStepViewNeptune', 'TimeStepView', 'StartRestartView',
+    'OutputControlView', 'UserCalculatorView', 'UsersControlView',
+    'OutputVolumicVariablesView', 'OutputSurfacicVariablesView',
+    'LagrangianOutputView', 'ProfilesView', 'BalanceView',
+    'NumericalParamEquationViewNeptune', 'NumericalParamEquationView',
+    'GlobalNumericalParametersView', 'NumericalParamGlobalView',
+    'PerformanceTuningView', 'AtmosphericFlowsView', 'NonCondensableView',
+    'MainFieldsView', 'InterfacialForcesView', 'InterfacialEnthalpyView',
+    'NeptuneWallTransferView', 'SolidView', 'InterfacialAreaView',
+)
+
+_prewarm_thread = None
+
+def _importPageModules():
+    """
+    Import the modules of all pages.
+    """
+    for m in _page_modules:
+        try:
+            __import__('code_saturne.gui.case.' + m)
+        except Exception:
+            pass
+
+
+def prewarmPages():
+    """
+    Import the modules of all pages in a background thread, so that
+    their first display is faster.
+    """
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=_importPageModules,
+                                           daemon=True)
+        _prewarm_thread.start()
+
 #-------------------------------------------------------------------------------
 # displaySelectedPage direct to the good page with its name
 #-------------------------------------------------------------------------------
@@ -62,18 +182,25 @@ def displaySelectedPage(page_name, root, case, stbar=None, tree=None):
         index = case['current_index']
         item = index.internalPointer()
         zone_name = item.itemData[0]
+        key = (item.parentItem.itemData[0], zone_name, id(root))
+
+        thisPage = _cachedPage(key, case)
+        if thisPage is not None:
+            pass
 
-        if item.parentItem.itemData[0] == tr("Boundary conditions"):
+        elif item.parentItem.itemData[0] == tr("Boundary conditions"):
             if case.xmlRootNode().tagName == tr("NEPTUNE_CFD_GUI"):
                 import code_saturne.gui.case.BoundaryConditionsViewNeptune as Page
                 thisPage = Page.BoundaryConditionsView(root, case, zone_name)
             else:
                 import code_saturne.gui.case.BoundaryConditionsView as Page
                 thisPage = Page.BoundaryConditionsView(root, case, zone_name)
+            _cachePage(key, thisPage, case)
 
         elif item.parentItem.itemData[0] == tr("Volume conditions"):
             import code_saturne.gui.case.VolumicConditionsView as Page
             thisPage = Page.VolumicConditionsView(root, case, zone_name)
+            _cachePage(key, thisPage, case)
 
         elif item.parentItem.itemData[0] == tr("Volume zones"):
             import code_saturne.gui.case.LocalizationView as Page
@@ -48,6 +48,7 @@ from code_saturne.gui.base.QtCore    import *
 from code_saturne.gui.base.QtGui     import *
 from code_saturne.gui.base.QtWidgets import *
 from code_saturne.gui.base.QtPage import ComboModel
+from code_saturne.gui.base.QtTask import runTask, TaskCancelled
 from code_saturne.gui.base.CompletionTextEditor import *
 
 #-------------------------------------------------------------------------------
@@ -379,7 +380,15 @@ class QMegEditorView(QDialog, Ui_QMegDialog):
         for func_type in self.meg_to_c.funcs.keys():
             for k in self.meg_to_c.funcs[func_type].keys():
                 self.meg_to_c.update_block_expression(func_type, k, new_exp)
-                check, err_msg, n_erros = self.meg_to_c.check_meg_code_syntax(func_type)
+                # The syntax check compiles the expression: run it
+                # in a worker thread so that the GUI remains responsive
+                try:
+                    check, err_msg, n_erros \
+                        = runTask(self, self.tr("Checking expression..."),
+                                  self.meg_to_c.check_meg_code_syntax,
+                                  func_type)
+                except TaskCancelled:
+                    return
 
         if check != 0:
             log.debug(err_msg)
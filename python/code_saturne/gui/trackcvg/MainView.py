@@ -38,6 +38,7 @@ This module defines the following classes:
 #-------------------------------------------------------------------------------
 
 import os, sys, signal, logging
+import io
 
 #-------------------------------------------------------------------------------
 # Third-party modules
@@ -394,6 +395,139 @@ class CaseStandardItemModel(QAbstractItemModel):
         return True
 
 
+#-------------------------------------------------------------------------------
+# incremental reading of monitoring files
+#-------------------------------------------------------------------------------
+
+class MonitoringFileReader(object):
+    """
+    Incremental reader for a monitoring (residuals or probes) file
+    being written by a running computation.
+
+    Only the bytes appended since the previous update are read and parsed,
+    and values are stored in a growable buffer, so that the cost of an
+    update does not depend on the length of the run.
+    """
+
+    def __init__(self, path, n_cols, csv=True):
+        self.path = path
+        self.n_cols = n_cols
+        self.csv = csv
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget values read so far.
+        """
+        self.offset = 0
+        self.n_rows = 0
+        self.values = numpy.zeros((1024, self.n_cols))
+
+
+    def __append(self, rows):
+        """
+        Append rows to the values buffer, growing it if needed.
+        """
+        n = self.n_rows + rows.shape[0]
+        if n > self.values.shape[0]:
+            capacity = self.values.shape[0]
+            while capacity < n:
+                capacity *= 2
+            values = numpy.zeros((capacity, self.n_cols))
+            values[:self.n_rows] = self.values[:self.n_rows]
+            self.values = values
+        self.values[self.n_rows:n] = rows
+        self.n_rows = n
+
+
+    def __parse(self, text):
+        """
+        Parse complete lines of text.
+        """
+        if self.csv:
+            text = text.replace(',', ' ')
+        try:
+            rows = numpy.loadtxt(io.StringIO(text), comments='#', ndmin=2)
+            if rows.shape[0] > 0 and rows.shape[1] != self.n_cols:
+                raise ValueError
+        except ValueError:
+            # Incomplete or inconsistent lines: keep only valid rows
+            l = []
+            for line in text.splitlines():
+                content = line.split()
+                if len(content) != self.n_cols or content[0][0] == '#':
+                    continue
+                try:
+                    l.append([float(el) for el in content])
+                except ValueError:
+                    pass
+            rows = numpy.array(l).reshape(-1, self.n_cols)
+
+        return rows
+
+
+    def update(self):
+        """
+        Read values appended to the file since the last update.
+        Return an array of shape (n_cols, n_rows) (view on the buffer).
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+
+        # File was truncated or rewritten (for example on a restart)
+        if size < self.offset:
+            self.reset()
+
+        if size > self.offset:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read(size - self.offset)
+
+            # Only handle complete lines
+            e_id = chunk.rfind(b'\n')
+            if e_id > -1:
+                start = 0
+                if self.offset == 0 and self.csv:
+                    # skip header line
+                    start = chunk.find(b'\n') + 1
+                text = chunk[start:e_id+1].decode('utf-8', 'replace')
+                self.offset += e_id + 1
+                if text.strip():
+                    rows = self.__parse(text)
+                    if rows.shape[0] > 0:
+                        self.__append(rows)
+
+        return self.values[:self.n_rows].transpose()
+
+#-------------------------------------------------------------------------------
+
+def decimate_min_max(x, y, n_bins):
+    """
+    Reduce the number of points of a curve for display, keeping the
+    minimum and maximum values of y in each of n_bins groups of
+    consecutive points (so that peaks remain visible).
+    """
+    n = len(x)
+    if n_bins < 1 or n <= 2*n_bins:
+        return x, y
+
+    bin_size = -(-n // n_bins)
+    n_full = (n // bin_size) * bin_size
+    y_b = y[:n_full].reshape(-1, bin_size)
+    offsets = numpy.arange(0, n_full, bin_size)
+
+    i_min = numpy.argmin(y_b, axis=1) + offsets
+    i_max = numpy.argmax(y_b, axis=1) + offsets
+    ids = [i_min, i_max]
+    if n_full < n:
+        ids.append(numpy.arange(n_full, n))
+    ids = numpy.unique(numpy.concatenate(ids))
+
+    return x[ids], y[ids]
+
 #-------------------------------------------------------------------------------
 # manage figures
 #-------------------------------------------------------------------------------
@@ -444,10 +578,13 @@ class MyMplCanvas(FigureCanvas):
 
 
     def update_figure(self, name, data, nb_probes, lstProbes):
-        self.xAxe = data[0].tolist()
+        # decimate to about 1 point per pixel column for display
+        n_bins = max(self.width(), 100)
+        x = data[0]
         for j in range(nb_probes - 1):
             if (lstProbes[j].status == "on"):
-                self.yAxe = data[j + 1].tolist()
+                self.xAxe, self.yAxe = decimate_min_max(x, data[j + 1],
+                                                        n_bins)
 
                 lbl = name + "_s" + str(j)
 
@@ -464,10 +601,13 @@ class MyMplCanvas(FigureCanvas):
 
 
     def update_figure_listing(self, name, data, nb_probes, lstProbes):
-        self.xAxe = data[0].tolist()
+        # decimate to about 1 point per pixel column for display
+        n_bins = max(self.width(), 100)
+        x = data[0]
         for j in range(nb_probes - 1):
             if (lstProbes[j].status == "on"):
-                self.yAxe = data[j + 1].tolist()
+                self.xAxe, self.yAxe = decimate_min_max(x, data[j + 1],
+                                                        n_bins)
 
                 lbl = "t res. " + name[j]
 
@@ -689,6 +829,7 @@ class MainView(object):
         self.lineEditCase.setText("")
         self.caseName = None
         self.fileList = []
+        self.fileReaders = {}
         self.listingVariable = []
         self.listFileProbes = {}
         self.modelCases = CaseStandardItemModel(self.parent, [], [])
@@ -1014,43 +1155,22 @@ class MainView(object):
         self.dc.drawFigure()
 
 
-    def ReadCsvFile(self, name, probes_number):
+    def getFileReader(self, name, probes_number, csv):
         """
+        Return the incremental reader associated with a file.
         """
-        data = []
-        comp = 0
-        ficIn= open(name, 'r')
-        typ = 0 # O time / 1 iteration
-        for line in ficIn.readlines():
-            e_id = line.find('\n')
-            if e_id < 0:
-                continue
-            if comp > 0:
-                content = line[:e_id].split(',')
-
-                if comp == 1:
-                    if type(content[0]) == int:
-                        typ = 1
-
-                if typ == 0:
-                    for el in content:
-                        data.append(float(el))
-                else:
-                    data.append(float(content[0]))
-                    for el in content[1:]:
-                        data.append(float(el))
-            comp = comp + 1
-        ficIn.close()
-        A = numpy.array(data)
-        n = A.shape[0]
-        r = n % probes_number
-        if r > 0:
-            n -= r
-            A = numpy.resize(A, n)
-        B = A.reshape(-1, probes_number)
-        C = B.transpose()
+        reader = self.fileReaders.get(name)
+        if reader is None or reader.n_cols != probes_number:
+            reader = MonitoringFileReader(name, probes_number, csv)
+            self.fileReaders[name] = reader
+        return reader
 
-        return C
+
+    def ReadCsvFile(self, name, probes_number):
+        """
+        Return values of a CSV file (only new lines are read).
+        """
+        return self.getFileReader(name, probes_number, True).update()
 
 
     def ReadCsvFileHeader(self, name):
@@ -1069,42 +1189,9 @@ class MainView(object):
 
     def ReadDatFile(self, name, probes_number):
         """
+        Return values of a DAT file (only new lines are read).
         """
-        data = []
-        ficIn= open(name, 'r')
-        comp = 0
-        typ = 0 # O time / 1 iteration
-        for line in ficIn.readlines():
-            if not line.startswith("#"):
-                comp = comp + 1
-                e_id = line.find('\n')
-                if e_id < 0:
-                    continue
-                line = line[:e_id].lstrip()
-                content = line.split()
-
-                if comp == 1:
-                    if type(content[0]) == int:
-                        typ = 1
-
-                if typ == 0:
-                    for el in content:
-                        data.append(float(el))
-                else:
-                    data.append(float(content[0]))
-                    for el in content[1:]:
-                        data.append(float(el))
-        ficIn.close()
-        A = numpy.array(data)
-        n = A.shape[0]
-        r = n % probes_number
-        if r > 0:
-            n -= r
-            A = numpy.resize(A, n)
-        B = A.reshape(-1, probes_number)
-        C = B.transpose()
-
-        return C
+        return self.getFileReader(name, probes_number, False).update()
 
 
     def ReadDatFileHeader(self, name):
@@ -1269,6 +1356,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
         self.timeRefresh = 10.
         self.subplotNumber = 2
         self.fileList = []
+        self.fileReaders = {}
         self.listingVariable = []
         self.listFileProbes = {}
         self.timer = QTimer()
@@ -161,6 +161,105 @@ class Dico:
                 print("%s -> %s" % (i, self.data[i]))
 
 
+#-------------------------------------------------------------------------------
+# Index of element nodes by tag and attribute values
+#-------------------------------------------------------------------------------
+
+# Number of queries with no structural change of a document after which
+# its node index is (re)built.
+
+_node_index_min_queries = 8
+
+def _xmlMatchAttributes(node, attrList, kwargs):
+    """
+    Return True if an Element node has all attributes of attrList,
+    and attributes with values matching kwargs.
+    """
+    for attr in attrList:
+        if not node.hasAttribute(str(attr)):
+            return False
+    for k, v in kwargs.items():
+        if node.getAttribute(str(k)) != str(v):
+            return False
+    return True
+
+
+class XMLNodeIndex:
+    """
+    Index of the element nodes of a document, by tag and by
+    (tag, attribute, value), in document order.
+    """
+    def __init__(self, doc):
+        """
+        Build the index of a document.
+        """
+        self.tags = {}
+        self.attrs = {}
+        self.pos = {}
+
+        stack = [doc.documentElement]
+        while stack:
+            n = stack.pop()
+            if n is None or n.nodeType != Node.ELEMENT_NODE:
+                continue
+            self.pos[n] = len(self.pos)
+            tag = n.tagName
+            self.tags.setdefault(tag, []).append(n)
+            for a, v in n._get_attributes().items():
+                self.attrs.setdefault((tag, a, v), []).append(n)
+            if n.childNodes:
+                stack.extend(reversed(n.childNodes))
+
+
+    def updateAttribute(self, el, attr, old, new):
+        """
+        Update the index for an attribute change of an indexed node.
+        """
+        if el not in self.pos:
+            return
+        tag = el.tagName
+        if old is not None:
+            l = self.attrs.get((tag, attr, old))
+            if l and el in l:
+                l.remove(el)
+        if new is not None:
+            l = self.attrs.setdefault((tag, attr, new), [])
+            p = self.pos[el]
+            i, j = 0, len(l)
+            while i < j:
+                m = (i + j) // 2
+                if self.pos[l[m]] < p:
+                    i = m + 1
+                else:
+                    j = m
+            l.insert(i, el)
+
+
+    def nodeList(self, root, tag, attrList, kwargs):
+        """
+        Return the list of Element descendants of root with a given tag
+        and matching attributes, in document order.
+        """
+        candidates = self.tags.get(tag, [])
+        for k, v in kwargs.items():
+            v = str(v)
+            if v != "":  # an empty value also matches a missing attribute
+                l = self.attrs.get((tag, str(k), v), [])
+                if len(l) < len(candidates):
+                    candidates = l
+
+        nodeList = []
+        for n in candidates:
+            # Removed nodes are not detached from the index
+            p = n.parentNode
+            while p is not None and p is not root:
+                p = p.parentNode
+            if p is not None and _xmlMatchAttributes(n, attrList, kwargs):
+                nodeList.append(n)
+
+        return nodeList
+
+
 #-------------------------------------------------------------------------------
 # Lightweight XML constructor and reader
 #-------------------------------------------------------------------------------
@@ -241,6 +340,55 @@ class XMLElement:
         return XMLElement(self.doc, el, self.ca)
 
 
+    def _recordChange(self, *change):
+        """
+        Record an elementary change of the document in the journal
+        of the associated case, if any (see Case.journalRevert),
+        and update its modification generation (see Case.isModified).
+        """
+        try:
+            self.ca.generation += 1
+        except AttributeError:
+            return
+        self.ca.xmlIndexChange(change)
+        self.ca.journalChange(change)
+
+
+    def _setAttribute(self, attr, value):
+        """
+        Set an attribute of the current node, recording the change.
+        """
+        old = None
+        if self.el.hasAttribute(attr):
+            old = self.el.getAttribute(attr)
+        if old != value:
+            self.el.setAttribute(attr, value)
+            self._recordChange('attr', self.el, attr, old, value)
+
+
+    def _insertBefore(self, el, ref):
+        """
+        Insert a node before ref (or at the end if ref is None),
+        recording the change.
+        """
+        el = self.el.insertBefore(el, ref)
+        self._recordChange('insert', self.el, el, ref)
+        return el
+
+
+    def _removeChild(self, el):
+        """
+        Remove a child node, recording the change.
+        Removed nodes are only unlinked if no journal is kept,
+        as they may otherwise be re-inserted by an undo operation.
+        """
+        ref = el.nextSibling
+        el = self.el.removeChild(el)
+        self._recordChange('remove', self.el, el, ref)
+        if getattr(self.ca, 'journal', None) is None:
+            el.unlink()
+
+
     def xmlCreateAttribute(self, **kwargs):
         """
         Set attributes to a XMLElement node, only if these attributes
@@ -248,7 +396,7 @@ class XMLElement:
         """
         for attr, value in list(kwargs.items()):
             if not self.el.hasAttribute(attr):
-                self.el.setAttribute(attr, str(value))
+                self._setAttribute(attr, str(value))
 
         log.debug("xmlCreateAttribute-> %s" % self.__xmlLog())
 
@@ -292,7 +440,7 @@ class XMLElement:
         Set several attribute (key=value) to a node
         """
         for attr, value in list(kwargs.items()):
-            self.el.setAttribute(attr, str(value))
+            self._setAttribute(attr, str(value))
 
         log.debug("xmlSetAttribute-> %s" % self.__xmlLog())
 
@@ -302,7 +450,9 @@ class XMLElement:
         Delete the XMLElement node attribute
         """
         if self.el.hasAttribute(attr):
+            old = self.el.getAttribute(attr)
             self.el.removeAttribute(attr)
+            self._recordChange('attr', self.el, attr, old, None)
 
         log.debug("xmlDelAttribute-> %s %s" % (attr, self.__xmlLog()))
 
@@ -324,7 +474,7 @@ class XMLElement:
         Set a XMLElement attribute an its value
         with a dictionary syntax: node['attr'] = value
         """
-        self.el.setAttribute(attr, str(value))
+        self._setAttribute(attr, str(value))
 
         log.debug("__setitem__-> %s" % self.__xmlLog())
 
@@ -476,38 +626,21 @@ class XMLElement:
         """
         Return a list of Element (and not XMLElement)!
         """
-        nodeList = []
+        index = None
+        if isinstance(self.ca, XMLDocument) and self.ca.doc is self.doc:
+            index = self.ca.xmlNodeIndex()
 
-        # Get the nodes list
-        #
-        nodeL = self.el.getElementsByTagName(tag)
+        if index is not None:
+            return index.nodeList(self.el, tag, attrList, kwargs)
 
-        for node in nodeL:
-            iok = 0
-            for attr in attrList:
-                if node.hasAttribute(str(attr)):
-                    iok = 1
-                else:
-                    iok = 0
-                    break
-            if iok: nodeList.append(node)
-
-        if attrList and kwargs:
-            nodeL = nodeList
-            nodeList = []
+        nodeL = self.el.getElementsByTagName(tag)
+        if not attrList and not kwargs:
+            return nodeL
 
+        nodeList = []
         for node in nodeL:
-            iok = 0
-            for k, v in list(kwargs.items()):
-                if node.getAttribute(str(k)) == str(v):
-                    iok = 1
-                else:
-                    iok = 0
-                    break
-            if iok: nodeList.append(node)
-
-        if not attrList and not kwargs:
-            nodeList = nodeL
+            if _xmlMatchAttributes(node, attrList, kwargs):
+                nodeList.append(node)
 
         return nodeList
 
@@ -516,14 +649,11 @@ class XMLElement:
         """
         Return a list of first child Element node from the explored XMLElement node.
         """
-        nodeList = self._nodeList(tag, *attrList, **kwargs)
-
         childNodeList = []
-        if self.el.hasChildNodes():
-            for node in self.el.childNodes:
-                if node.nodeType == Node.ELEMENT_NODE:
-                    if node.nodeName == tag and node in nodeList:
-                        childNodeList.append(node)
+        for node in self.el.childNodes:
+            if node.nodeType == Node.ELEMENT_NODE and node.nodeName == tag:
+                if _xmlMatchAttributes(node, attrList, kwargs):
+                    childNodeList.append(node)
 
         return childNodeList
 
@@ -568,7 +698,7 @@ class XMLElement:
 
         log.debug("xmlAddChild-> %s %s" % (tag, self.__xmlLog()))
 
-        return self._inst(self.el.insertBefore(el, nn))
+        return self._inst(self._insertBefore(el, nn))
 
 
     def xmlSetTextNode(self, newTextNode):
@@ -583,12 +713,13 @@ class XMLElement:
 
         if self.el.hasChildNodes():
             for n in self.el.childNodes:
-                if n.nodeType == Node.TEXT_NODE:
+                if n.nodeType == Node.TEXT_NODE and n.data != newTextNode:
+                    self._recordChange('text', n, n.data, newTextNode)
                     n.data = newTextNode
         else:
             self._inst(
-                self.el.appendChild(
-                    self.doc.createTextNode(newTextNode)))
+                self._insertBefore(
+                    self.doc.createTextNode(newTextNode), None))
 
         log.debug("xmlSetTextNode-> %s" % self.__xmlLog())
 
@@ -810,7 +941,7 @@ class XMLElement:
         """
         Create a comment XMLElement node.
         """
-        elt = self._inst( self.el.appendChild(self.doc.createComment(data)) )
+        elt = self._inst( self._insertBefore(self.doc.createComment(data), None) )
         log.debug("xmlAddComment-> %s" % self.__xmlLog())
         return elt
 
@@ -905,8 +1036,8 @@ class XMLElement:
 
         if not nodeList:
             child = self.xmlAddChild(tag, *attrList, **kwargs)
-            for k in attrList: child.el.setAttribute(k, "")
-            for k, v in list(kwargs.items()): child.el.setAttribute(k, str(v))
+            for k in attrList: child._setAttribute(k, "")
+            for k, v in list(kwargs.items()): child._setAttribute(k, str(v))
             nodeList.append(child)
         else:
             l = []
@@ -925,8 +1056,8 @@ class XMLElement:
 
         if not nodeList:
             child = self.xmlAddChild(tag, *attrList, **kwargs)
-            for k in attrList: child.el.setAttribute(k, "")
-            for k, v in list(kwargs.items()): child.el.setAttribute(k, str(v))
+            for k in attrList: child._setAttribute(k, "")
+            for k, v in list(kwargs.items()): child._setAttribute(k, str(v))
             nodeList.append(child)
         else:
             l = []
@@ -946,8 +1077,8 @@ class XMLElement:
 
         if not nodeList:
             child = self.xmlAddChild(tag, *attrList, **kwargs)
-            for k in attrList: child.el.setAttribute(k, "")
-            for k, v in list(kwargs.items()): child.el.setAttribute(k, str(v))
+            for k in attrList: child._setAttribute(k, "")
+            for k, v in list(kwargs.items()): child._setAttribute(k, str(v))
         else:
             if len(nodeList) > 1:
                 msg = "There is an error with the use of the xmlInitNode method. "\
@@ -970,8 +1101,8 @@ class XMLElement:
 
         if not nodeList:
             child = self.xmlAddChild(tag, *attrList, **kwargs)
-            for k in attrList: child.el.setAttribute(k, "")
-            for k, v in list(kwargs.items()): child.el.setAttribute(k, str(v))
+            for k in attrList: child._setAttribute(k, "")
+            for k, v in list(kwargs.items()): child._setAttribute(k, str(v))
         else:
             if len(nodeList) > 1:
                 msg = "There is an error in with the use of the xmlInitChildNode method. "\
@@ -991,7 +1122,7 @@ class XMLElement:
         """
         if oldNode.el.hasChildNodes():
             for n in oldNode.el.childNodes:
-                self._inst(self.el.appendChild(n.cloneNode(deep)))
+                self._inst(self._insertBefore(n.cloneNode(deep), None))
 
         log.debug("xmlChildsCopy-> %s" % self.__xmlLog())
 
@@ -1009,7 +1140,7 @@ class XMLElement:
                             duplicate = True
                             break
                 if not duplicate:
-                    self._inst(self.el.appendChild(n.cloneNode(deep)))
+                    self._inst(self._insertBefore(n.cloneNode(deep), None))
 
         oldNode.xmlRemoveNode()
 
@@ -1020,8 +1151,7 @@ class XMLElement:
         """
         Destroy a single node.
         """
-        oldChild = self.el.parentNode.removeChild(self.el)
-        oldChild.unlink()
+        self._inst(self.el.parentNode)._removeChild(self.el)
 
 
     def xmlRemoveChild(self, tag, *attrList, **kwargs):
@@ -1043,8 +1173,7 @@ class XMLElement:
         """
         childNodeList = []
         while self.el.hasChildNodes():
-            oldChild = self.el.removeChild(self.el.firstChild)
-            oldChild.unlink()
+            self._removeChild(self.el.firstChild)
 
 
     def xmlNormalizeWhitespace(self, text):
@@ -1070,6 +1199,10 @@ class XMLDocument(XMLElement):
         self.doc  = Document()
         self.case = case
 
+        # Node index, built lazily and invalidated by structural changes
+        self.node_index = None
+        self.node_index_queries = 0
+
         XMLElement.__init__(self, self.doc, self.doc, self.case)
 
         if tag:
@@ -1124,6 +1257,8 @@ class XMLDocument(XMLElement):
         return a xml doc from a file
         """
         self.doc = self.el = parse(d)
+        self.node_index = None
+        self.node_index_queries = 0
         return self
 
 
@@ -1132,9 +1267,41 @@ class XMLDocument(XMLElement):
         return a xml doc from a string
         """
         self.doc = self.el = parseString(d)
+        self.node_index = None
+        self.node_index_queries = 0
         return self
 
 
+    def xmlNodeIndex(self):
+        """
+        Return the node index of the document, or None if it is not
+        worth building it yet (i.e. the document structure was changed
+        since fewer than _node_index_min_queries queries).
+        """
+        if self.node_index is None:
+            self.node_index_queries += 1
+            if self.node_index_queries >= _node_index_min_queries:
+                self.node_index = XMLNodeIndex(self.doc)
+        return self.node_index
+
+
+    def xmlIndexChange(self, change):
+        """
+        Update or invalidate the node index for a recorded change
+        (see XMLElement._recordChange).
+        """
+        if change[0] == 'insert':
+            self.node_index = None
+            self.node_index_queries = 0
+        elif change[0] == 'attr' and self.node_index is not None:
+            self.node_index.updateAttribute(*change[1:])
+
+
+    # Note that the following cleanup methods modify the document directly,
+    # so their changes are not recorded in the journal of a Case. They should
+    # only be applied to a document which has just been loaded or to a copy
+    # (as done when saving), not to a document whose changes may be undone.
+
     def xmlCleanAllBlank(self, node):
         """
         Clean a previous XMLElement file. The purpose of this method
@@ -1286,6 +1453,15 @@ class Case(Dico, XMLDocument):
         Instantiate a new dico and a new xml doc
         """
         Dico.__init__(self)
+
+        # Modification generation, incremented by each change of the
+        # document, and its value when last saved or loaded
+        self.generation = 0
+        self.generation_saved = 0
+
+        # Journal of elementary changes (None if changes are not recorded)
+        self.journal = None
+
         XMLDocument.__init__(self, case=self)
 
         if package:
@@ -1319,7 +1495,7 @@ class Case(Dico, XMLDocument):
         self.record_local = False
         self.record_global = True
         self.xml_prev = ""
-        self.xml_saved = self.toString()
+        self.generation_saved = self.generation
 
 
     def module_name(self):
@@ -1331,6 +1507,24 @@ class Case(Dico, XMLDocument):
         return 'code_saturne'
 
 
+    def parse(self, d):
+        """
+        return a xml doc from a file
+        """
+        XMLDocument.parse(self, d)
+        self.generation += 1
+        return self
+
+
+    def parseString(self, d):
+        """
+        return a xml doc from a string
+        """
+        XMLDocument.parseString(self, d)
+        self.generation += 1
+        return self
+
+
     def xmlRootNode(self):
         """
         This function return the only one root element of the document
@@ -1343,13 +1537,88 @@ class Case(Dico, XMLDocument):
         """
         Return True if the xml doc is modified.
         """
-        # return self['saved'] == "no"
+        return self.generation != self.generation_saved
 
-        s = self.toIOString()
-        if s == self.xml_saved:
-            return False
+
+    def journalChange(self, change):
+        """
+        Record an elementary change in the journal, if one is kept.
+        """
+        if self.journal is not None:
+            self.journal.append(change)
+
+
+    def journalRevert(self, changes):
+        """
+        Revert a list of changes recorded in a journal, so as to restore
+        the document to its state before those changes.
+        """
+        if changes:
+            self.generation += 1
+            self.node_index = None
+            self.node_index_queries = 0
+        journal = self.journal
+        self.journal = None
+        try:
+            for c in reversed(changes):
+                if c[0] == 'attr':
+                    self.__setJournalAttribute(c[1], c[2], c[3])
+                elif c[0] == 'text':
+                    c[1].data = c[2]
+                elif c[0] == 'insert':
+                    if c[2].parentNode is c[1]:
+                        c[1].removeChild(c[2])
+                elif c[0] == 'remove':
+                    self.__insertJournalNode(c[1], c[2], c[3])
+        finally:
+            self.journal = journal
+
+
+    def journalReplay(self, changes):
+        """
+        Replay a list of changes recorded in a journal, so as to restore
+        the document to its state after those changes.
+        """
+        if changes:
+            self.generation += 1
+            self.node_index = None
+            self.node_index_queries = 0
+        journal = self.journal
+        self.journal = None
+        try:
+            for c in changes:
+                if c[0] == 'attr':
+                    self.__setJournalAttribute(c[1], c[2], c[4])
+                elif c[0] == 'text':
+                    c[1].data = c[3]
+                elif c[0] == 'insert':
+                    self.__insertJournalNode(c[1], c[2], c[3])
+                elif c[0] == 'remove':
+                    if c[2].parentNode is c[1]:
+                        c[1].removeChild(c[2])
+        finally:
+            self.journal = journal
+
+
+    def __setJournalAttribute(self, el, attr, value):
+        """
+        Set or remove (if value is None) an attribute of a node.
+        """
+        if value is None:
+            if el.hasAttribute(attr):
+                el.removeAttribute(attr)
         else:
-            return True
+            el.setAttribute(attr, value)
+
+
+    def __insertJournalNode(self, parent, el, ref):
+        """
+        Insert a node before ref, or at the end if ref is not a child
+        of parent anymore (for example after a document cleanup).
+        """
+        if ref is not None and ref.parentNode is not parent:
+            ref = None
+        parent.insertBefore(el, ref)
 
 
     def __del__(self):
@@ -1398,7 +1667,7 @@ class Case(Dico, XMLDocument):
             file = open(self['xmlfile'], 'w')
             file.write(s)
             file.close()
-            self.xml_saved = s
+            self.generation_saved = self.generation
             self['saved'] = "yes"
             if not saveLink:
                 d.doc.unlink()
@@ -1964,6 +2233,36 @@ class XMLengineTestCase(unittest.TestCase):
                'Could not use the xmlSaveDocument method'
 
 
+    def testCaseRemoveNodeModified(self):
+        """Check whether removing a node marks the case as modified."""
+        case = Case()
+        case.parseString(u'<a><b name="x"/><b name="y"/></a>')
+        case.generation_saved = case.generation
+        assert case.journal is None
+        case.xmlGetNode('b', name='x').xmlRemoveNode()
+        assert case.isModified(), 'Node removal not marked as modification'
+
+
+    def testCaseJournal(self):
+        """Check whether journaled changes could be reverted and replayed."""
+        case = Case()
+        case.parseString(u'<fruits color="red"><c a="2">to</c></fruits>')
+        s0 = case.toString()
+        case.journal = []
+        n = case.root().xmlGetNode('c')
+        n['a'] = 3
+        n.xmlSetTextNode('ti')
+        case.root().xmlInitNode('d', b="1")
+        del case.root()['color']
+        n.xmlRemoveNode()
+        s1 = case.toString()
+
+        case.journalRevert(case.journal)
+        assert case.toString() == s0, 'Could not revert journaled changes'
+        case.journalReplay(case.journal)
+        assert case.toString() == s1, 'Could not replay journaled changes'
+
+
 def suite():
     """unittest function"""
     testSuite = unittest.makeSuite(XMLengineTestCase, "test")
@@ -35,7 +35,8 @@ This module contains the following classe:
 # Library modules import
 #-------------------------------------------------------------------------------
 
-import sys, unittest, re
+import os, sys, unittest, re
+import hashlib, zlib
 
 #-------------------------------------------------------------------------------
 # Application modules import
@@ -61,6 +62,31 @@ from code_saturne.model.LagrangianModel import LagrangianModel
 from code_saturne.model.ThermalRadiationModel import ThermalRadiationModel
 from code_saturne.model.SolutionDomainModel import SolutionDomainModel
 
+#-------------------------------------------------------------------------------
+# Cache of XML document initialization results
+#-------------------------------------------------------------------------------
+
+def get_xml_init_cache_dir():
+    """
+    Return the directory in which the results of XML document
+    initialization (including backward compatibility updates) are cached,
+    or None if the cache is disabled (CS_XML_CACHE_DIR set to "none").
+    """
+    cache_dir = os.getenv('CS_XML_CACHE_DIR')
+    if cache_dir:
+        if cache_dir.lower() in ('none', 'no', 'off'):
+            return None
+        return cache_dir
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'xml_init')
+
+# Maximum number of cached initialization results
+
+_xml_init_cache_max_entries = 64
+
 #-------------------------------------------------------------------------------
 # class BaseXmlInit
 #-------------------------------------------------------------------------------
@@ -69,10 +95,15 @@ class BaseXmlInit(Variables):
     """
     Base class to initialize XML parameter file.
     """
-    def __init__(self, case):
+    def __init__(self, case, use_cache=False):
         """
+        Constructor. The cached result of a previous initialization of an
+        identical document may be used only if use_cache is True, which
+        requires that the document has just been read (as the document is
+        then replaced, so nodes referenced elsewhere would be stale).
         """
         self.case = case
+        self.use_cache = use_cache
 
 
     def _renameSingle(self, parent_tag, old_tag, new_tag):
@@ -163,7 +194,24 @@ class BaseXmlInit(Variables):
 
     def _backwardCompatibilityOldVersion(self, from_vers):
         """
-        Change XML in order to ensure backward compatibility for old version.
+        Change XML in order to ensure backward compatibility for old version,
+        applying the registered rules in order.
+        """
+        for vers, rule in self._backwardCompatibilityRules():
+            if vers is None:
+                apply_rule = (from_vers <= "-1.0")
+            else:
+                apply_rule = (from_vers[:3] < vers)
+            if apply_rule:
+                rule()
+
+
+    def _backwardCompatibilityRules(self):
+        """
+        Return the list of (version, function) backward compatibility rules,
+        in application order. A rule applies to files last saved with a
+        version lower than its own, or only to files with no version
+        history if its version is None.
         Must be overriden in child classes.
         """
         raise NotImplementedError
@@ -177,6 +225,85 @@ class BaseXmlInit(Variables):
         raise NotImplementedError
 
 
+    def _initializationKey(self, *args):
+        """
+        Return a digest identifying the initialization of the current
+        document with the given arguments, or None if initialization
+        results are not cached.
+        """
+        if not self.use_cache or get_xml_init_cache_dir() is None:
+            return None
+
+        h = hashlib.sha256()
+        pkg = self.case['package']
+        h.update(self.__class__.__name__.encode())
+        h.update(str(getattr(pkg, 'version_full', pkg.version)).encode())
+        # Also depend on the initialization code itself for development
+        # builds, including models whose methods set default values.
+        model_dir = os.path.dirname(os.path.abspath(__file__))
+        try:
+            for e in sorted(os.scandir(model_dir), key=lambda e: e.name):
+                if e.name[-3:] == '.py':
+                    h.update((e.name + ' '
+                              + str(e.stat().st_mtime_ns)).encode())
+        except OSError:
+            pass
+        h.update(str(args).encode())
+        h.update(self.case.toString().encode('utf-8'))
+        return h.hexdigest()
+
+
+    def _loadInitialized(self, key):
+        """
+        Replace the document by the cached result of its initialization,
+        if available. Return True in this case, False otherwise.
+        """
+        if key is None:
+            return False
+        path = os.path.join(get_xml_init_cache_dir(), key)
+        try:
+            with open(path, 'rb') as f:
+                s = f.read()
+            os.utime(path)
+            # An empty entry means initialization changes nothing
+            if s:
+                self.case.parseString(zlib.decompress(s).decode('utf-8'))
+            return True
+        except Exception:
+            return False
+
+
+    def _storeInitialized(self, key, generation):
+        """
+        Cache the result of the initialization of the document identified
+        by key, given the document generation before initialization
+        (silently ignoring failures, as this is an optimization).
+        """
+        if key is None:
+            return
+        s = b''
+        if self.case.generation != generation:
+            s = zlib.compress(self.case.toString().encode('utf-8'))
+        cache_dir = get_xml_init_cache_dir()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, key)
+            tmp_path = path + '.%d.tmp' % os.getpid()
+            with open(tmp_path, 'wb') as f:
+                f.write(s)
+            os.replace(tmp_path, path)
+
+            entries = []
+            for e in os.scandir(cache_dir):
+                entries.append((e.stat().st_mtime, e.path))
+            if len(entries) > _xml_init_cache_max_entries:
+                entries.sort()
+                for t, e in entries[:-_xml_init_cache_max_entries]:
+                    os.remove(e)
+        except OSError:
+            pass
+
+
 #-------------------------------------------------------------------------------
 # class XMLinit for code_saturne solver
 #-------------------------------------------------------------------------------
@@ -190,6 +317,12 @@ class XMLinit(BaseXmlInit):
         Verify that all Headings exist only once in the XMLDocument and
         create the missing heading.
         """
+        # Documents already initialized reuse the cached result
+        init_key = self._initializationKey(prepro)
+        if self._loadInitialized(init_key):
+            return ""
+        generation = self.case.generation
+
         msg = self.__initHeading(prepro)
         if msg:
             return msg
@@ -274,6 +407,9 @@ class XMLinit(BaseXmlInit):
             AtmosphericFlowsModel(self.case).getAtmosphericFlowsModel()
             LagrangianModel(self.case).getLagrangianModel()
 
+        if not msg:
+            self._storeInitialized(init_key, generation)
+
         return msg
 
 
@@ -311,61 +447,32 @@ class XMLinit(BaseXmlInit):
         return msg
 
 
-    def _backwardCompatibilityOldVersion(self, from_vers):
-        """
-        Change XML in order to ensure backward compatibility for old version.
-        """
-        if from_vers <= "-1.0":
-            self.__backwardCompatibilityBefore_3_0()
-
-        if from_vers[:3] < "4.0.0":
-            if from_vers[:3] < "3.1.0":
-                self.__backwardCompatibilityFrom_3_0()
-            if from_vers[:3] < "3.2.0":
-                self.__backwardCompatibilityFrom_3_1()
-            if from_vers[:3] < "3.3.0":
-                self.__backwardCompatibilityFrom_3_2()
-            self.__backwardCompatibilityFrom_3_3()
-
-        if from_vers[:3] < "5.0.0":
-            if from_vers[:3] < "4.1.0":
-                self.__backwardCompatibilityFrom_4_0()
-            if from_vers[:3] < "4.2.0":
-                self.__backwardCompatibilityFrom_4_1()
-            if from_vers[:3] < "4.3.0":
-                self.__backwardCompatibilityFrom_4_2()
-            self.__backwardCompatibilityFrom_4_3()
-
-        if from_vers[:3] < "6.0.0":
-            if from_vers[:3] < "5.1.0":
-                self.__backwardCompatibilityFrom_5_0()
-            if from_vers[:3] < "5.2.0":
-                self.__backwardCompatibilityFrom_5_1()
-            if from_vers[:3] < "5.3.0":
-                self.__backwardCompatibilityFrom_5_2()
-            self.__backwardCompatibilityFrom_5_3()
-
-        if from_vers[:3] < "7.0.0":
-            if from_vers[:3] < "6.1.0":
-                self.__backwardCompatibilityFrom_6_0()
-            if from_vers[:3] < "6.2.0":
-                self.__backwardCompatibilityFrom_6_1()
-            if from_vers[:3] < "6.3.0":
-                self.__backwardCompatibilityFrom_6_2()
-            self.__backwardCompatibilityFrom_6_3()
-
-        if from_vers[:3] < "8.0.0":
-            if from_vers[:3] < "7.1.0":
-                self.__backwardCompatibilityFrom_7_0()
-            if from_vers[:3] < "7.2.0":
-                self.__backwardCompatibilityFrom_7_1()
-            if from_vers[:3] < "7.3.0":
-                self.__backwardCompatibilityFrom_7_2()
-            self.__backwardCompatibilityFrom_7_3()
-
-        if from_vers[:3] < "9.0.0":
-            if from_vers[:3] < "8.1.0":
-                self.__backwardCompatibilityFrom_8_0()
+    def _backwardCompatibilityRules(self):
+        """
+        Return the list of (version, function) backward compatibility rules.
+        """
+        return [(None, self.__backwardCompatibilityBefore_3_0),
+                ("3.1.0", self.__backwardCompatibilityFrom_3_0),
+                ("3.2.0", self.__backwardCompatibilityFrom_3_1),
+                ("3.3.0", self.__backwardCompatibilityFrom_3_2),
+                ("4.0.0", self.__backwardCompatibilityFrom_3_3),
+                ("4.1.0", self.__backwardCompatibilityFrom_4_0),
+                ("4.2.0", self.__backwardCompatibilityFrom_4_1),
+                ("4.3.0", self.__backwardCompatibilityFrom_4_2),
+                ("5.0.0", self.__backwardCompatibilityFrom_4_3),
+                ("5.1.0", self.__backwardCompatibilityFrom_5_0),
+                ("5.2.0", self.__backwardCompatibilityFrom_5_1),
+                ("5.3.0", self.__backwardCompatibilityFrom_5_2),
+                ("6.0.0", self.__backwardCompatibilityFrom_5_3),
+                ("6.1.0", self.__backwardCompatibilityFrom_6_0),
+                ("6.2.0", self.__backwardCompatibilityFrom_6_1),
+                ("6.3.0", self.__backwardCompatibilityFrom_6_2),
+                ("7.0.0", self.__backwardCompatibilityFrom_6_3),
+                ("7.1.0", self.__backwardCompatibilityFrom_7_0),
+                ("7.2.0", self.__backwardCompatibilityFrom_7_1),
+                ("7.3.0", self.__backwardCompatibilityFrom_7_2),
+                ("8.0.0", self.__backwardCompatibilityFrom_7_3),
+                ("8.1.0", self.__backwardCompatibilityFrom_8_0)]
 
 
     def __backwardCompatibilityBefore_3_0(self):
@@ -65,6 +65,13 @@ class XMLinitNeptune(BaseXmlInit):
         Verify that all Headings exist only once in the XMLDocument and
         create the missing heading.
         """
+        # Documents already initialized reuse the cached result
+        # (EOS availability influences checks, so is part of the key)
+        init_key = self._initializationKey(prepro, eosWrapper().isActive())
+        if self._loadInitialized(init_key):
+            return ""
+        generation = self.case.generation
+
         msg = self.__initHeading(prepro)
         if msg:
             return msg
@@ -140,6 +147,9 @@ class XMLinitNeptune(BaseXmlInit):
                 MainFieldsModel(self.case).setPredefinedFlow("None")
                 del MainFieldsModel
 
+        if not msg:
+            self._storeInitialized(init_key, generation)
+
         return msg
 
 
@@ -177,34 +187,20 @@ class XMLinitNeptune(BaseXmlInit):
         return msg
 
 
-    def _backwardCompatibilityOldVersion(self, from_vers):
+    def _backwardCompatibilityRules(self):
         """
-        Change XML in order to ensure backward compatibility for old version
-        there is nothing to do for 2.1 to 2.2
+        Return the list of (version, function) backward compatibility rules
+        (there is nothing to do for 2.1 to 2.2).
         """
-        if (from_vers <= "-1.0") or (from_vers[:3] < "3.0"):
-            self.__backwardCompatibilityFrom_2_0()
-            self.__backwardCompatibilityFrom_2_2()
-
-        if from_vers[:3] < "5.0":
-            if from_vers[:3] < "4.3":
-                self.__backwardCompatibilityFrom_4_2()
-
-            self.__backwardCompatibilityFrom_4_4()
-
-        if from_vers[:3] < "7.0":
-            if from_vers[:3] < "6.1":
-                self.__backwardCompatibilityFrom_6_0()
-            if from_vers[:3] < "6.2":
-                self.__backwardCompatibilityFrom_6_1()
-            if from_vers[:3] < "6.4":
-                self.__backwardCompatibilityFrom_6_3()
-
-        if from_vers[:3] < "8.0":
-            if from_vers[:3] < "7.1":
-                self.__backwardCompatibilityFrom_7_0()
-            if from_vers[:3] < "7.2":
-                self.__backwardCompatibilityFrom_7_1()
+        return [("3.0", self.__backwardCompatibilityFrom_2_0),
+                ("3.0", self.__backwardCompatibilityFrom_2_2),
+                ("4.3", self.__backwardCompatibilityFrom_4_2),
+                ("5.0", self.__backwardCompatibilityFrom_4_4),
+                ("6.1", self.__backwardCompatibilityFrom_6_0),
+                ("6.2", self.__backwardCompatibilityFrom_6_1),
+                ("6.4", self.__backwardCompatibilityFrom_6_3),
+                ("7.1", self.__backwardCompatibilityFrom_7_0),
+                ("7.2", self.__backwardCompatibilityFrom_7_1)]
 
 
     def __backwardCompatibilityFrom_2_0(self):
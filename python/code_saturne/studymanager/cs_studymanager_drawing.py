@@ -27,6 +27,7 @@
 #-------------------------------------------------------------------------------
 
 import os, sys, string, logging, traceback
+import io
 from string import *
 
 #-------------------------------------------------------------------------------
@@ -41,6 +42,8 @@ except ImportError:
 
 matplotlib.use("Agg")
 
+import numpy
+
 #-------------------------------------------------------------------------------
 # matplotlib config
 #-------------------------------------------------------------------------------
@@ -83,6 +86,110 @@ log = logging.getLogger(__file__)
 log.setLevel(logging.NOTSET)
 #log.setLevel(logging.DEBUG)
 
+#===============================================================================
+# Data files loader
+#===============================================================================
+
+# Parsed data files, indexed by path (with modification time and size
+# used to check the cached data is still valid)
+
+_data_files = {}
+
+#-------------------------------------------------------------------------------
+
+def _parse_data_rows(rows):
+    """
+    Parse data lines with possibly varying numbers of columns
+    (missing values are set to NaN).
+    """
+    values = []
+    n_cols = 0
+    for line in rows:
+        l = []
+        for x in line.split():
+            try:
+                l.append(float(x))
+            except ValueError:
+                l.append(numpy.nan)
+        n_cols = max(n_cols, len(l))
+        values.append(l)
+
+    a = numpy.full((len(values), n_cols), numpy.nan)
+    for i, l in enumerate(values):
+        a[i, :len(l)] = l
+
+    return a
+
+#-------------------------------------------------------------------------------
+
+def load_data_file(file_name):
+    """
+    Load a data file (columns separated by spaces, ", " or ";", with
+    lines starting with '#' ignored, and a possible CSV header line).
+    The file is parsed only once, and the result is shared by all curves
+    using it as long as the file is not modified.
+    Return a tuple containing a 2D array of values (one column per data
+    column), a boolean indicating whether a header line was skipped, and
+    a boolean indicating whether some values were missing or invalid
+    (in which case they are set to NaN).
+    """
+    key = os.path.realpath(file_name)
+    st = os.stat(key)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    d = _data_files.get(key)
+    if d is not None and d[0] == stamp:
+        return d[1]
+
+    with open(file_name, 'r') as f:
+        text = f.read()
+
+    # Keep only data lines (same filtering as with the line by line
+    # parsing used by curves previously)
+
+    rows = []
+    header = False
+    for line in text.splitlines():
+        line = line.lstrip()
+        if line and line[0] != '#':
+            line = line.replace(", ", " ") # compatibility with CSV
+            line = line.replace(";", " ")  # compatibility with CSV
+            rows.append(line)
+
+    # for CSV files, try to detect a header to skip it
+    if rows:
+        try:
+            val = float(rows[0].split()[0])
+        except ValueError:
+            header = True
+            rows = rows[1:]
+
+    # Parse all values at once when possible
+
+    invalid = False
+    if not rows:
+        data = numpy.zeros((0, 0))
+    else:
+        try:
+            data = numpy.loadtxt(io.StringIO("\n".join(rows)), ndmin=2,
+                                 comments=None)
+        except ValueError:
+            data = _parse_data_rows(rows)
+            invalid = True
+
+    result = (data, header, invalid)
+    _data_files[key] = (stamp, result)
+
+    return result
+
+#-------------------------------------------------------------------------------
+
+def clear_data_files_cache():
+    """
+    Release data from files loaded by load_data_file.
+    """
+    _data_files.clear()
+
 #===============================================================================
 # Plot class
 #===============================================================================
@@ -105,9 +212,9 @@ class Plot(object):
         self.ismesure = False
         self.cmd      = []
 
-        # Open file of data
+        # Load file of data (shared with other curves)
 
-        self.f = open(file, 'r')
+        self.data, self.header, self.invalid = load_data_file(file)
 
         # Read mandatory attributes
         self.subplots = [int(s) for s in parser.getAttribute(node, "spids").split()]
@@ -149,16 +256,9 @@ class Plot(object):
         except:
             yerrp = None
 
-        self.f.close()
-
         # Error Bar
-        self.f = open(file, 'r')
         self.xerr = self.uploadErrorBar(xerr, xerrp, xcol)
-        self.f.close()
-
-        self.f = open(file, 'r')
         self.yerr = self.uploadErrorBar(yerr, yerrp, ycol)
-        self.f.close()
 
         # List of additional matplotlib commands
         for k, v in parser.getAttributes(node).items():
@@ -183,41 +283,47 @@ class Plot(object):
 
     #---------------------------------------------------------------------------
 
+    def column(self, col):
+        """
+        Return a column of the data file (view on the shared data),
+        or None if it is not present.
+        """
+        if col < 1 or col > self.data.shape[1]:
+            return None
+        return self.data[:, col-1]
+
+    #---------------------------------------------------------------------------
+
     def uploadData(self, xcol, ycol, xplus, xscale, yplus, yscale):
         """
-        Upload and parse data
+        Extract curve data from the loaded file
         """
-        j = 0
         error = ""
+        if self.invalid:
+            error = "    Please verify data, number of columns and lines"
 
-        for line in self.f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                j += 1
-                line = line.replace(", ", " ") # compatibility with CSV
-                line = line.replace(";", " ") # compatibility with CSV
-                line = line.lstrip()
-
-                # for CSV files, try to detect a header to skip it
-                if j == 1:
-                    try:
-                        val = float(line.split()[0])
-                    # if it can not be converted to float
-                    except ValueError as not_float:
-                        continue
-
-                if xcol:
-                    try:
-                        self.xspan.append(float(line.split()[xcol-1])*xscale + xplus)
-                    except:
-                        error = "    Please verify data, number of columns and lines"
-                else:
-                    self.xspan.append(j)
+        n = self.data.shape[0]
 
-                try:
-                    self.yspan.append(float(line.split()[ycol-1])*yscale + yplus)
-                except:
-                    error = "    Please verify data, number of columns and lines"
+        if xcol:
+            x = self.column(xcol)
+            if x is None:
+                error = "    Please verify data, number of columns and lines"
+                self.xspan = numpy.zeros(0)
+            else:
+                self.xspan = x*xscale + xplus
+        else:
+            # line numbers (counting a possible header line)
+            j0 = 1
+            if self.header:
+                j0 = 2
+            self.xspan = numpy.arange(j0, j0 + n)
+
+        y = self.column(ycol)
+        if y is None:
+            error = "    Please verify data, number of columns and lines"
+            self.yspan = numpy.zeros(0)
+        else:
+            self.yspan = y*yscale + yplus
 
         return error
 
@@ -225,7 +331,7 @@ class Plot(object):
 
     def uploadErrorBar(self, errorbar, errorp, col):
         """
-        load and parse data for Measurement uncertainty
+        Extract data for Measurement uncertainty from the loaded file
         """
         if errorbar is None and errorp is None:
             return None
@@ -237,66 +343,19 @@ class Plot(object):
                       "The error definition by percentage will be ignored.")
 
             if len(errorbar) == 2:
-                error = [ [], [] ]
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.replace(";", " ")  # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error[0].append(float(line.split()[errorbar[0]-1]))
-                        error[1].append(float(line.split()[errorbar[1]-1]))
-                return error
+                return numpy.array([self.column(errorbar[0]),
+                                    self.column(errorbar[1])])
 
             elif len(errorbar) == 1:
-                error = []
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.replace(";", " ")  # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error.append(float(line.split()[errorbar[0]-1]))
-                return error
+                return self.column(errorbar[0])
+
         elif errorp:
             if col == 0:
                 print("Error: can not compute errors by percentage of an "
                       "unspecified data set (column number missing).\n")
                 sys.exit(1)
             else:
-                error = []
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.replace(";", " ")  # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error.append(errorp/100.*float(line.split()[col-1]))
-                return error
+                return errorp/100.*self.column(col)
 
 #===============================================================================
 # Probes class
@@ -323,30 +382,12 @@ class Probes(object):
 
         xcol = 1
 
-        f = open(file_name, 'r')
-
-        j = 0
-
-        for line in f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                j += 1
-                line = line.replace(", ", " ") # compatibility with CSV
-                line = line.replace(";", " ")  # compatibility with CSV
-                line = line.lstrip()
-
-                # for CSV files, try to detect a header to skip it
-                if j == 1:
-                    try:
-                        val = float(line.split()[0])
-                    # if it can not be converted to float
-                    except ValueError as not_float:
-                        continue
+        # Load file of data (shared with other probes)
 
-                self.xspan.append(float(line.split()[xcol - 1]))
-                self.yspan.append(float(line.split()[ycol - 1]))
+        data = load_data_file(file_name)[0]
 
-        f.close()
+        self.xspan = data[:, xcol - 1]
+        self.yspan = data[:, ycol - 1]
 
     #---------------------------------------------------------------------------
 
@@ -550,34 +591,29 @@ class Plotter(object):
         self.curves  = []
         self.figures = []
 
+        # figures being rendered by worker processes
+        self.__executor = None
+        self.__jobs = []
+        self.__jobs_figures = []
+
     #---------------------------------------------------------------------------
 
     def __number_of_column(self, file_name):
         """
         Compute the number of column of the data file.
         """
-        nbr = 0
-        f = open(file_name, 'r')
-        for line in f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                nbr = len(line.split())
-                break
-        f.close()
-        return nbr
+        return load_data_file(file_name)[0].shape[1]
 
     #---------------------------------------------------------------------------
 
-    def plot_study(self, study_label, study_object, disable_tex, default_fmt):
+    def prepare_study(self, study_label, study_object, default_fmt):
         """
-        Method used to plot all plots from a I{study_label} (all cases).
+        Read the data of all plots from a I{study_label} (all cases),
+        and return the list of figures to render, with their file names
+        (without extension).
         @type study_label: C{String}
         @param study_label: label of a study
-
         """
-        # disable tex in Matplotlib (use Mathtext instead)
-        rcParams['text.usetex'] = not disable_tex
-
         # Read the parser for the Measurements Files
         nodes_list, files = self.parser.getMeasurement(study_label)
         for i in range(len(files)):
@@ -696,14 +732,8 @@ class Plotter(object):
                                        subplots,
                                        default_fmt))
 
-        # create one figure and use it for all figures
-        # this figure is the current figure
-        fig = plt.figure()
-
+        figures = []
         for figure in self.figures:
-            # Plot curve
-            self.plot_figure(figure)
-
             f = os.path.join(self.parser.getDestination(),
                              study_label,
                              "POST",
@@ -713,12 +743,133 @@ class Plotter(object):
             # the detailed report without the png or pdf extension.
             study_object.matplotlib_figures.append(f)
 
+            figures.append((figure, f))
+
+        return figures
+
+    #---------------------------------------------------------------------------
+
+    def plot_study(self, study_label, study_object, disable_tex, default_fmt):
+        """
+        Method used to plot all plots from a I{study_label} (all cases).
+        @type study_label: C{String}
+        @param study_label: label of a study
+
+        """
+        # disable tex in Matplotlib (use Mathtext instead)
+        rcParams['text.usetex'] = not disable_tex
+
+        figures = self.prepare_study(study_label, study_object, default_fmt)
+
+        # create one figure and use it for all figures
+        # this figure is the current figure
+        fig = plt.figure()
+
+        for figure, f in figures:
+            # Plot curve
+            self.plot_figure(figure)
+
             # save the figure
             self.__save(f, figure)
 
         # close current figure
         plt.close()
 
+        # release loaded data
+        clear_data_files_cache()
+
+    #---------------------------------------------------------------------------
+
+    def plot_studies(self, studies, disable_tex, default_fmt, n_jobs):
+        """
+        Method used to plot all plots from several studies, rendering
+        figures concurrently using a pool of n_jobs processes.
+        Data of all studies is read first, so that it is shared by
+        the worker processes when they are forked.
+        Rendering is asynchronous: use wait to wait for the figures.
+        @type studies: C{List} of C{Tuple}
+        @param studies: list of (label, study object) tuples
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        global _pending_figures
+
+        self.wait()
+
+        usetex = not disable_tex
+
+        figures = []
+        for study_label, study_object in studies:
+            figures += self.prepare_study(study_label, study_object,
+                                          default_fmt)
+
+        if not figures:
+            clear_data_files_cache()
+            return
+
+        # With forked processes, figures and their data are inherited by the
+        # worker processes, so only their index needs to be transmitted.
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            _pending_figures = figures
+            mp_context = multiprocessing.get_context('fork')
+            self.__executor = ProcessPoolExecutor(max_workers=n_jobs,
+                                                  mp_context=mp_context)
+            for i in range(len(figures)):
+                job = self.__executor.submit(_render_pending_figure,
+                                             i, usetex)
+                self.__jobs.append(job)
+        else:
+            self.__executor = ProcessPoolExecutor(max_workers=n_jobs)
+            for figure, f in figures:
+                job = self.__executor.submit(render_figure,
+                                             figure, f, usetex)
+                self.__jobs.append(job)
+
+        self.__jobs_figures = figures
+
+    #---------------------------------------------------------------------------
+
+    def wait(self):
+        """
+        Wait for figures rendered by plot_studies.
+        """
+        global _pending_figures
+
+        if not self.__executor:
+            return
+
+        for job, (figure, f) in zip(self.__jobs, self.__jobs_figures):
+            try:
+                job.result()
+            except Exception:
+                print("    /!\ ERROR while rendering figure: " + f)
+                traceback.print_exc()
+
+        self.__executor.shutdown()
+        self.__executor = None
+        self.__jobs = []
+        self.__jobs_figures = []
+
+        _pending_figures = []
+
+        # release loaded data
+        clear_data_files_cache()
+
+    #---------------------------------------------------------------------------
+
+    def render_figure(self, figure, f):
+        """
+        Plot and save a single figure, using a new matplotlib figure.
+        """
+        fig = plt.figure()
+        try:
+            self.plot_figure(figure)
+            self.__save(f, figure)
+        finally:
+            plt.close(fig)
+
     #---------------------------------------------------------------------------
 
     def __draw_curve(self, ax, curve, p):
@@ -735,7 +886,7 @@ class Plotter(object):
         yerr = curve.yerr
 
         # draw curve with error bars
-        if xerr or yerr:
+        if xerr is not None or yerr is not None:
             lines = ax.errorbar(xspan, yspan,
                                 xerr=xerr,
                                 yerr=yerr,
@@ -900,4 +1051,32 @@ class Plotter(object):
             else:
                 plt.savefig(f, format=fmt)
 
+#===============================================================================
+# Figure rendering in worker processes
+#===============================================================================
+
+# Figures being rendered by Plotter.plot_studies (inherited by forked
+# worker processes)
+
+_pending_figures = []
+
+#-------------------------------------------------------------------------------
+
+def render_figure(figure, file_name, usetex):
+    """
+    Plot and save a single figure (in a worker process).
+    """
+    rcParams['text.usetex'] = usetex
+    Plotter(None).render_figure(figure, file_name)
+
+#-------------------------------------------------------------------------------
+
+def _render_pending_figure(i, usetex):
+    """
+    Plot and save a figure inherited from the parent process
+    (in a forked worker process).
+    """
+    figure, file_name = _pending_figures[i]
+    render_figure(figure, file_name, usetex)
+
 #-------------------------------------------------------------------------------
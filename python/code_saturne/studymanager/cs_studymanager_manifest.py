@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of code_saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2024 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module handles manifests of the inputs of studymanager runs, so that
+a run whose inputs are identical to those of a previous successful run
+may reuse its results instead of being computed again.
+
+A manifest (smgr_inputs.json) is written in each run directory, and an
+index of run directories by input digest is maintained in a user cache
+directory, so that runs of other destinations may also be reused.
+The run times of previous runs of each case are also recorded in that
+directory, so as to estimate the duration of batches.
+
+This module defines the following functions:
+- get_results_index_dir
+- input_digest
+- write_manifest
+- read_manifest
+- register_run
+- find_run
+- read_runtimes
+- record_runtimes
+"""
+
+#-------------------------------------------------------------------------------
+# Standard modules import
+#-------------------------------------------------------------------------------
+
+import os
+import hashlib
+import json
+import threading
+
+#-------------------------------------------------------------------------------
+# Application modules import
+#-------------------------------------------------------------------------------
+
+from code_saturne.base.cs_compile import package_stamp
+
+#-------------------------------------------------------------------------------
+
+manifest_name = 'smgr_inputs.json'
+
+runtimes_name = 'runtimes.json'
+
+# Directories of a case which contain results rather than inputs
+
+_output_dirs = ('RESU', 'RESU_COUPLING', '__pycache__')
+
+# Digests of files already read, by path, size and modification time
+# (mesh files are usually shared by many cases)
+
+_file_digests = {}
+
+# Options of parametric setup arguments referring to meshes
+
+_parametric_mesh_options = ('-m', '--mesh', '--mi', '--mesh_input')
+
+#-------------------------------------------------------------------------------
+
+def get_results_index_dir():
+    """
+    Return the directory of the index of run directories by input digest,
+    or None if result reuse is disabled (CS_SMGR_CACHE_DIR set to "none").
+    """
+    cache_dir = os.getenv('CS_SMGR_CACHE_DIR')
+    if cache_dir:
+        if cache_dir.lower() in ('none', 'no', 'off'):
+            return None
+        return cache_dir
+
+    cache_dir = os.getenv('XDG_CACHE_HOME')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'code_saturne', 'studymanager')
+
+#-------------------------------------------------------------------------------
+
+def _file_digest(path):
+    """
+    Return the digest of a file's contents.
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    d = _file_digests.get(key)
+    if d is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for b in iter(lambda: f.read(1 << 20), b''):
+                h.update(b)
+        d = h.hexdigest()
+        _file_digests[key] = d
+    return d
+
+#-------------------------------------------------------------------------------
+
+def _dir_digests(path, items, prefix):
+    """
+    Add digests of files in a directory (recursively, excluding result
+    directories and temporary files) to a dictionary of items.
+    """
+    if not os.path.isdir(path):
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in _output_dirs)
+        rel = os.path.relpath(root, path)
+        for f in sorted(files):
+            # Filter temporary files left by some editors.
+            if f[0] == '#' or f[-1] == '~':
+                continue
+            p = os.path.join(root, f)
+            if not os.path.isfile(p):
+                continue
+            k = prefix + '/' + os.path.normpath(os.path.join(rel, f))
+            items[k] = _file_digest(p)
+
+#-------------------------------------------------------------------------------
+
+def _is_in_dir(path, d):
+    """
+    Check if a path is inside a given directory.
+    """
+    path = os.path.realpath(path)
+    d = os.path.realpath(d)
+    return os.path.commonpath([path, d]) == d
+
+#-------------------------------------------------------------------------------
+
+def _find_input(name, search_dirs):
+    """
+    Return the path of an input file or directory, given its name
+    (absolute, or relative to one of the search directories), or None.
+    """
+    name = os.path.expanduser(name)
+    if os.path.isabs(name):
+        candidates = [name]
+    else:
+        candidates = [os.path.join(d, name) for d in search_dirs if d]
+    for p in candidates:
+        if os.path.exists(p):
+            return p
+    return None
+
+#-------------------------------------------------------------------------------
+
+def _mesh_input_digests(case_dir, mesh_dir, parametric, items):
+    """
+    Add digests of the meshes referenced by a case's setup (XML setup
+    files of its DATA directories and parametric setup arguments) to a
+    dictionary of items, for meshes outside the case and mesh directories
+    (whose files are already included).
+    Return False if a referenced mesh is not found, or if meshes may be
+    defined by user scripts, as the inputs of the case are then unknown.
+    """
+    from code_saturne.base.cs_xml_reader import Parser
+
+    study_dir = os.path.dirname(case_dir)
+
+    names = []
+    search_dirs = [mesh_dir]
+
+    for root, dirs, files in os.walk(case_dir):
+        dirs[:] = sorted(d for d in dirs if d not in _output_dirs)
+        if os.path.basename(root) != 'DATA':
+            continue
+        domain_dir = os.path.dirname(root)
+        if 'cs_user_scripts.py' in files:
+            with open(os.path.join(root, 'cs_user_scripts.py'),
+                      errors='ignore') as f:
+                if 'mesh' in f.read():
+                    return False
+        for f in sorted(files):
+            if f[-4:] != '.xml':
+                continue
+            try:
+                params = Parser(os.path.join(root, f),
+                                version_str=None).getParams()
+            except Exception:
+                continue
+            dirs_f = [domain_dir, study_dir]
+            if params.get('mesh_dir'):
+                d = os.path.join(case_dir,
+                                 os.path.expanduser(params['mesh_dir']))
+                dirs_f.insert(0, d)
+                search_dirs.append(d)
+            dirs_f.append(mesh_dir)
+            for m in (params.get('meshes') or []):
+                if type(m) == tuple:
+                    m = m[0]
+                names.append((m, dirs_f))
+            for k in ('mesh_input', 'restart_mesh_input'):
+                if params.get(k):
+                    names.append((params[k], dirs_f))
+
+    if parametric:
+        l = parametric.split()
+        for i, a in enumerate(l[:-1]):
+            if a in _parametric_mesh_options:
+                names.append((l[i+1], search_dirs))
+
+    for name, dirs in names:
+        # Results of other runs are accounted for by their digests
+        # (as dependencies of this case).
+        parts = os.path.normpath(name).split(os.sep)
+        if not os.path.isabs(name) \
+           and ('RESU' in parts or 'RESU_COUPLING' in parts):
+            continue
+        p = _find_input(name, dirs)
+        if p is None:
+            return False
+        if _is_in_dir(p, case_dir) or _is_in_dir(p, mesh_dir):
+            continue
+        k = 'input:' + os.path.realpath(p)
+        if os.path.isdir(p):
+            _dir_digests(p, items, k)
+        else:
+            items[k] = _file_digest(p)
+
+    return True
+
+#-------------------------------------------------------------------------------
+
+def input_digest(pkg, case_dir, mesh_dir, args, depends=[]):
+    """
+    Return the digest of a case's inputs, and a dictionary describing
+    those inputs: files of the case and mesh directories (in the
+    repository), other meshes referenced by the case, run arguments,
+    installed package, and digests of the cases it depends on.
+    The digest is None if the inputs could not be determined.
+    """
+    items = {}
+
+    _dir_digests(case_dir, items, 'case')
+    _dir_digests(mesh_dir, items, 'mesh')
+
+    if not _mesh_input_digests(case_dir, mesh_dir,
+                               args.get('parametric'), items) \
+       or None in depends:
+        return None, items
+
+    for k in args:
+        items['args/' + k] = str(args[k])
+
+    items['package'] = package_stamp(pkg)
+
+    for i, d in enumerate(depends):
+        items['depends/' + str(i)] = d
+
+    h = hashlib.sha256()
+    for k in sorted(items):
+        h.update(k.encode('utf-8'))
+        h.update(b'\0')
+        h.update(items[k].encode('utf-8'))
+        h.update(b'\0')
+
+    return h.hexdigest(), items
+
+#-------------------------------------------------------------------------------
+
+def write_manifest(run_dir, digest, items):
+    """
+    Write the manifest of a run's inputs in its run directory.
+    """
+    try:
+        path = os.path.join(run_dir, manifest_name)
+        tmp_path = path + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'digest': digest, 'inputs': items}, f,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+#-------------------------------------------------------------------------------
+
+def read_manifest(run_dir):
+    """
+    Return the input digest recorded in a run directory, or None.
+    """
+    try:
+        with open(os.path.join(run_dir, manifest_name)) as f:
+            return json.load(f)['digest']
+    except Exception:
+        return None
+
+#-------------------------------------------------------------------------------
+
+def register_run(run_dir, digest):
+    """
+    Register a run directory in the index, so that it may be found
+    based on its input digest (silently ignoring failures, as the index
+    is only an optimization).
+    """
+    index_dir = get_results_index_dir()
+    if not index_dir:
+        return
+
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, digest)
+        tmp_path = path + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            f.write(os.path.realpath(run_dir))
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+#-------------------------------------------------------------------------------
+
+def find_run(digest, candidates=[]):
+    """
+    Return the path of a run directory whose manifest matches a given
+    input digest, looking first in candidate directories, then in the
+    index. Return None if no such run was found.
+    The state of the run should then be checked by the caller.
+    """
+    index_dir = get_results_index_dir()
+
+    run_dirs = list(candidates)
+    if index_dir:
+        try:
+            with open(os.path.join(index_dir, digest)) as f:
+                run_dirs.append(f.read().strip())
+        except Exception:
+            pass
+
+    for run_dir in run_dirs:
+        if read_manifest(run_dir) == digest:
+            return os.path.realpath(run_dir)
+
+    return None
+
+#-------------------------------------------------------------------------------
+
+def read_runtimes():
+    """
+    Return a dictionary of the run times (in seconds) of previous runs,
+    by case key.
+    """
+    index_dir = get_results_index_dir()
+    if not index_dir:
+        return {}
+
+    try:
+        with open(os.path.join(index_dir, runtimes_name)) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+#-------------------------------------------------------------------------------
+
+def record_runtimes(runtimes):
+    """
+    Update the recorded run times with a dictionary of run times
+    (in seconds) by case key (silently ignoring failures).
+    """
+    index_dir = get_results_index_dir()
+    if not index_dir or not runtimes:
+        return
+
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        path = os.path.join(index_dir, runtimes_name)
+        d = read_runtimes()
+        d.update(runtimes)
+        tmp_path = path + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(d, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        pass
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -51,10 +51,13 @@ log.setLevel(logging.NOTSET)
 
 #-------------------------------------------------------------------------------
 
-def run_studymanager_command(_c, _log):
+def run_studymanager_command(_c, _log, cwd=None):
     """
     Run command with arguments.
     Redirection of the stdout or stderr of the command.
+    If cwd is given, the command is run in that directory (this does not
+    change the working directory of the current process, so it is safe
+    to use from several threads).
     """
     assert type(_c) == str or type(_c) == unicode
 
@@ -69,7 +72,7 @@ def run_studymanager_command(_c, _log):
         return "\n\nExecution failed --> %s: %s" \
                 "\n - command: %s"                \
                 "\n - directory: %s\n\n" %        \
-                (_t, str(retcode), _c, os.getcwd())
+                (_t, str(retcode), _c, cwd or os.getcwd())
 
     _l = ""
 
@@ -79,7 +82,8 @@ def run_studymanager_command(_c, _log):
 
     try:
         t1 = time.time()
-        retcode = run_command(cmd, stdout=_log, stderr=_log, env=env)
+        retcode = run_command(cmd, stdout=_log, stderr=_log, env=env,
+                              cwd=cwd)
         t2 = time.time()
 
         if retcode < 0:
@@ -107,3 +111,97 @@ def run_studymanager_command(_c, _log):
     return retcode, "%.2f" % (t2 - t1)
 
 #-------------------------------------------------------------------------------
+
+# Package used by staging worker processes (set by init_staging_worker)
+
+_staging_pkg = None
+
+def init_staging_worker(pkg):
+    """
+    Initialize a staging worker process, setting the package used
+    for all cases staged by this process.
+    """
+    global _staging_pkg
+    _staging_pkg = pkg
+
+#-------------------------------------------------------------------------------
+
+def stage_studymanager_case(stages, log_path):
+    """
+    Prepare run folders in the current (worker) process, calling
+    the run command's staging directly instead of a new
+    "code_saturne run --stage" process.
+    stages is a list of (args, cwd) tuples, handled in order, where
+    args are the arguments of the "run" command. The output of each
+    stage is appended to the log file, as with run_studymanager_command.
+    As the staging may change the working directory and environment,
+    this should be called in a separate process (see init_staging_worker).
+    Returns the smallest return code and elapsed time.
+    """
+    from code_saturne.base import cs_run
+
+    home = os.getcwd()
+    environ = dict(os.environ)
+    argv = sys.argv
+
+    retcode = None
+    t1 = time.time()
+
+    with open(log_path, mode='a') as _log:
+
+        for args, cwd in stages:
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _log.flush()
+            fd_out = os.dup(1)
+            fd_err = os.dup(2)
+            os.dup2(_log.fileno(), 1)
+            os.dup2(_log.fileno(), 2)
+
+            # command line as seen by the run command
+            sys.argv = [argv[0], 'run'] + list(args)
+
+            try:
+                os.chdir(cwd)
+                retval = cs_run.main(args, _staging_pkg)
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    retval = e.code or 0
+                else:
+                    retval = 1
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                retval = 1
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(fd_out, 1)
+            os.dup2(fd_err, 2)
+            os.close(fd_out)
+            os.close(fd_err)
+
+            sys.argv = argv
+            os.chdir(home)
+            os.environ.clear()
+            os.environ.update(environ)
+
+            if retval != 0:
+                _log.write("\n\nExecution failed --> staging return: %s"
+                           "\n - arguments: %s"
+                           "\n - directory: %s\n\n"
+                           % (str(retval), " ".join(args), cwd))
+
+            # negative retcode is kept
+            if retcode is None or retval < retcode:
+                retcode = retval
+
+    if retcode is None:
+        retcode = 1
+
+    t2 = time.time()
+
+    return retcode, "%.2f" % (t2 - t1)
+
+#-------------------------------------------------------------------------------
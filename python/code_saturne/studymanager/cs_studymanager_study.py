@@ -44,6 +44,7 @@ from collections import OrderedDict
 from code_saturne.base.cs_compile import files_to_compile, compile_and_link
 from code_saturne.base import cs_create, cs_batch, cs_xml_reader
 from code_saturne.base.cs_case import case_state, get_case_state
+from code_saturne.base.cs_case import run_state_index
 from code_saturne.base.cs_create import set_executable, create_local_launcher
 from code_saturne.base import cs_exec_environment, cs_run_conf
 
@@ -54,13 +55,17 @@ from code_saturne.studymanager.cs_studymanager_parser import Parser
 from code_saturne.studymanager.cs_studymanager_texmaker import Report
 
 try:
-    from code_saturne.studymanager.cs_studymanager_drawing import Plotter
+    from code_saturne.base import cs_io_reader
 except Exception:
-    print("Warning: import studymanager Plotter failed. Plotting disabled.\n")
-    pass
+    # NumPy not available; use cs_io_dump for comparisons
+    cs_io_reader = None
 
 from code_saturne.studymanager.cs_studymanager_run import run_studymanager_command
+from code_saturne.studymanager.cs_studymanager_run import init_staging_worker
+from code_saturne.studymanager.cs_studymanager_run import stage_studymanager_case
 from code_saturne.studymanager.cs_studymanager_xml_init import smgr_xml_init
+from code_saturne.studymanager.cs_studymanager_manifest import input_digest, \
+    write_manifest, register_run, find_run, read_runtimes, record_runtimes
 
 #-------------------------------------------------------------------------------
 # log config.
@@ -78,6 +83,64 @@ def nodot(item):
 
 #-------------------------------------------------------------------------------
 
+# Function and items handled by map_cases (inherited by forked processes,
+# as cases cannot be pickled)
+
+_mapped_call = None
+
+def _call_mapped(i):
+    function, items = _mapped_call
+    return function(items[i])
+
+#-------------------------------------------------------------------------------
+
+def map_cases(function, cases, n_jobs):
+    """
+    Return the list of results of function applied to each case,
+    in the same order, using a pool of up to n_jobs processes.
+    The function (which is not pickled, so may be a bound method)
+    and cases are inherited by forked worker processes, so results
+    must be returned rather than stored in cases; processes are not
+    used if they cannot be forked.
+    """
+    import multiprocessing
+
+    n_jobs = min(n_jobs, len(cases))
+    if n_jobs < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(case) for case in cases]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _mapped_call
+    _mapped_call = (function, cases)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        mp_context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=mp_context) as executor:
+            chunksize = max(1, len(cases) // (4*n_jobs))
+            results = list(executor.map(_call_mapped, range(len(cases)),
+                                        chunksize=chunksize))
+    finally:
+        _mapped_call = None
+
+    return results
+
+#-------------------------------------------------------------------------------
+
+class message_list(list):
+    """
+    List of messages, used instead of Studies for reporting
+    in worker processes.
+    """
+    def reporting(self, msg, *args, **kwargs):
+        self.append(msg)
+
+#-------------------------------------------------------------------------------
+
 def create_base_xml_file(filepath, pkg):
     """Create studymanager XML file.
     """
@@ -210,6 +273,8 @@ class Case(object):
         self.m_size_eq     = True # mesh sizes equal (in case of comparison)
         self.subdomains    = None
         self.level         = None # level of the node in the dependency graph
+        self.inputs        = None # digest and description of inputs
+        self.reused        = None # path of previous run reused, if any
 
         # Run_dir and Title are based on study, label and run_id
         self.resu = "RESU"
@@ -374,89 +439,95 @@ class Case(object):
 
     #---------------------------------------------------------------------------
 
-    def prepare_run_folder(self):
+    def __staging_args(self, refdir):
         """
-        Prepare a run folder in destination directory run_dir
+        Return arguments of the run command used to stage the case.
         """
-        log_lines = []
-        e = os.path.join(self.pkg.get_dir('bindir'), self.exe)
-        home = os.getcwd()
-        os.chdir(self.__dest)
+        cmd = "--stage --case " + refdir \
+                + " --dest " + self.__dest \
+                + " --id " + self.run_id
+
+        if self.notebook:
+            cmd += " --notebook-args " + self.notebook
 
-        have_status_prepared = False
+        if self.parametric:
+            cmd += " --parametric-args " + '"' + self.parametric + '"'
+
+        if self.kw_args:
+            if self.kw_args.find(" ") < 0:
+                self.kw_args += " "  # workaround for arg-parser issue
+            cmd += " --kw-args " + '"' + self.kw_args + '"'
+
+        return cs_exec_environment.separate_args(cmd)
+
+    #---------------------------------------------------------------------------
+
+    def prepare_run_folder(self, executor):
+        """
+        Submit the preparation of a run folder in destination directory
+        run_dir to the given executor (a pool of staging processes).
+        The preparation is finished by finish_run_folder.
+        """
+        self.__have_status_prepared = False
 
         # Create log file in dest (will be moved later and renamed to
         # run_case.log, but named with run_id here in case of asynchronous
         # preparation of multiple runs).
 
-        log_path = os.path.join(self.__dest, "run_" + self.label
-                                + "_" + self.run_id + ".log")
+        self.__staging_log = os.path.join(self.__dest, "run_" + self.label
+                                          + "_" + self.run_id + ".log")
+
+        open(self.__staging_log, mode='w').close()
 
-        log_run = open(log_path, mode='w')
+        stages = []
 
         if self.subdomains:
-            if not os.path.isdir(self.label):
-                os.mkdir(self.label)
-            os.chdir(self.label)
+            label_dir = os.path.join(self.__dest, self.label)
+            if not os.path.isdir(label_dir):
+                os.mkdir(label_dir)
             refdir = os.path.join(self.__repo, self.label)
-            retval = 1
-            resu_coupling = None
             for node in os.listdir(refdir):
                 ref = os.path.join(self.__repo, self.label, node)
 
                 # only loop on code_saturne subdomains
                 if node in self.subdomains:
-
                     # generate folder in dest/STUDY/CASE/RESU_COUPLING/
-                    cmd = e + " run --stage --case " + refdir \
-                            + " --dest " + self.__dest \
-                            + " --id " + self.run_id
-
-                    if self.notebook:
-                        cmd += " --notebook-args " + self.notebook
-
-                    if self.parametric:
-                        cmd += " --parametric-args " + '"' + self.parametric + '"'
-
-                    if self.kw_args:
-                        if self.kw_args.find(" ") < 0:
-                            self.kw_args += " "  # workaround for arg-parser issue
-                        cmd += " --kw-args " + '"' + self.kw_args + '"'
-
-                    node_retval, t = run_studymanager_command(cmd, log_run)
-
-                    # negative retcode is kept
-                    retval = min(node_retval,retval)
+                    stages.append((self.__staging_args(refdir), label_dir))
 
                 elif not os.path.isdir(ref):
-                    shutil.copy2(ref, node)
+                    shutil.copy2(ref, os.path.join(label_dir, node))
 
             create_local_launcher(self.pkg, self.__dest)
-            os.chdir(self.__dest)
         else:
             refdir = os.path.join(self.__repo, self.label)
 
-            cmd = e + " run --stage --case " + refdir \
-                    + " --dest " + self.__dest \
-                    + " --id " + self.run_id
+            # Check if case has already been prepared in dest/STUDY/CASE
 
-            if self.notebook:
-                cmd += " --notebook-args " + self.notebook
+            if os.path.isfile(os.path.join(self.run_dir, "run_status.prepared")):
+                self.__have_status_prepared = True
 
-            if self.parametric:
-                cmd += " --parametric-args " + '"' + self.parametric + '"'
+            stages.append((self.__staging_args(refdir), self.__dest))
 
-            if self.kw_args:
-                if self.kw_args.find(" ") < 0:
-                    self.kw_args += " "  # workaround for arg-parser issue
-                cmd += " --kw-args " + '"' + self.kw_args + '"'
+        return executor.submit(stage_studymanager_case,
+                               stages, self.__staging_log)
 
-            # Check if case has already been prepared in dest/STUDY/CASE
+    #---------------------------------------------------------------------------
 
-            if os.path.isfile(os.path.join(self.run_dir, "run_status.prepared")):
-                have_status_prepared = True
+    def finish_run_folder(self, future):
+        """
+        Wait for the preparation of the run folder submitted by
+        prepare_run_folder, and return the matching log lines.
+        """
+        log_lines = []
+        log_path = self.__staging_log
+        have_status_prepared = self.__have_status_prepared
 
-            retval, t = run_studymanager_command(cmd, log_run)
+        try:
+            retval, t = future.result()
+        except Exception as e:
+            with open(log_path, mode='a') as log_run:
+                log_run.write("\n\nStaging failed --> %s\n\n" % str(e))
+            retval, t = 1, "0.00"
 
         if retval == 0:
             log_lines += ['      * prepare run folder: {0} --> OK ({1} s)'.format(self.title, str(t))]
@@ -465,6 +536,11 @@ class Case(object):
             new_log_path = os.path.join(self.run_dir, "run_case.log")
             os.replace(log_path, new_log_path)
 
+            # record inputs so that the run may be reused later
+            if self.inputs:
+                write_manifest(self.run_dir, *self.inputs)
+                register_run(self.run_dir, self.inputs[0])
+
         else:
             have_case_log = False
             if os.path.isfile(os.path.join(self.run_dir, "run_case.log")):
@@ -486,7 +562,6 @@ class Case(object):
             self.post = "off"
             self.compare = "off"
 
-        os.chdir(home)
         return log_lines
 
     #---------------------------------------------------------------------------
@@ -530,11 +605,11 @@ class Case(object):
 
                 if xml_type == 'code_saturne':
                     from code_saturne.model.XMLinitialize import XMLinit as cs_solver_xml_init
-                    cs_solver_xml_init(case).initialize()
+                    cs_solver_xml_init(case, use_cache=True).initialize()
                 elif xml_type == 'neptune_cfd':
                     try:
                         from code_saturne.model.XMLinitializeNeptune import XMLinitNeptune as nc_solver_xml_init
-                        nc_solver_xml_init(case).initialize()
+                        nc_solver_xml_init(case, use_cache=True).initialize()
                     except ImportError:
                         # Avoid completely failing an update of cases with
                         # mixed solver types when neptune_cfd is not available
@@ -682,25 +757,24 @@ class Case(object):
     def run(self, resource_name=None):
         """
         Launch run in RESU/run_id subdirectory.
+        The working directory of the current process is not changed,
+        so that several cases may be run concurrently.
         """
-        home = os.getcwd()
-        os.chdir(self.run_dir)
-
         run_cmd = self.build_run_cmd(resource_name)
 
         # append run_case.log in run_dir
         file_name = os.path.join(self.run_dir, "run_case.log")
         log_run = open(file_name, mode='a')
 
-        error, self.is_time = run_studymanager_command(run_cmd, log_run)
+        error, self.is_time = run_studymanager_command(run_cmd, log_run,
+                                                       cwd=self.run_dir)
+        log_run.close()
 
         if not error:
             self.is_run = "OK"
         else:
             self.is_run = "KO"
 
-        os.chdir(home)
-
         return error
 
     #---------------------------------------------------------------------------
@@ -729,15 +803,11 @@ class Case(object):
             studies.reporting(msg)
         dest = os.path.join(result, dest, 'checkpoint', 'main.csc')
 
-        cmd = self.__diff + ' ' + repo + ' ' + dest
-
         self.threshold = "default"
         if threshold != None:
-            cmd += ' --threshold ' + threshold
             self.threshold = threshold
 
         if args != None:
-            cmd += (" " + args)
             l = args.split()
             try:
                 i = l.index('--threshold')
@@ -745,6 +815,90 @@ class Case(object):
             except:
                 pass
 
+        if cs_io_reader != None:
+            tab, m_size_eq, msg = self.compare_checkpoints(repo, dest, args)
+            if msg:
+                studies.reporting(msg)
+        else:
+            tab, m_size_eq = self.__run_io_dump_diff(repo, dest, threshold,
+                                                     args)
+
+        os.chdir(home)
+
+        return tab, m_size_eq
+
+    #---------------------------------------------------------------------------
+
+    def compare_checkpoints(self, repo, dest, args=None):
+        """
+        Compare real-valued sections of two checkpoint files using the
+        Python reader (no cs_io_dump subprocess).
+        The "--threshold", "--section" and "--location" options of
+        cs_io_dump are handled in args; other options only affect
+        cs_io_dump output and are ignored.
+        Return a list of [name, max, mean, threshold] for differing
+        sections, a boolean indicating if sizes match, and an
+        error message or None.
+        """
+
+        threshold = 1.e-30
+        if self.threshold != "default":
+            threshold = float(self.threshold)
+
+        sec_name = None
+        location_id = None
+        if args != None:
+            l = args.split()
+            for i in range(len(l) - 1):
+                if l[i] == '--section':
+                    sec_name = l[i+1]
+                elif l[i] == '--location':
+                    location_id = int(l[i+1])
+
+        tab = []
+        m_size_eq = True
+
+        try:
+            diffs, unmatched1, unmatched2 \
+                = cs_io_reader.compare_files(repo, dest,
+                                             threshold=threshold,
+                                             location_id=location_id,
+                                             sec_name=sec_name)
+        except Exception as e:
+            msg = "Warning: comparison of %s and %s failed: %s" \
+                % (repo, dest, str(e))
+            return tab, m_size_eq, msg
+
+        # studymanager compare log only for fields of real values
+        for d in diffs:
+            if d.type_name[0] not in ('r4', 'r8'):
+                continue
+            if d.size_differs():
+                m_size_eq = False
+                break
+            if d.n_diffs > 0:
+                tab.append([d.name.replace("_", "\\_"),
+                            "%g" % d.max,
+                            "%g" % d.mean,
+                            self.threshold])
+
+        return tab, m_size_eq, None
+
+    #---------------------------------------------------------------------------
+
+    def __run_io_dump_diff(self, repo, dest, threshold, args):
+        """
+        Compare two checkpoint files using cs_io_dump, and parse its output.
+        """
+
+        cmd = self.__diff + ' ' + repo + ' ' + dest
+
+        if threshold != None:
+            cmd += ' --threshold ' + threshold
+
+        if args != None:
+            cmd += (" " + args)
+
         l = subprocess.Popen(cmd,
                              shell=True,
                              executable=cs_exec_environment.get_shell_type(),
@@ -783,8 +937,6 @@ class Case(object):
                                     vals[2][1],
                                     self.threshold])
 
-        os.chdir(home)
-
         return tab, m_size_eq
 
     #---------------------------------------------------------------------------
@@ -880,16 +1032,114 @@ class Case(object):
 
     #---------------------------------------------------------------------------
 
-    def get_state(self, run_timeout=3600):
+    def set_inputs(self, depends=[], n_iter=None):
         """
-        Get state based on RESU/run_id subdirectory.
+        Compute the digest of the case's inputs (in the repository),
+        given those of the cases it depends on, and return it
+        (None if the inputs could not be determined).
+        """
+        args = {'notebook': self.notebook,
+                'parametric': self.parametric,
+                'kw_args': self.kw_args,
+                'n_procs': self.n_procs,
+                'n_iterations': n_iter}
+
+        self.inputs = input_digest(self.pkg,
+                                   os.path.join(self.__repo, self.label),
+                                   os.path.join(self.__repo, 'MESH'),
+                                   args, depends)
+        if self.inputs[0] is None:
+            self.inputs = None
+            return None
+
+        return self.inputs[0]
+
+    #---------------------------------------------------------------------------
+
+    def reuse_run(self):
+        """
+        Look for a previous successful run with the same inputs (in the
+        destination or in the index of previous runs), and link it as
+        the case's run directory if found.
+        Return the path of the reused run, or None.
+        """
+        if not self.inputs:
+            return None
+
+        prev = find_run(self.inputs[0], [self.run_dir])
+        if not prev:
+            return None
+
+        state, info = get_case_state(prev, coupling=(self.subdomains != None))
+        if state != case_state.FINALIZED:
+            return None
+
+        if os.path.realpath(self.run_dir) != prev:
+            if os.path.lexists(self.run_dir):
+                return None
+            os.makedirs(os.path.dirname(self.run_dir), exist_ok=True)
+            os.symlink(prev, self.run_dir)
+
+        self.reused = prev
+        self.compute = "off"
+        self.is_run = "OK"
+
+        return prev
+
+    #---------------------------------------------------------------------------
+
+    def runtime_key(self):
+        """
+        Return the key identifying the case in the run time history.
+        """
+        return os.path.join(os.path.realpath(self.__repo), self.label,
+                            self.run_id) + ':' + str(self.n_procs)
+
+    #---------------------------------------------------------------------------
+
+    def get_expected_time(self, runtimes):
+        """
+        Return the expected run time of the case in minutes, based on the
+        run time history if available, or on the reference run in the
+        repository, or on the expected_time attribute otherwise.
+        """
+        t = runtimes.get(self.runtime_key())
+
+        if t is None:
+            ref_dir = os.path.join(self.__repo, self.label, self.resu,
+                                   self.run_id)
+            if os.path.isdir(ref_dir):
+                state, info = get_case_state(ref_dir,
+                                             coupling=(self.subdomains != None))
+                if info['compute_time']:
+                    t = float(info['compute_time'])
+                    if info['preprocess_time']:
+                        t += float(info['preprocess_time'])
+
+        if t is None:
+            return float(self.expected_time)
+
+        # Add a margin for run time variations and staging
+        return 1.25*t/60. + 2.
+
+    #---------------------------------------------------------------------------
+
+    def get_state(self, run_timeout=3600, index=None):
+        """
+        Get state based on RESU/run_id subdirectory,
+        using a run state index if provided.
         """
 
         is_coupling = self.subdomains != None
 
-        state, info = get_case_state(self.run_dir,
-                                     coupling=is_coupling,
-                                     run_timeout=run_timeout)
+        if index != None:
+            state, info = index.get_case_state(self.run_dir,
+                                               coupling=is_coupling,
+                                               run_timeout=run_timeout)
+        else:
+            state, info = get_case_state(self.run_dir,
+                                         coupling=is_coupling,
+                                         run_timeout=run_timeout)
 
         return state, info
 
@@ -1122,10 +1372,13 @@ class Studies(object):
         self.__update_smgr       = options.update_smgr
         self.__update_setup      = options.update_setup
         self.__force_rm          = options.remove_existing
+        self.__reuse             = options.reuse_results
         self.__disable_ow        = options.disable_overwrite
         self.__debug             = options.debug
         self.__state             = options.casestate
         self.__n_procs           = options.n_procs
+        self.__n_jobs            = max(1, options.n_jobs)
+        self.__max_procs         = options.max_procs
         self.__filter_level      = options.filter_level
         self.__filter_n_procs    = options.filter_n_procs
         # Use the provided resoure if forced
@@ -1165,6 +1418,10 @@ class Studies(object):
         if not resource_config['resource_n_procs']:
             resource_config['resource_n_procs'] = 1
 
+        # Processes budget for concurrent local runs
+        if not self.__max_procs:
+            self.__max_procs = int(resource_config['resource_n_procs'])
+
         rm_template = resource_config['batch']
         if rm_template:
             rm_template = os.path.basename(rm_template).lower()
@@ -1320,8 +1577,16 @@ class Studies(object):
             self.__log_file = open(self.__log_name, "w")
 
             # create plotter and post log file
+            # (the plotter is only imported here, as matplotlib is costly
+            # to load and only needed for postprocessing)
 
             if options.post:
+                try:
+                    from code_saturne.studymanager.cs_studymanager_drawing \
+                        import Plotter
+                except Exception:
+                    print("Warning: import studymanager Plotter failed. "
+                          "Plotting disabled.\n")
                 try:
                     self.__plotter = Plotter(self.__parser)
                 except Exception:
@@ -1471,6 +1736,26 @@ class Studies(object):
         study_list = []
         case_list = []
 
+        # Run folders are prepared concurrently by a pool of staging
+        # processes, each of which may prepare several cases (so that the
+        # package is not reloaded for each case). As the staging changes
+        # the working directory and environment, threads are not used.
+
+        staging = OrderedDict()
+        executor = None
+        if run_step:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            mp_context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                mp_context = multiprocessing.get_context('fork')
+            executor = ProcessPoolExecutor(max_workers=self.__n_jobs,
+                                           mp_context=mp_context,
+                                           initializer=init_staging_worker,
+                                           initargs=(self.__pkg,))
+
+        digests = {}
+
         for case in self.graph.graph_dict:
 
             # first step: create study of the case if necessary
@@ -1496,16 +1781,45 @@ class Studies(object):
                                            "are removed (option --rm activated)"
                                            %case.label)
 
-                # thrid step: prepare run folder
-                log_lines = case.prepare_run_folder()
+                # third step: reuse a previous run with the same inputs,
+                # or prepare run folder
+                self.__input_digest(case, digests)
+                if self.__reuse and case.compute == 'on' and case.reuse_run():
+                    staging[case] = None
+                else:
+                    staging[case] = case.prepare_run_folder(executor)
 
-                for line in log_lines:
-                    self.reporting(line)
+        # Report in the same order as the cases
+
+        for case in staging:
+            if staging[case] is None:
+                log_lines = ['      * prepare run folder: {0} --> REUSED ({1})'.format(case.title, case.reused)]
+            else:
+                log_lines = case.finish_run_folder(staging[case])
+            for line in log_lines:
+                self.reporting(line)
+
+        if executor:
+            executor.shutdown()
 
         self.reporting('')
 
     #---------------------------------------------------------------------------
 
+    def __input_digest(self, case, digests):
+        """
+        Return the digest of a case's inputs, including those of
+        the cases it depends on.
+        """
+        if case not in digests:
+            depends = [self.__input_digest(c, digests) \
+                       for c in self.graph.graph_dict.get(case, [])]
+            digests[case] = case.set_inputs(depends, self.__n_iter)
+
+        return digests[case]
+
+    #---------------------------------------------------------------------------
+
     def create_study(self, study):
 
         dest_study = os.path.join(self.__dest, study)
@@ -1741,11 +2055,18 @@ class Studies(object):
 
         self.reporting("  o Run all cases")
 
+        if self.__n_jobs > 1:
+            self.run_parallel()
+            return
+
         for case in self.graph.graph_dict:
 
             self.check_prepro(case)
             if self.__running:
-                if case.compute == 'on' and case.is_compiled != "KO":
+                if case.reused:
+                    self.report_run(case, 0)
+
+                elif case.compute == 'on' and case.is_compiled != "KO":
 
                     if self.__n_iter is not None:
                         case.add_control_file(self.__n_iter)
@@ -1754,51 +2075,197 @@ class Studies(object):
                                    stdout=True, report=False, status=True)
 
                     error = case.run(resource_name = self.__resource_name)
-                    if case.is_time:
-                        is_time = "%s s" % case.is_time
-                    else:
-                        is_time = "existed already"
-
-                    if not error:
-                        self.reporting('    - run %s --> OK (%s)' \
-                                       % (case.title, is_time))
-                        self.__parser.setAttribute(case.node,
-                                                   "compute",
-                                                   "off")
-
-                        # update dest="" attribute
-                        n1 = self.__parser.getChildren(case.node, "compare")
-                        n2 = self.__parser.getChildren(case.node, "script")
-                        n3 = self.__parser.getChildren(case.node, "data")
-                        n4 = self.__parser.getChildren(case.node, "probe")
-                        n5 = self.__parser.getChildren(case.node, "resu")
-                        n6 = self.__parser.getChildren(case.node, "input")
-                        for n in n1 + n2 + n3 + n4 + n5 + n6:
-                            if self.__parser.getAttribute(n, "dest") == "":
-                                self.__parser.setAttribute(n, "dest", case.run_id)
-                    else:
-                        self.reporting('    - run %s --> FAILED (%s)' \
-                                       % (case.title, is_time))
-                        self.reporting('      * see run_case.log in ' + \
-                                       case.run_dir)
+                    self.report_run(case, error)
+
+        self.reporting('')
+
+    #---------------------------------------------------------------------------
+
+    def report_run(self, case, error):
+        """
+        Report the result of a case run, and update the file of parameters
+        accordingly.
+        """
+        if case.reused:
+            is_time = "reused " + case.reused
+        elif case.is_time:
+            is_time = "%s s" % case.is_time
+        else:
+            is_time = "existed already"
+
+        if not error:
+            self.reporting('    - run %s --> OK (%s)' \
+                           % (case.title, is_time))
+            if case.is_time and not case.reused:
+                record_runtimes({case.runtime_key(): float(case.is_time)})
+            self.__parser.setAttribute(case.node,
+                                       "compute",
+                                       "off")
+
+            # update dest="" attribute
+            n1 = self.__parser.getChildren(case.node, "compare")
+            n2 = self.__parser.getChildren(case.node, "script")
+            n3 = self.__parser.getChildren(case.node, "data")
+            n4 = self.__parser.getChildren(case.node, "probe")
+            n5 = self.__parser.getChildren(case.node, "resu")
+            n6 = self.__parser.getChildren(case.node, "input")
+            for n in n1 + n2 + n3 + n4 + n5 + n6:
+                if self.__parser.getAttribute(n, "dest") == "":
+                    self.__parser.setAttribute(n, "dest", case.run_id)
+        else:
+            self.reporting('    - run %s --> FAILED (%s)' \
+                           % (case.title, is_time))
+            self.reporting('      * see run_case.log in ' + \
+                           case.run_dir)
+
+        self.__log_file.flush()
+
+    #---------------------------------------------------------------------------
+
+    def run_parallel(self):
+        """
+        Run all cases concurrently on the local resource.
+        At most n_jobs cases are run at the same time, and the sum of
+        their number of processes may not exceed max_procs (a case
+        requiring more processes than max_procs is run alone).
+        A case is started as soon as the case it depends on is finished.
+        Results are reported and the file of parameters is updated
+        by the calling thread only.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, \
+            FIRST_COMPLETED
+
+        max_procs = self.__max_procs
+
+        self.reporting('    (up to %d concurrent cases, %d processes)' \
+                       % (self.__n_jobs, max_procs))
+
+        # cases to run, in dependency graph order
+        pending = []
+        for case in self.graph.graph_dict:
+            self.check_prepro(case)
+            if self.__running:
+                if case.reused:
+                    self.report_run(case, 0)
+                elif case.compute == 'on' and case.is_compiled != "KO":
+                    pending.append(case)
+
+        running = {}
+        n_procs_used = 0
+
+        def case_procs(case):
+            try:
+                n = int(case.n_procs)
+            except Exception:
+                n = 1
+            return max(1, min(n, max_procs))
+
+        with ThreadPoolExecutor(max_workers=self.__n_jobs) as executor:
+
+            while pending or running:
 
-                    self.__log_file.flush()
+                # start all cases whose dependencies are finished and which
+                # fit in the remaining processes budget (first fit, so that
+                # smaller cases may fill the gaps left by larger ones)
+
+                running_cases = list(running.values())
+                for case in list(pending):
+                    if len(running) >= self.__n_jobs:
+                        break
+                    ready = True
+                    for parent in self.graph.graph_dict[case]:
+                        if parent in pending or parent in running_cases:
+                            ready = False
+                            break
+                    if not ready:
+                        continue
+                    n = case_procs(case)
+                    if running and n_procs_used + n > max_procs:
+                        continue
+
+                    if self.__n_iter is not None:
+                        case.add_control_file(self.__n_iter)
+
+                    self.reporting('    - running %s ...' % case.title,
+                                   stdout=True, report=False, status=True)
+
+                    f = executor.submit(case.run, self.__resource_name)
+                    running[f] = case
+                    running_cases.append(case)
+                    pending.remove(case)
+                    n_procs_used += n
+
+                if not running:
+                    break
+
+                done, not_done = wait(list(running.keys()),
+                                      return_when=FIRST_COMPLETED)
+
+                for f in done:
+                    case = running.pop(f)
+                    n_procs_used -= case_procs(case)
+                    try:
+                        error = f.result()
+                    except Exception as e:
+                        case.is_run = "KO"
+                        error = 1
+                        self.reporting('      * error running %s: %s' \
+                                       % (case.title, str(e)))
+                    self.report_run(case, error)
 
         self.reporting('')
 
     #---------------------------------------------------------------------------
 
+    def __submit_slurm_batch(self, batch_id, header, batch_cmd, depends):
+        """
+        Write and submit a slurm batch file, depending on a list
+        of job ids (which may be empty). Return the job id.
+        """
+        slurm_batch_name = "slurm_batch_file_" + str(batch_id) + ".sh"
+        slurm_batch_file = open(slurm_batch_name, mode='w')
+
+        slurm_batch_file.write(header)
+        slurm_batch_file.write(batch_cmd)
+        slurm_batch_file.close()
+
+        # list of dependency id should be in the
+        # :id1:id2:id3 format
+        if depends:
+            list_id = ""
+            for item in depends:
+                list_id += ":" + str(item)
+            output = subprocess.check_output(['sbatch',
+                                              "--dependency=afterany" + list_id,
+                                              slurm_batch_name])
+        else:
+            output = subprocess.check_output(['sbatch', slurm_batch_name])
+
+        # find job id with regex and store it
+        msg = output.decode('utf-8').strip()
+        match = re.search('\d{8}', msg)
+        job_id = match.group()
+        self.reporting('    - %s ...' % msg)
+
+        return job_id
+
+    #---------------------------------------------------------------------------
+
     def run_slurm_batches(self):
         """
         Run all cases in slurm batch mode.
-        The number of case per batch is limited by a maximum number and a maximum
-        wall time given by smgr options. Expected times are used to compute wall
-        time.
+        Cases with the same level in the dependency graph and number of
+        processes are packed in batches (first fit decreasing), limited
+        by a maximum number of cases and a maximum wall time given by smgr
+        options. Expected times are based on the run times of previous
+        runs of each case if available, or on the expected_time attribute.
+        Each batch only depends on the batches running the cases its own
+        cases depend on, so cases start as soon as those are finished.
         """
 
         slurm_batch_template = """#!/bin/sh
 #SBATCH --ntasks={0}
-#SBATCH --time={1}:{2}:00
+#SBATCH --time={1}:{2:02d}:00
 #SBATCH --output=vnv_{3}
 #SBATCH --error=vnv_{3}
 #SBATCH --job-name=saturne_vnv_{3}
@@ -1814,199 +2281,98 @@ class Studies(object):
 
         self.reporting("  o Run all cases in slurm batch mode")
 
-        # loop on level (0 means without dependency)
-        for level in range(self.graph.max_level+1):
+        # group cases by level (0 means without dependency)
+        # and number of processes
 
-            # job id list for the current level
-            cur_job_id_list = []
+        runtimes = read_runtimes()
 
-            # loop on number of processes
-            for nproc in range(self.graph.max_proc):
+        groups = OrderedDict()
+        expected_time = {}
 
-                batch_cmd = ""
-                cur_batch_size = 0
-                batch_total_time = 0
-
-                # loop on cases of the sub graph
-                for case in self.graph.extract_sub_graph(level,nproc+1).graph_dict:
-
-                    self.check_prepro(case)
-                    if self.__running:
-                        if case.compute == 'on' and case.is_compiled != "KO":
-
-                            if self.__n_iter is not None:
-                                case.add_control_file(self.__n_iter)
-
-                            # check future submission total time and submit previous batch if not empty
-                            submit_prev = False
-                            if (cur_batch_size == 0) or (batch_total_time + \
-                               float(case.expected_time) < self.__slurm_batch_wtime):
-                                # append content of batch command with run of the case
-                                batch_cmd += case.build_run_batch()
-                                cur_batch_size += 1
-                                batch_total_time += float(case.expected_time)
-                            else:
-                                submit_prev = True
-
-                            # submit once batch size or wall time is reached
-                            if cur_batch_size >= self.__slurm_batch_size or submit_prev or \
-                               batch_total_time >= self.__slurm_batch_wtime:
-                                slurm_batch_name = "slurm_batch_file_" + \
-                                                   str(cur_batch_id) + ".sh"
-                                slurm_batch_file = open(slurm_batch_name, mode='w')
-
-                                # fill file with template
-                                hh, mm = divmod(batch_total_time, 60.)
-                                cmd = slurm_batch_template.format(nproc+1,
-                                                                  math.ceil(hh),
-                                                                  math.ceil(mm),
-                                                                  cur_batch_id)
-
-                                # add exclusive option to batch template for
-                                # computation with at least 6 processes
-                                if nproc+1 > 5:
-                                    cmd += "#SBATCH --exclusive\n"
-
-                                # add user defined options if needed
-                                if self.__slurm_batch_args:
-                                    for _p in self.__slurm_batch_args:
-                                        cmd += "#SBATCH " + _p + "\n"
-
-                                cmd += "\n"
-                                slurm_batch_file.write(cmd)
-
-                                # fill file with batch command for several cases
-                                slurm_batch_file.write(batch_cmd)
-                                slurm_batch_file.flush()
-
-                                # submit batch
-                                if level < 1:
-                                    output = subprocess.check_output(['sbatch',
-                                             slurm_batch_name])
-                                else:
-                                    # list of dependency id should be in the
-                                    # :id1:id2:id3 format
-                                    list_id = ""
-                                    for item in job_id_list:
-                                        list_id += ":" + str(item)
-                                    if len(list_id) > 0:
-                                        output = subprocess.check_output(['sbatch',
-                                                 "--dependency=afterany"
-                                                 + list_id, slurm_batch_name])
-                                    else:
-                                        # empty list can occur with existing runs in study
-                                        output = subprocess.check_output(['sbatch',
-                                                 slurm_batch_name])
-
-                                # find job id with regex and store it
-                                msg = output.decode('utf-8').strip()
-                                match = re.search('\d{8}', msg)
-                                job_id = match.group()
-                                cur_job_id_list.append(job_id)
-                                self.reporting('    - %s ...' % msg)
-
-                                batch_cmd = ""
-                                cur_batch_id += 1
-                                cur_batch_size = 0
-                                batch_total_time = 0
-                                slurm_batch_file.close()
-
-                            # complete batch info as previous one was submitted
-                            if submit_prev:
-                                # append content of batch command with run of the case
-                                batch_cmd += case.build_run_batch()
-                                cur_batch_size += 1
-                                batch_total_time += float(case.expected_time)
-
-                if cur_batch_size > 0:
-                    slurm_batch_name = "slurm_batch_file_" + \
-                                       str(cur_batch_id) + ".sh"
-                    slurm_batch_file = open(slurm_batch_name, mode='w')
-
-                    # fill file with template
-                    hh, mm = divmod(batch_total_time, 60.)
-                    cmd = slurm_batch_template.format(nproc+1, math.ceil(hh),
-                                                      math.ceil(mm), cur_batch_id)
-
-                    # add exclusive option to batch template for
-                    # computation with at least 6 processes
-                    if nproc+1 > 5:
-                        cmd += "#SBATCH --exclusive\n"
-
-                    # add user defined options if needed
-                    if self.__slurm_batch_args:
-                        for _p in self.__slurm_batch_args:
-                            cmd += "#SBATCH " + _p + "\n"
-
-                    cmd += "\n"
-                    slurm_batch_file.write(cmd)
-
-                    # fill file with batch command for several cases
-                    slurm_batch_file.write(batch_cmd)
-                    slurm_batch_file.flush()
-
-                    # submit batch
-                    if level < 1:
-                        output = subprocess.check_output(['sbatch',
-                                                          slurm_batch_name])
-                    else:
-                        # list of dependency id should be in the
-                        # :id1:id2:id3 format
-                        list_id = ""
-                        for item in job_id_list:
-                            list_id += ":" + str(item)
-                        if len(list_id) > 0:
-                            output = subprocess.check_output(['sbatch',
-                                     "--dependency=afterany"
-                                     + list_id, slurm_batch_name])
-                        else:
-                            # empty list can occur with existing runs in study
-                            output = subprocess.check_output(['sbatch',
-                                     slurm_batch_name])
+        for case in self.graph.graph_dict:
+
+            self.check_prepro(case)
+            if self.__running:
+                if case.compute == 'on' and case.is_compiled != "KO":
+
+                    if self.__n_iter is not None:
+                        case.add_control_file(self.__n_iter)
+
+                    expected_time[case] = case.get_expected_time(runtimes)
+                    key = (int(case.level), int(case.n_procs))
+                    if key not in groups:
+                        groups[key] = []
+                    groups[key].append(case)
+
+        # job id of the batch running each case
+        case_job_id = {}
+
+        for key in sorted(groups):
+
+            level, nproc = key
+
+            # first fit decreasing packing of cases in batches
+
+            batches = []
+            for case in sorted(groups[key], key=lambda c: -expected_time[c]):
+                t = expected_time[case]
+                for b in batches:
+                    if len(b[1]) < self.__slurm_batch_size and \
+                       b[0] + t <= self.__slurm_batch_wtime:
+                        b[0] += t
+                        b[1].append(case)
+                        break
+                else:
+                    batches.append([t, [case]])
+
+            for batch_total_time, batch_cases in batches:
+
+                # fill file with template
+                hh, mm = divmod(int(math.ceil(batch_total_time)), 60)
+                cmd = slurm_batch_template.format(nproc, hh, mm, cur_batch_id)
+
+                # add exclusive option to batch template for
+                # computation with at least 6 processes
+                if nproc > 5:
+                    cmd += "#SBATCH --exclusive\n"
 
-                    # find job id with regex and store it
-                    msg = output.decode('utf-8').strip()
-                    match = re.search('\d{8}', msg)
-                    job_id = match.group()
-                    cur_job_id_list.append(job_id)
-                    self.reporting('    - %s ...' % msg)
+                # add user defined options if needed
+                if self.__slurm_batch_args:
+                    for _p in self.__slurm_batch_args:
+                        cmd += "#SBATCH " + _p + "\n"
 
-                    batch_cmd = ""
-                    cur_batch_id += 1
-                    cur_batch_size = 0
-                    batch_total_time = 0
-                    slurm_batch_file.close()
+                cmd += "\n"
 
-            job_id_list = cur_job_id_list
+                # batch command for several cases, and batches they depend on
+                # (none for existing runs in study)
+
+                batch_cmd = ""
+                depends = []
+                for case in batch_cases:
+                    batch_cmd += case.build_run_batch()
+                    for parent in self.graph.graph_dict[case]:
+                        job_id = case_job_id.get(parent)
+                        if job_id and job_id not in depends:
+                            depends.append(job_id)
+
+                job_id = self.__submit_slurm_batch(cur_batch_id, cmd,
+                                                   batch_cmd, depends)
+
+                for case in batch_cases:
+                    case_job_id[case] = job_id
+                job_id_list.append(job_id)
+                cur_batch_id += 1
 
         # final submission for postprocessing, comparaison and state analysis
-        slurm_batch_name = "slurm_batch_file_" + str(cur_batch_id) + ".sh"
-        slurm_batch_file = open(slurm_batch_name, mode='w')
 
         # fill file with template
         cmd = slurm_batch_template.format(1, 0, 10, cur_batch_id)
-
         cmd += "\n"
-        slurm_batch_file.write(cmd)
 
         # fill file with batch command for state analysis
-        batch_cmd += self.build_final_batch(self.__postpro, self.__compare)
-        slurm_batch_file.write(batch_cmd)
-        slurm_batch_file.flush()
-
-        # list of dependency id should be in the
-        # :id1:id2:id3 format
-        list_id = ""
-        for item in job_id_list:
-            list_id += ":" + str(item)
-        if len(list_id) > 0:
-            output = subprocess.check_output(['sbatch',"--dependency=afterany"
-                   + list_id, slurm_batch_name])
-        else:
-            # empty list can occur with existing runs in study
-            output = subprocess.check_output(['sbatch', slurm_batch_name])
+        batch_cmd = self.build_final_batch(self.__postpro, self.__compare)
 
-        slurm_batch_file.close()
+        self.__submit_slurm_batch(cur_batch_id, cmd, batch_cmd, job_id_list)
 
         os.chdir(self.__dest)
 
@@ -2110,9 +2476,41 @@ class Studies(object):
 
         fd.write(t)
 
-        for case in self.graph.graph_dict:
+        # Per-study run state indexes
+
+        indexes = {}
+        runtimes = {}
+
+        cases = list(self.graph.graph_dict)
+
+        for case in cases:
+            if case.study not in indexes:
+                index_path = os.path.join(self.__dest, case.study,
+                                          'run_state_index.json')
+                indexes[case.study] = run_state_index(index_path)
+
+        # Query states concurrently (index entries updated by worker
+        # processes are returned, and merged in the order of cases)
+
+        def case_state_and_entry(case):
+            index = indexes[case.study]
+            state, info = case.get_state(run_timeout=run_timeout,
+                                         index=index)
+            return state, info, index.get_entry(case.run_dir)
+
+        states = map_cases(case_state_and_entry, cases, self.__n_jobs)
 
-            state, info = case.get_state(run_timeout=run_timeout)
+        for case, (state, info, entry) in zip(cases, states):
+
+            indexes[case.study].set_entry(case.run_dir, entry)
+
+            # Record run times of finished cases (used for batch packing)
+            if state in (case_state.COMPUTED, case_state.FINALIZED) \
+               and info['compute_time'] and not case.reused:
+                t = float(info['compute_time'])
+                if info['preprocess_time']:
+                    t += float(info['preprocess_time'])
+                runtimes[case.runtime_key()] = t
 
             for k in info.keys():
                 if info[k] is None:
@@ -2164,6 +2562,11 @@ class Studies(object):
         t = "</table>\n</br>\n"
         fd.write(t)
 
+        for index in indexes.values():
+            index.save()
+
+        record_runtimes(runtimes)
+
         if add_header_and_footer:
             fd.write("</body>\n")
             fd.write("</html>\n")
@@ -2225,18 +2628,37 @@ class Studies(object):
 
     #---------------------------------------------------------------------------
 
-    def compare_case_and_report(self, case, repo, dest, threshold, args,
-                                reference=None):
+    def compare_case(self, case, repo, dest, threshold, args,
+                     reference=None, messages=None):
+        """
+        Compare the results for one computation.
+        Return the list of differences, whether mesh sizes are equal,
+        and the threshold used. Messages are reported to the given list
+        if provided (in worker processes).
+        """
+        studies = self
+        if messages != None:
+            studies = messages
+
+        diff_value, m_size_eq = case.runCompare(studies,
+                                                repo, dest,
+                                                threshold, args,
+                                                reference=reference)
+
+        return diff_value, m_size_eq, case.threshold
+
+    #---------------------------------------------------------------------------
+
+    def report_compare(self, case, args, result):
         """
-        Compare the results for one computation and report
+        Report the comparison of results for one computation
+        (as returned by compare_case, or None if disabled).
         """
         case.is_compare = "done"
 
-        if not case.disabled:
-            diff_value, m_size_eq = case.runCompare(self,
-                                                    repo, dest,
-                                                    threshold, args,
-                                                    reference=reference)
+        diff_value, m_size_eq = [], True
+        if result:
+            diff_value, m_size_eq, case.threshold = result
             case.diff_value += diff_value
             case.m_size_eq = case.m_size_eq and m_size_eq
 
@@ -2258,6 +2680,53 @@ class Studies(object):
             self.reporting('    - compare %s (%s) --> NO DIFFERENCES FOUND'
                            %(case.title, s_args))
 
+    #---------------------------------------------------------------------------
+
+    def __compare_list(self, case):
+        """
+        Return the list of comparisons (repository and destination result
+        directories, threshold and arguments) for one computation.
+        """
+        compare_list = []
+
+        is_compare, nodes, repo, dest, t, args = \
+                             self.__parser.getCompare(case.node)
+        if is_compare:
+            for i in range(len(nodes)):
+                if is_compare[i]:
+                    compare_list.append((repo[i], dest[i], t[i], args[i]))
+
+        if not compare_list:
+            compare_list.append(("", "", None, None))
+
+        return compare_list
+
+    #---------------------------------------------------------------------------
+
+    def __compare_case_list(self, case):
+        """
+        Compare the results for one computation, for all its comparisons
+        (called in worker processes by compare).
+        Return a list of (result, messages) tuples.
+        """
+        # reference directory passed in studymanager command line
+        # overwrites destination in all cases (even if compare is
+        # defined by a compare markup with a non empty destination)
+        ref = None
+        if self.__ref:
+            ref = os.path.join(self.__ref, case.study)
+
+        results = []
+        for repo, dest, t, args in self.__compare_list(case):
+            messages = message_list()
+            result = None
+            if not case.disabled:
+                result = self.compare_case(case, repo, dest, t, args,
+                                           reference=ref,
+                                           messages=messages)
+            results.append((result, messages))
+
+        return results
 
     #---------------------------------------------------------------------------
 
@@ -2265,39 +2734,29 @@ class Studies(object):
         """
         Compare the results of the new computations with those from the
         Repository.
+        Cases are compared concurrently using a pool of n_jobs processes,
+        and results are reported in the order of cases.
         """
         if self.__compare:
+            cases = []
             for case in self.graph.graph_dict:
-                self.reporting('  o Compare case: ' + case.title)
-                # reference directory passed in studymanager command line
-                # overwrites destination in all cases (even if compare is
-                # defined by a compare markup with a non empty destination)
-                ref = None
-                if self.__ref:
-                    ref = os.path.join(self.__ref, case.study)
                 if case.compare == 'on' and case.is_run != "KO":
-                    is_compare, nodes, repo, dest, t, args = \
-                                         self.__parser.getCompare(case.node)
-                    if is_compare:
-                        for i in range(len(nodes)):
-                            if is_compare[i]:
-                                self.compare_case_and_report(case,
-                                                             repo[i],
-                                                             dest[i],
-                                                             t[i],
-                                                             args[i],
-                                                             reference=ref)
-                    if not is_compare or case.is_compare != "done":
-                        repo = ""
-                        dest = ""
-                        t    = None
-                        args = None
-                        self.compare_case_and_report(case,
-                                                     repo,
-                                                     dest,
-                                                     t,
-                                                     args,
-                                                     reference=ref)
+                    cases.append(case)
+
+            results = map_cases(self.__compare_case_list, cases,
+                                self.__n_jobs)
+            case_results = dict(zip(cases, results))
+
+            for case in self.graph.graph_dict:
+                self.reporting('  o Compare case: ' + case.title)
+                if case not in case_results:
+                    continue
+                compare_list = self.__compare_list(case)
+                for (repo, dest, t, args), (result, messages) \
+                    in zip(compare_list, case_results[case]):
+                    for msg in messages:
+                        self.reporting(msg)
+                    self.report_compare(case, args, result)
 
         self.reporting('')
 
@@ -2542,14 +3001,27 @@ class Studies(object):
     def plot(self):
         """
         Plot data.
+        With several jobs, figures are rendered concurrently by a pool of
+        processes, and build_reports waits for them.
         """
         if self.__plotter:
-            for l, s in self.studies:
-                if s.cases:
-                    self.reporting('  o Plot study: ' + l)
-                    self.__plotter.plot_study(l, s,
-                                              self.__dis_tex,
-                                              self.__default_fmt)
+            if self.__n_jobs > 1:
+                studies = []
+                for l, s in self.studies:
+                    if s.cases:
+                        self.reporting('  o Plot study: ' + l)
+                        studies.append((l, s))
+                self.__plotter.plot_studies(studies,
+                                            self.__dis_tex,
+                                            self.__default_fmt,
+                                            self.__n_jobs)
+            else:
+                for l, s in self.studies:
+                    if s.cases:
+                        self.reporting('  o Plot study: ' + l)
+                        self.__plotter.plot_study(l, s,
+                                                  self.__dis_tex,
+                                                  self.__default_fmt)
 
         self.reporting('')
 
@@ -2630,6 +3102,10 @@ class Studies(object):
         """
         attached_files = []
 
+        # wait for figures rendered concurrently
+        if self.__plotter:
+            self.__plotter.wait()
+
         self.reporting('  o Generation of the automatic detailed report')
 
         # figures report
@@ -88,12 +88,11 @@ class smgr_xml_init(BaseXmlInit):
         return msg
 
 
-    def _backwardCompatibilityOldVersion(self, from_vers):
+    def _backwardCompatibilityRules(self):
         """
-        Change XML in order to ensure backward compatibility for old version
+        Return the list of (version, function) backward compatibility rules.
         """
-        if from_vers <= "-1.0":
-            self.__backwardCompatibilityBefore_6_0()
+        return [(None, self.__backwardCompatibilityBefore_6_0)]
 
 
     def __backwardCompatibilityBefore_6_0(self):